@@ -0,0 +1,187 @@
+# Локальный поддельный Telegram Bot API для бенчмарков и проверок без сети.
+# Задержка ответа, инъекция 429 и выдача file_id для загруженных файлов настраиваются.
+import re
+import json
+import time
+import random
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MEDIA_METHODS = {
+    "sendPhoto": "photo",
+    "sendVideo": "video",
+    "sendAnimation": "animation",
+    "sendAudio": "audio",
+    "sendDocument": "document",
+}
+_PATH_RE = re.compile(r"^/bot(?P<token>[^/]+)/(?P<method>\w+)$")
+_FILE_PART_RE = re.compile(rb'name="([^"]+)"; filename="')
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_every: int = 0,
+                 retry_after: int = 1, blocked_every: int = 0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        # Чаты с chat_id, кратным blocked_every, «заблокировали бота» (403)
+        self.blocked_every = blocked_every
+        self.jitter = jitter
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._file_id = 0
+        self.reset_stats()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.rate_limited = 0
+            self.bytes_received = 0
+            self.files_received = 0
+            self.methods: dict[str, int] = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-bot-api")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Учёт запроса; True — ответить 429
+    def _register(self, method: str, size: int, files: int) -> bool:
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += size
+            self.files_received += files
+            self.methods[method] = self.methods.get(method, 0) + 1
+            limited = bool(self.rate_limit_every) and self.requests % self.rate_limit_every == 0
+            if limited:
+                self.rate_limited += 1
+            return limited
+
+    def _next_message_id(self) -> int:
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    def _next_file(self, field: str) -> dict:
+        with self._lock:
+            self._file_id += 1
+            file_id = self._file_id
+        media = {"file_id": f"FAKE_{field.upper()}_{file_id}", "file_unique_id": f"U{file_id}"}
+        return [dict(media, width=1280, height=720)] if field == "photo" else media
+
+    # Сообщение-ответ: новые файлы получают file_id, переданные по file_id возвращаются как есть
+    def _message(self, chat_id, field: str | None = None, value: str | None = None, uploaded: bool = False) -> dict:
+        message = {"message_id": self._next_message_id(), "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "channel"}}
+        if field:
+            if uploaded or not value:
+                message[field] = self._next_file(field)
+            else:
+                media = {"file_id": value, "file_unique_id": value}
+                message[field] = [media] if field == "photo" else media
+        return message
+
+    def handle(self, method: str, fields: dict, file_parts: list[str]) -> dict:
+        chat_id = fields.get("chat_id")
+        if self.blocked_every and method.startswith("send") and str(chat_id).lstrip("-").isdigit() \
+                and int(chat_id) % self.blocked_every == 0:
+            return {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        if method == "sendMessage":
+            return {"ok": True, "result": self._message(chat_id)}
+        if method in MEDIA_METHODS:
+            field = MEDIA_METHODS[method]
+            return {"ok": True, "result": self._message(chat_id, field, fields.get(field), field in file_parts)}
+        if method == "sendMediaGroup":
+            media = json.loads(fields.get("media") or "[]")
+            return {"ok": True, "result": [
+                self._message(chat_id, item["type"], item["media"], item["media"].startswith("attach://"))
+                for item in media
+            ]}
+        if method == "deleteMessage":
+            return {"ok": True, "result": True}
+        return {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+
+
+def _make_handler(api: FakeBotAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().strip() or b"0", 16)
+                    if not size:
+                        self.rfile.readline()
+                        break
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+                return b"".join(chunks)
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _parse_fields(self, body: bytes) -> tuple[dict, list[str]]:
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("multipart/form-data"):
+                boundary = content_type.split("boundary=", 1)[1].encode()
+                fields, files = {}, []
+                for part in body.split(b"--" + boundary):
+                    head, _, value = part.partition(b"\r\n\r\n")
+                    name = re.search(rb'name="([^"]+)"', head)
+                    if not name:
+                        continue
+                    if _FILE_PART_RE.search(head):
+                        files.append(name.group(1).decode())
+                    else:
+                        fields[name.group(1).decode()] = value[:-2].decode("utf-8", "replace")
+                return fields, files
+            return {key: values[-1] for key, values in parse_qs(body.decode("utf-8", "replace")).items()}, []
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            match = _PATH_RE.match(self.path.split("?", 1)[0])
+            body = self._read_body()
+            if not match:
+                self._send_json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                return
+            method = match.group("method")
+            fields, files = self._parse_fields(body)
+            if api.latency or api.jitter:
+                time.sleep(api.latency + random.uniform(0, api.jitter))
+            if api._register(method, len(body), len(files)):
+                self._send_json(429, {"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {api.retry_after}",
+                                      "parameters": {"retry_after": api.retry_after}})
+                return
+            payload = api.handle(method, fields, files)
+            self._send_json(200 if payload.get("ok") else payload.get("error_code", 400), payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
@@ -0,0 +1,82 @@
+import json
+import asyncio
+from typing import List
+import flet as ft
+from flet.core.local_connection import LocalConnection
+from flet.core.protocol import (
+    ClientActions, ClientMessage, Command, CommandEncoder,
+    PageCommandResponsePayload, PageCommandsBatchResponsePayload
+)
+
+
+# Подключение Flet без клиента: считает, сколько контролов и байт ушло бы в клиент
+class RecordingConnection(LocalConnection):
+    def __init__(self):
+        super().__init__()
+        self.page_url = "http://localhost"
+        self.page_name = "bench"
+        self.reset()
+
+    def reset(self):
+        self.messages = 0
+        self.bytes_sent = 0
+        self.controls_added = 0
+        self.props_set = 0
+
+    def _record(self, commands: List[Command], messages: list):
+        for command in commands:
+            if command.name == "add":
+                self.controls_added += len(command.commands) + (1 if command.values else 0)
+            elif command.name == "set":
+                self.props_set += len(command.attrs)
+        if messages:
+            payload = ClientMessage(ClientActions.PAGE_CONTROLS_BATCH, messages)
+            self.bytes_sent += len(json.dumps(payload, cls=CommandEncoder, separators=(",", ":")))
+            self.messages += 1
+
+    def send_command(self, session_id: str, command: Command):
+        # invokeMethod (clientStorage и т.п.) клиенту не отправляется — клиента нет
+        if command.name == "invokeMethod":
+            return PageCommandResponsePayload(result="", error="")
+        result, message = self._process_command(command)
+        self._record([command], [message] if message else [])
+        return PageCommandResponsePayload(result=result, error="")
+
+    def send_commands(self, session_id: str, commands: List[Command]):
+        results, messages = [], []
+        for command in commands:
+            result, message = self._process_command(command)
+            if command.name in ["add", "get"]:
+                results.append(result)
+            if message:
+                messages.append(message)
+        self._record(commands, messages)
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+
+# Хранилище клиента в памяти вместо обращения к несуществующему клиенту
+class MemoryClientStorage:
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value):
+        self._data[key] = value
+        return True
+
+    def contains_key(self, key):
+        return key in self._data
+
+
+def make_page(conn: RecordingConnection) -> ft.Page:
+    page = ft.Page(conn, "bench", loop=asyncio.new_event_loop())
+    page._Page__client_storage = MemoryClientStorage()
+    conn.sessions["bench"] = page
+    return page
+
+
+def snapshot(conn: RecordingConnection) -> dict:
+    return {"messages": conn.messages, "controls": conn.controls_added,
+            "props": conn.props_set, "bytes": conn.bytes_sent}
@@ -0,0 +1,98 @@
+# Бенчмарк таймера постов: 100k запланированных постов в куче PostTimer против задачи APScheduler на пост.
+# Меряется память очереди, время постановки и отклонение момента срабатывания от запланированного.
+# Запуск из корня проекта: python -m benchmarks.post_timer [--posts 100000] [--spread 20]
+import gc
+import time
+import argparse
+import statistics
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from utils.post_timer import PostTimer
+
+
+def _link(i: int) -> str:
+    return f"{i:010d}"
+
+
+def _bench_timer(count: int, spread: float, send_ms: float, workers: int):
+    drifts = []
+    done = threading.Event()
+    lock = threading.Lock()
+    schedule = {}
+
+    def on_fire(link_post: str):
+        fired = time.time()
+        if send_ms:
+            time.sleep(send_ms / 1000)
+        with lock:
+            drifts.append(fired - schedule[link_post])
+            if len(drifts) == count:
+                done.set()
+
+    start = time.time() + 2.0
+    for i in range(count):
+        schedule[_link(i)] = start + spread * i / count
+    gc.collect()
+    tracemalloc.start()
+    timer = PostTimer(on_fire, workers=workers)
+    timer.loaded_until = start + spread + 1
+    started = time.perf_counter()
+    for link_post, fire_at in schedule.items():
+        timer.push(fire_at, link_post)
+    push_elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+    timer.start()
+    done.wait(spread + 60)
+    timer.stop()
+    return push_elapsed, memory, drifts
+
+
+def _bench_apscheduler(count: int):
+    gc.collect()
+    tracemalloc.start()
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)
+    run_date = datetime.now() + timedelta(days=1)
+    started = time.perf_counter()
+    for i in range(count):
+        scheduler.add_job(print, 'date', run_date=run_date + timedelta(seconds=i), args=[_link(i)], id=f"post_{_link(i)}")
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+    scheduler.shutdown(wait=False)
+    return elapsed, memory
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=1000)[int(q * 10) - 1] if len(values) > 1 else (values or [0])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--spread", type=float, default=20.0, help="за сколько секунд срабатывают все посты")
+    parser.add_argument("--send-ms", type=float, default=0.0, help="имитация времени отправки поста")
+    parser.add_argument("--workers", type=int, default=4)
+    # add_job в запущенный планировщик растёт квадратично, поэтому сравнение — на меньшем объёме
+    parser.add_argument("--apscheduler-posts", type=int, default=5_000, help="0 — не сравнивать")
+    args = parser.parse_args()
+
+    push_elapsed, memory, drifts = _bench_timer(args.posts, args.spread, args.send_ms, args.workers)
+    print(f"PostTimer: {args.posts} постов, постановка {push_elapsed:.2f} с, память очереди {memory:.1f} МиБ")
+    if len(drifts) < args.posts:
+        print(f"  сработало только {len(drifts)} из {args.posts}")
+    if drifts:
+        print(f"  отклонение срабатывания: p50 {_percentile(drifts, 50) * 1000:.1f} мс, "
+              f"p99 {_percentile(drifts, 99) * 1000:.1f} мс, max {max(drifts) * 1000:.1f} мс, "
+              f"раньше срока {sum(d < 0 for d in drifts)}")
+    if args.apscheduler_posts:
+        elapsed, memory = _bench_apscheduler(args.apscheduler_posts)
+        print(f"APScheduler (задача на пост): {args.apscheduler_posts} постов, постановка {elapsed:.2f} с, "
+              f"память {memory:.1f} МиБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Бенчмарк навигации: сколько контролов и байт уходит клиенту Flet при смене маршрута.
+# Запуск из корня проекта: python -m benchmarks.route_switch [--rounds N]
+import os
+import sys
+import argparse
+import tempfile
+from pathlib import Path
+
+_tmp = tempfile.mkdtemp(prefix="bench_routes_")
+os.environ.setdefault("DB_URL", f"sqlite:///{Path(_tmp) / 'bench.db'}")
+
+from benchmarks.flet_recorder import RecordingConnection, make_page, snapshot
+from utils.database import Database
+
+ROUTES = ["/dashboard", "/profile", "/posting", "/broadcast_custom"]
+
+
+def _go(page, route):
+    page.route = route
+    page.on_route_change(route)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.check_email("bench@example.com"):
+        db.insert_user("bench", "bench@example.com", "Bench_123")
+    user = db.check_email("bench@example.com")
+
+    conn = RecordingConnection()
+    page = make_page(conn)
+    page.session.set("auth_user", user.id)
+
+    from router import Router
+    Router(page)
+    _go(page, ROUTES[0])
+
+    totals = {}
+    print(f"{'route':<20}{'msgs':>6}{'controls':>10}{'props':>8}{'bytes':>10}")
+    for _ in range(args.rounds):
+        for route in ROUTES[1:] + ROUTES[:1]:
+            conn.reset()
+            _go(page, route)
+            stats = snapshot(conn)
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+            print(f"{route:<20}{stats['messages']:>6}{stats['controls']:>10}{stats['props']:>8}{stats['bytes']:>10}")
+
+    switches = args.rounds * len(ROUTES)
+    print(f"\nСреднее на переход ({switches} переходов): "
+          f"controls={totals['controls'] / switches:.1f}, props={totals['props'] / switches:.1f}, "
+          f"bytes={totals['bytes'] / switches:.0f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
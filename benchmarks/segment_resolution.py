@@ -0,0 +1,112 @@
+# Бенчмарк выборки сегмента аудитории: set-based запрос в БД против фильтрации в Python.
+# Запуск из корня проекта: python -m benchmarks.segment_resolution [--subscribers 1000000]
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timedelta
+
+_tmp = tempfile.mkdtemp(prefix="bench_segments_")
+os.environ.setdefault("DB_URL", f"sqlite:///{Path(_tmp) / 'bench.db'}")
+
+from utils.database import Database
+from utils.segments import Segment
+
+LANGUAGES = ["ru", "en", "uk", "kk", "de", None]
+SOURCES = ["ads_vk", "ads_tg", "partner", "site", None]
+START = datetime(2023, 1, 1)
+
+
+def _populate(db: Database, user_id: int, count: int, batch_size: int = 20000):
+    rnd = random.Random(42)
+    batch, vip = [], []
+    for i in range(count):
+        chat_id = str(100_000_000 + i)
+        batch.append({"user_id": user_id, "telegram_chat_id": chat_id,
+                      "joined_at": START + timedelta(minutes=rnd.randrange(0, 60 * 24 * 730)),
+                      "language_code": rnd.choice(LANGUAGES), "source": rnd.choice(SOURCES)})
+        if rnd.random() < 0.05:
+            vip.append(chat_id)
+        if len(batch) >= batch_size:
+            db.insert_subscribers_batch(batch)
+            db.tag_subscribers(user_id, "vip", vip)
+            batch, vip = [], []
+    db.insert_subscribers_batch(batch)
+    db.tag_subscribers(user_id, "vip", vip)
+
+
+# Как было: все подписчики в память, фильтр в Python
+def _python_filter(db: Database, user_id: int, segment: Segment) -> int:
+    vip = set()
+    if segment.tags:
+        vip = {chat_id for chat_id in db.iter_segment_chat_ids(user_id, Segment(tags=segment.tags))}
+    count = 0
+    for sub in db.get_subscribers_by_user(user_id):
+        if segment.language_code and sub.language_code != segment.language_code:
+            continue
+        if segment.source and sub.source != segment.source:
+            continue
+        if segment.joined_from and sub.joined_at < segment.joined_from:
+            continue
+        if segment.joined_to and sub.joined_at >= segment.joined_to:
+            continue
+        if segment.tags and sub.telegram_chat_id not in vip:
+            continue
+        count += 1
+    return count
+
+
+def _measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=1_000_000)
+    parser.add_argument("--skip-python", action="store_true", help="не запускать фильтрацию в Python")
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.check_email("bench@example.com"):
+        db.insert_user("bench", "bench@example.com", "Bench_123")
+    user_id = db.check_email("bench@example.com").id
+    if db.count_segment(user_id) < args.subscribers:
+        started = time.perf_counter()
+        _populate(db, user_id, args.subscribers)
+        print(f"Подготовлено {args.subscribers} подписчиков за {time.perf_counter() - started:.1f} с")
+
+    segments = {
+        "все": Segment(),
+        "язык=ru": Segment(language_code="ru"),
+        "ru+ads_tg": Segment(language_code="ru", source="ads_tg"),
+        "за 30 дней": Segment(joined_from=START + timedelta(days=700)),
+        "тег vip": Segment(tags=("vip",)),
+        "vip+en+2024": Segment(language_code="en", tags=("vip",), joined_from=datetime(2024, 1, 1)),
+    }
+    print(f"{'segment':<14}{'count':>9}{'COUNT ms':>10}{'stream ms':>11}{'stream MB':>11}"
+          f"{'python ms':>11}{'python MB':>11}")
+    for name, segment in segments.items():
+        count, count_time, _ = _measure(lambda: db.count_segment(user_id, segment))
+        streamed, stream_time, stream_peak = _measure(
+            lambda: sum(1 for _ in db.iter_segment_chat_ids(user_id, segment)))
+        assert streamed == count
+        line = f"{name:<14}{count:>9}{count_time * 1000:>10.0f}{stream_time * 1000:>11.0f}{stream_peak:>11.1f}"
+        if not args.skip_python:
+            filtered, python_time, python_peak = _measure(lambda: _python_filter(db, user_id, segment))
+            assert filtered == count
+            line += f"{python_time * 1000:>11.0f}{python_peak:>11.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# Бенчмарк пути отправки против локального поддельного Bot API (сеть не нужна):
+# sendMessage, sendMediaMessage и цикл рассылки на 1k/10k/100k получателей.
+# Запуск из корня проекта: python -m benchmarks.send_path [--recipients 1000,10000] [--scenarios message,media,broadcast]
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.fake_bot_api import FakeBotAPI
+import utils.request as rq
+from utils.broadcast import broadcast
+from utils.metrics import UPLOAD_BYTES
+
+TOKEN = "123456:BENCH"
+SCENARIOS = ("message", "media", "broadcast")
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _uploaded() -> float:
+    return sum(UPLOAD_BYTES.values().values())
+
+
+# Тестовый файл для sendMediaMessage: уходит как документ, без перекодирования
+def _make_media(size_kb: int) -> str:
+    path = Path(tempfile.mkdtemp(prefix="bench_send_")) / "bench.pdf"
+    path.write_bytes(os.urandom(size_kb * 1024))
+    return str(path)
+
+
+def _run(scenario: str, recipients: int, media_path: str, no_cache: bool) -> tuple[list[float], int]:
+    latencies, ok = [], 0
+    chat_ids = range(-100_000_000_000, -100_000_000_000 + recipients)
+    if scenario == "broadcast":
+        last = [time.perf_counter()]
+
+        def on_result(chat_id, resp):
+            now = time.perf_counter()
+            latencies.append(now - last[0])
+            last[0] = now
+        result = broadcast(TOKEN, chat_ids, "Бенчмарк рассылки", on_result=on_result)
+        return latencies, result.sent
+
+    for chat_id in chat_ids:
+        if no_cache:
+            rq._file_id_cache.clear()
+        started = time.perf_counter()
+        if scenario == "message":
+            resp = rq.sendMessage(TOKEN, str(chat_id), "Бенчмарк отправки")
+        else:
+            resp = rq.sendMediaMessage(TOKEN, str(chat_id), media_path, "Бенчмарк медиа")
+        latencies.append(time.perf_counter() - started)
+        ok += bool(resp.get("ok"))
+    return latencies, ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", default="1000,10000,100000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency-ms", type=float, default=0, help="задержка ответа фейкового API")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="каждый N-й запрос получает 429")
+    parser.add_argument("--blocked-every", type=int, default=0, help="каждый N-й чат заблокировал бота (403)")
+    parser.add_argument("--media-kb", type=int, default=256)
+    parser.add_argument("--no-cache", action="store_true", help="сбрасывать кэш file_id перед каждой отправкой")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="не считать пик памяти (быстрее)")
+    args = parser.parse_args()
+    # Ошибки отдельных запросов (429) видны в колонке таблицы, лог не засоряем
+    logging.disable(logging.ERROR)
+
+    counts = [int(value) for value in args.recipients.split(",")]
+    scenarios = [value for value in args.scenarios.split(",") if value in SCENARIOS]
+    media_path = _make_media(args.media_kb)
+
+    with FakeBotAPI(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                    rate_limit_every=args.rate_limit_every, blocked_every=args.blocked_every) as api:
+        rq.BASE_TELEGRAM_API_URL = api.base_url + "/bot"
+        print(f"{'scenario':<11}{'N':>8}{'ok':>8}{'msg/s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+              f"{'peak MB':>9}{'upload B':>12}{'server B':>12}{'429':>6}")
+        for scenario in scenarios:
+            for recipients in counts:
+                rq._file_id_cache.clear()
+                api.reset_stats()
+                uploaded = _uploaded()
+                if not args.no_tracemalloc:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                latencies, ok = _run(scenario, recipients, media_path, args.no_cache)
+                elapsed = time.perf_counter() - started
+                peak = 0.0
+                if not args.no_tracemalloc:
+                    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    tracemalloc.stop()
+                print(f"{scenario:<11}{recipients:>8}{ok:>8}{recipients / elapsed:>9.0f}"
+                      f"{_percentile(latencies, 0.5) * 1000:>9.2f}{_percentile(latencies, 0.99) * 1000:>9.2f}"
+                      f"{peak:>9.1f}{_uploaded() - uploaded:>12.0f}{api.bytes_received:>12}{api.rate_limited:>6}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
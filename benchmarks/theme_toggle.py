@@ -0,0 +1,81 @@
+# Бенчмарк смены темы: сколько свойств и байт уходит клиенту Flet при переключении светлая/тёмная.
+# Запуск из корня проекта: python -m benchmarks.theme_toggle [--posts N]
+import os
+import sys
+import argparse
+import tempfile
+from pathlib import Path
+
+_tmp = tempfile.mkdtemp(prefix="bench_theme_")
+os.environ.setdefault("DB_URL", f"sqlite:///{Path(_tmp) / 'bench.db'}")
+
+import flet as ft
+from benchmarks.flet_recorder import RecordingConnection, make_page, snapshot
+from utils.database import Database
+
+
+def _go(page, route):
+    page.route = route
+    page.on_route_change(route)
+
+
+# Карточки постов — как в списке постов панели
+def _posts_column(count: int) -> ft.Column:
+    return ft.Column([
+        ft.Card(elevation=2, content=ft.Container(padding=20, border_radius=10, content=ft.Column([
+            ft.Row([ft.Icon(ft.Icons.SCHEDULE_SEND_ROUNDED, size=18),
+                    ft.Text(f"Пост #{i}", weight=ft.FontWeight.BOLD, size=16)], spacing=8),
+            ft.Text("Текст запланированного поста " * 3, opacity=0.7, size=12),
+            ft.Divider(height=10),
+            ft.Row([ft.TextButton("Перенести", icon=ft.Icons.EDIT_CALENDAR_ROUNDED),
+                    ft.TextButton("Отменить", icon=ft.Icons.CANCEL_OUTLINED)],
+                   alignment=ft.MainAxisAlignment.END)
+        ], spacing=10)))
+        for i in range(count)
+    ], scroll=ft.ScrollMode.ADAPTIVE, spacing=10, expand=True)
+
+
+def _measure(conn, toggle, times: int = 4) -> dict:
+    total = {}
+    for _ in range(times):
+        conn.reset()
+        toggle(None)
+        for key, value in snapshot(conn).items():
+            total[key] = total.get(key, 0) + value
+    return {key: value / times for key, value in total.items()}
+
+
+def _print(name, stats):
+    print(f"{name:<28}{stats['messages']:>6.1f}{stats['controls']:>10.1f}{stats['props']:>8.1f}{stats['bytes']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=200)
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.check_email("bench@example.com"):
+        db.insert_user("bench", "bench@example.com", "Bench_123")
+    user = db.check_email("bench@example.com")
+
+    conn = RecordingConnection()
+    page = make_page(conn)
+
+    from router import Router
+    router = Router(page)
+    print(f"{'screen':<28}{'msgs':>6}{'controls':>10}{'props':>8}{'bytes':>10}")
+
+    _go(page, "/")
+    login_page = router.app_routes[0][2].__self__
+    _print("/ (вход)", _measure(conn, login_page.theme_icon_button.on_click))
+
+    page.session.set("auth_user", user.id)
+    _go(page, "/dashboard")
+    router.shell.content.content = _posts_column(args.posts)
+    page.update()
+    _print(f"каркас + {args.posts} постов", _measure(conn, router.shell.theme_icon.on_click))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
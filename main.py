@@ -2,6 +2,7 @@ import flet as ft
 from router import Router
 from utils.style import *
 from utils.telegram_bot_manager import stop_all_bots
+from utils.metrics import start_metrics_server
 
 
 def main(page: ft.Page):
@@ -43,4 +44,5 @@ def main(page: ft.Page):
     Router(page)
 
 if __name__ == '__main__':
+    start_metrics_server()
     ft.app(target=main, assets_dir='assets')
\ No newline at end of file
@@ -1,22 +1,30 @@
-import os, time, shutil, mimetypes, logging
+import os, shutil, mimetypes, logging, time
+from datetime import datetime, timedelta
 from pathlib import Path
 import flet as ft
 from flet_route import Params, Basket
 from utils.style import *
 from utils.database import Database
-from utils.request import sendMessage, sendMediaMessage
+from utils.user_cache import get_user_cache
 from utils.function import p_link_generate
-from utils.telegram_bot_manager import start_bot_for_user, is_bot_running, stop_bot_by_token
+from utils.preview import request_thumbnail
+from utils.broadcast import enqueue_broadcast
+from utils.subscribers_io import import_subscribers, export_subscribers, FORMATS
+from utils.segments import Segment
+from utils.timezones import to_utc
+from utils.scheduler import wake_broadcast_dispatcher
+from utils.telegram_bot_manager import start_bot_for_user, is_bot_running
+from pages.shell import AppShell
 
 # Константы путей
 ASSETS = Path("assets")
 BROADCAST_IMAGES_DIR = ASSETS / "post_images"
 BROADCAST_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-AVATARS_DIR = ASSETS / "avatars"
 
 class BroadcastPage:
-    def __init__(self):
+    def __init__(self, shell: AppShell):
         self.db, self.logger = Database(), logging.getLogger(__name__)
+        self.shell = shell
         self.page_ref, self.user_data = None, {}
         self.selected_image_path = None
 
@@ -24,55 +32,94 @@ class BroadcastPage:
         self.snackbar = ft.SnackBar(content=ft.Text(""), open=False, duration=4000, action="OK", on_action=lambda _: setattr(self.snackbar, 'open', False))
         self.message_input = ft.TextField(label="Сообщение", multiline=True, min_lines=1, max_lines=12, filled=True, border_radius=8, expand=True)
         self.image_preview = ft.Container(visible=False)
+        self.thumbnail_slot = ft.Container(width=150, height=150, alignment=ft.alignment.center, border_radius=8)
+        self._preview_token, self._thumbnail_pending = 0, False
         self.clear_image_button = ft.IconButton(icon=ft.Icons.CLEAR, tooltip="Убрать файл", visible=False, on_click=self._clear_selected_image)
         self.pick_files_button = ft.ElevatedButton("Выбрать файл", icon=ft.Icons.UPLOAD, on_click=self._pick_file_handler)
         self.file_picker = ft.FilePicker(on_result=self._on_file_selected)
         self.delay_checkbox = ft.Checkbox(label="Задержка между отправками (1 сек)", value=True)
         self.send_button = ft.ElevatedButton("Разослать подписчикам", icon=ft.Icons.SEND_ROUNDED, on_click=self._broadcast_all_handler)
         self.status_text = ft.Text("", size=12, color="green")
+        # Сегмент аудитории: пустой фильтр — все подписчики
+        self.language_dropdown = self._segment_dropdown("Язык", 140)
+        self.source_dropdown = self._segment_dropdown("Источник", 180)
+        self.tag_dropdown = self._segment_dropdown("Тег", 180)
+        self.joined_from_input = ft.TextField(label="Подписан с", hint_text="ДД.ММ.ГГГГ", width=150, filled=True,
+                                              border_radius=8, on_blur=self._on_segment_change)
+        self.joined_to_input = ft.TextField(label="по", hint_text="ДД.ММ.ГГГГ", width=150, filled=True,
+                                            border_radius=8, on_blur=self._on_segment_change)
+        self.audience_text = ft.Text("", size=12, opacity=0.7)
+        # Импорт/экспорт подписчиков (CSV/JSONL)
+        self.import_picker = ft.FilePicker(on_result=self._on_import_selected)
+        self.export_picker = ft.FilePicker(on_result=self._on_export_selected)
+        self.import_button = ft.OutlinedButton("Импорт", icon=ft.Icons.FILE_UPLOAD_OUTLINED,
+                                               on_click=lambda _: self.import_picker.pick_files(
+                                                   allow_multiple=False, allowed_extensions=list(FORMATS)))
+        self.export_button = ft.OutlinedButton("Экспорт", icon=ft.Icons.FILE_DOWNLOAD_OUTLINED,
+                                               on_click=lambda _: self.export_picker.save_file(
+                                                   file_name="subscribers.csv", allowed_extensions=list(FORMATS)))
+        self.transfer_text = ft.Text("CSV или JSONL: колонка telegram_chat_id, необязательные joined_at, "
+                                     "language_code, source и tags (через ;)", size=12, opacity=0.7)
 
-        # Элементы навигации
-        self.logo = ft.Text('CHANNEL MANAGER', expand=True, font_family=TITLE_FONT_FAMILY, size=18, weight=ft.FontWeight.BOLD)
-        self.menu_title = ft.Text('МЕНЮ', size=13, font_family=TITLE_FONT_FAMILY, weight=ft.FontWeight.W_600, opacity=0.7)
-        self.header_title = ft.Text('Рассылка', size=20, font_family=TITLE_FONT_FAMILY, weight=ft.FontWeight.BOLD)
-        self.user_avatar = ft.Image(width=36, height=36, fit=ft.ImageFit.COVER, border_radius=18, tooltip="Ваш аватар")
-        self.display_name = ft.Text("Загрузка...", weight=ft.FontWeight.BOLD, size=14)
-
-        self.theme_icon = None
-        self.sidebar = self.header = None
         self.main_col = ft.Column(spacing=15, scroll=ft.ScrollMode.ADAPTIVE, expand=True)
-        self.main_container = ft.Container(expand=True, content=self.main_col, padding=20)
 
     # Получение данных пользователя
     def _fetch_user_data(self, user_id: int, force: bool = False):
-        if not force and self.user_data.get("id") == user_id:
-            return
         try:
-            user_row = self.db.get_user_by_id(user_id)
-            self.user_data = dict(user_row._mapping) if user_row else {}
+            self.user_data = get_user_cache(self.page_ref, self.db).get(user_id, force=force)
             if not self.user_data:
                 self.page_ref.go("/")
             else:
-                self._update_user_info_ui()
+                self.shell.set_user(self.user_data)
         except Exception as e:
             self.logger.error(f"Ошибка загрузки пользователя: {e}")
             self.page_ref.go("/")
 
-    # Обновление UI с данными пользователя
-    def _update_user_info_ui(self):
-        name = self.user_data.get('login') or self.user_data.get('email') or "User"
-        self.display_name.value = name
-        avatar_url = self.user_data.get('avatar_url')
-        path = AVATARS_DIR.parent / avatar_url if avatar_url else None
-        self.user_avatar.src = avatar_url if path and path.exists() else DEFAULT_AVATAR_FLET_PATH
-        for ctrl in [self.display_name, self.user_avatar]:
-            if ctrl.page:
-                ctrl.update()
-
     # Шаблон карточки
     def _card(self, title, content):
         return ft.Card(elevation=2, content=ft.Container(content=content, padding=20, border_radius=10))
 
+    def _segment_dropdown(self, label: str, width: int) -> ft.Dropdown:
+        return ft.Dropdown(label=label, width=width, value="all", filled=True, border_radius=8,
+                           options=[ft.dropdown.Option("all", "Все")], on_change=self._on_segment_change)
+
+    # Значения фильтров из базы (языки, источники, теги подписчиков)
+    def _load_segment_options(self):
+        options = self.db.get_segment_options(self.user_data.get("id"))
+        for dropdown, values in [(self.language_dropdown, options["languages"]),
+                                 (self.source_dropdown, options["sources"]),
+                                 (self.tag_dropdown, options["tags"])]:
+            dropdown.options = [ft.dropdown.Option("all", "Все")] + [ft.dropdown.Option(value) for value in values]
+            if dropdown.value not in ["all", *values]:
+                dropdown.value = "all"
+
+    # Начало дня в поясе пользователя, в UTC (joined_at хранится в UTC)
+    def _parse_date(self, value: str, days: int = 0):
+        if not value or not value.strip():
+            return None
+        return to_utc(datetime.strptime(value.strip(), "%d.%m.%Y") + timedelta(days=days), self.user_data.get("timezone"))
+
+    # Сегмент из фильтров; ValueError — дата в неверном формате
+    def _segment(self) -> Segment:
+        selected = lambda dropdown: None if dropdown.value in (None, "all") else dropdown.value
+        return Segment(language_code=selected(self.language_dropdown), source=selected(self.source_dropdown),
+                       joined_from=self._parse_date(self.joined_from_input.value),
+                       joined_to=self._parse_date(self.joined_to_input.value, days=1),
+                       tags=(selected(self.tag_dropdown),) if selected(self.tag_dropdown) else ())
+
+    # Размер аудитории считает БД одним COUNT по сегменту
+    def _update_audience(self, update: bool = True):
+        try:
+            count = self.db.count_segment(self.user_data.get("id"), self._segment())
+            self.audience_text.value = f"Получателей: {count}"
+        except ValueError:
+            self.audience_text.value = "Дата в формате ДД.ММ.ГГГГ"
+        if update:
+            self.audience_text.update()
+
+    def _on_segment_change(self, e):
+        self._update_audience()
+
     # Форма рассылки
     def _broadcast_form(self):
         return self._card("Сообщение для рассылки", ft.Column([
@@ -80,18 +127,22 @@ class BroadcastPage:
             self.message_input,
             ft.Row([self.pick_files_button, self.clear_image_button], spacing=10),
             self.image_preview,
+            ft.Text("Аудитория", weight=ft.FontWeight.W_600),
+            ft.Row([self.language_dropdown, self.source_dropdown, self.tag_dropdown,
+                    self.joined_from_input, self.joined_to_input], spacing=10, wrap=True),
+            self.audience_text,
             self.delay_checkbox,
             self.send_button,
             self.status_text
         ], spacing=15))
 
-    # Обновление стилей
-    def _update_styles(self, page: ft.Page):
-        colors = get_colors(page.theme_mode or "light")
-        page.bgcolor = self.main_container.bgcolor = colors["primary_bg"]
-        self.header.bgcolor = self.sidebar.bgcolor = colors["secondary_bg"]
-        self.sidebar.border = ft.border.only(right=ft.BorderSide(1, colors["divider_color"]))
-        self.theme_icon.style = ft.ButtonStyle(color={"": colors["icon_color"], "selected": colors["accent"]})
+    # Импорт и экспорт подписчиков
+    def _subscribers_form(self):
+        return self._card("Подписчики", ft.Column([
+            ft.Text("Подписчики", weight=ft.FontWeight.BOLD, size=18),
+            ft.Row([self.import_button, self.export_button], spacing=10),
+            self.transfer_text
+        ], spacing=15))
 
     # Показ сообщений
     def _show_message(self, msg: str, is_error: bool = True):
@@ -122,13 +173,16 @@ class BroadcastPage:
             size_str = self._format_file_size(os.path.getsize(self.selected_image_path))
 
             is_web = getattr(self.page_ref, 'web', False)
+            self._thumbnail_pending = False
             preview = ft.Column(horizontal_alignment=ft.CrossAxisAlignment.CENTER)
 
             if mime_type:
                 if mime_type.startswith("image"):
-                    preview.controls.append(ft.Image(src=str(self.selected_image_path), width=150, height=150, fit=ft.ImageFit.CONTAIN, border_radius=8))
+                    preview.controls.append(self._thumbnail_placeholder())
                 elif mime_type.startswith("video") and is_web:
                     preview.controls.append(ft.Video(src=str(self.selected_image_path), width=220, height=180, autoplay=False, controls=True, border_radius=8))
+                elif mime_type.startswith("video"):
+                    preview.controls.append(self._thumbnail_placeholder(is_video=True))
                 elif mime_type.startswith("audio") and is_web:
                     preview.controls.append(ft.Audio(src=str(self.selected_image_path), autoplay=False, volume=1.0))
                 else:
@@ -143,12 +197,40 @@ class BroadcastPage:
             self.clear_image_button.visible = True
             self.image_preview.update()
             self.clear_image_button.update()
+            if self._thumbnail_pending:
+                self._load_thumbnail(self.selected_image_path)
 
         except Exception as ex:
             self._show_message(f"Ошибка загрузки: {ex}")
 
+    # Заглушка превью, пока миниатюра строится в фоне
+    def _thumbnail_placeholder(self, is_video: bool = False):
+        self.thumbnail_slot.content = ft.ProgressRing(width=24, height=24, stroke_width=2)
+        self.thumbnail_slot.data = is_video
+        self._thumbnail_pending = True
+        return self.thumbnail_slot
+
+    # Фоновая генерация миниатюры (кэш по хешу содержимого)
+    def _load_thumbnail(self, file_path: Path):
+        self._preview_token += 1
+        token = self._preview_token
+
+        def on_ready(thumb):
+            if token != self._preview_token:
+                return
+            is_video = bool(self.thumbnail_slot.data)
+            if thumb:
+                image = ft.Image(src=str(thumb), width=150, height=150, fit=ft.ImageFit.CONTAIN, border_radius=8)
+                self.thumbnail_slot.content = ft.Stack([image, ft.Icon(ft.Icons.PLAY_CIRCLE_OUTLINE, size=40, opacity=0.8)], alignment=ft.alignment.center) if is_video else image
+            else:
+                self.thumbnail_slot.content = ft.Icon(ft.Icons.MOVIE_OUTLINED if is_video else ft.Icons.IMAGE_OUTLINED, size=40, opacity=0.6)
+            self.thumbnail_slot.update()
+
+        request_thumbnail(file_path, on_ready)
+
     # Очистка выбранного файла
     def _clear_selected_image(self, e):
+        self._preview_token += 1
         self.image_preview.content = None
         self.image_preview.visible = self.clear_image_button.visible = False
         self.selected_image_path = None
@@ -168,34 +250,83 @@ class BroadcastPage:
         if not is_bot_running(token):
             start_bot_for_user(token, user_id)
 
-        subscribers = self.db.get_subscribers_by_user(user_id)
-        if not subscribers:
-            self._show_message("У вашего бота пока нет подписчиков.")
+        try:
+            segment = self._segment()
+        except ValueError:
+            self._show_message("Дата подписки должна быть в формате ДД.ММ.ГГГГ.")
+            return
+        total = self.db.count_segment(user_id, segment)
+        if not total:
+            self._show_message("У вашего бота пока нет подписчиков." if segment.is_all()
+                               else "В выбранном сегменте нет подписчиков.")
             return
 
-        count = 0
-        for sub in subscribers:
-            chat_id = str(sub.telegram_chat_id)
-            try:
-                resp = sendMediaMessage(token, chat_id, str(self.selected_image_path), msg) if self.selected_image_path else sendMessage(token, chat_id, msg)
-                if resp.get("ok"): count += 1
-            except Exception as ex:
-                self.logger.warning(f"Ошибка отправки {chat_id}: {ex}")
-            if self.delay_checkbox.value:
-                time.sleep(1)
-
-        self._show_message(f"Отправлено: {count} из {len(subscribers)}", is_error=False)
+        # Рассылка ставится заданием в БД: порции отправляют все запущенные экземпляры приложения
+        job_id = enqueue_broadcast(self.db, user_id, msg, media_path=self.selected_image_path, segment=segment,
+                                   delay=1 if self.delay_checkbox.value else 0)
+        if not job_id:
+            self._show_message("Не удалось создать рассылку.")
+            return
+        wake_broadcast_dispatcher()
+        self._show_message(f"Рассылка запущена: {total} получателей", is_error=False)
         self._clear_form()
+        self.page_ref.run_thread(self._watch_broadcast, job_id)
+
+    # Прогресс рассылки по сумме счётчиков её порций
+    def _watch_broadcast(self, job_id: int, interval: float = 2.0):
+        while True:
+            progress = self.db.get_broadcast_progress(job_id)
+            if not progress:
+                return
+            dead_text = f" (недоступны: {progress['dead']})" if progress["dead"] else ""
+            prefix = "Рассылка завершена. " if progress["done"] else ""
+            self.status_text.value = f"{prefix}Отправлено: {progress['sent']} из {progress['total']}{dead_text}"
+            try:
+                self.status_text.update()
+            except Exception:
+                # Страница закрыта — рассылка продолжается без отображения прогресса
+                return
+            if progress["done"]:
+                return
+            time.sleep(interval)
+
+    def _set_transfer_busy(self, busy: bool, text: str):
+        self.import_button.disabled = self.export_button.disabled = busy
+        self.transfer_text.value = text
+        for ctrl in [self.import_button, self.export_button, self.transfer_text]:
+            ctrl.update()
 
-    # Обработчик выхода
-    def _logout_handler(self, e=None):
-        token = self.user_data.get("user_telegram_token")
-        if token and is_bot_running(token):
-            stop_bot_by_token(token)
-        for key in ['auth_user', 'user_email']:
-            if self.page_ref.session.contains_key(key):
-                self.page_ref.session.remove(key)
-        self.page_ref.go("/")
+    def _on_import_selected(self, e: ft.FilePickerResultEvent):
+        user_id = self.user_data.get("id")
+        if not e.files or not user_id:
+            return
+        self._set_transfer_busy(True, "Импорт...")
+        try:
+            result = import_subscribers(self.db, user_id, e.files[0].path, on_progress=lambda rows, new: (
+                setattr(self.transfer_text, "value", f"Импорт... строк: {rows}, новых: {new}"), self.transfer_text.update()))
+            self._set_transfer_busy(False, f"Импортировано строк: {result.rows}, новых: {result.inserted}, "
+                                           f"дубликатов: {result.skipped}, ошибочных: {result.invalid} "
+                                           f"({result.rows_per_sec:.0f} строк/с)")
+            self._load_segment_options()
+            self._update_audience(update=False)
+            self.page_ref.update()
+        except Exception as ex:
+            self.logger.error(f"Ошибка импорта подписчиков: {ex}")
+            self._set_transfer_busy(False, "")
+            self._show_message(f"Ошибка импорта: {ex}")
+
+    def _on_export_selected(self, e: ft.FilePickerResultEvent):
+        user_id = self.user_data.get("id")
+        if not e.path or not user_id:
+            return
+        self._set_transfer_busy(True, "Экспорт...")
+        try:
+            result = export_subscribers(self.db, user_id, e.path)
+            self._set_transfer_busy(False, f"Выгружено подписчиков: {result.rows} в {Path(e.path).name}")
+        except Exception as ex:
+            self.logger.error(f"Ошибка экспорта подписчиков: {ex}")
+            self._set_transfer_busy(False, "")
+            self._show_message(f"Ошибка экспорта: {ex}")
 
     # Форматирование размера файла
     def _format_file_size(self, size_bytes: int) -> str:
@@ -203,6 +334,7 @@ class BroadcastPage:
 
     # Очистка формы
     def _clear_form(self):
+        self._preview_token += 1
         self.message_input.value = ""
         self.selected_image_path = None
         self.image_preview.content = None
@@ -219,65 +351,18 @@ class BroadcastPage:
             page.go("/")
             return ft.View()
 
-        self._fetch_user_data(uid, force=True)
+        self._fetch_user_data(uid)
         token = self.user_data.get("user_telegram_token")
         if token and not is_bot_running(token):
             start_bot_for_user(token, uid)
 
-        page.title = "Панель управления - Рассылка"
-        page.fonts = {TITLE_FONT_FAMILY: FONT_OFONT_PATH}
-        page.font_family = DEFAULT_FONT_FAMILY
-        page.theme_mode = page.client_storage.get("theme_mode") or "light"
-
-        def toggle_theme(e=None):
-            page.theme_mode = "dark" if page.theme_mode == "light" else "light"
-            page.client_storage.set("theme_mode", page.theme_mode)
-            self.theme_icon.selected = (page.theme_mode == "dark")
-            self._update_styles(page)
-            page.update()
-
-        self.theme_icon = ft.IconButton(icon=ft.Icons.LIGHT_MODE, selected_icon=ft.Icons.DARK_MODE, selected=(page.theme_mode == "dark"), icon_size=20, tooltip="Сменить тему", on_click=toggle_theme)
-
-        def menu_btn(icon, label, route):
-            return ft.TextButton(content=ft.Row([ft.Icon(icon, size=18), ft.Text(label)], spacing=10), on_click=lambda _: page.go(route))
-
-        self.sidebar = ft.Container(width=260, content=ft.Column([
-            ft.Container(ft.Row([ft.Image(src=LOGO_FLET_PATH, width=30, height=30), self.logo]), padding=20),
-            ft.Divider(height=1),
-            ft.Container(self.menu_title, padding=ft.padding.only(left=20, top=20, bottom=10)),
-            ft.Column([
-                menu_btn(ft.Icons.SETTINGS_OUTLINED, "Настройки TG", "/dashboard"),
-                menu_btn(ft.Icons.ACCOUNT_CIRCLE_OUTLINED, "Профиль", "/profile"),
-                menu_btn(ft.Icons.POST_ADD_ROUNDED, "Постинг", "/posting"),
-                menu_btn(ft.Icons.PEOPLE_ALT_ROUNDED, "Рассылка", "/broadcast_custom")
-            ], spacing=5),
-            ft.Divider(height=1),
-            ft.Container(self.theme_icon, padding=10)
-        ]))
-
-        user_popup = ft.PopupMenuButton(
-            content=ft.Row([self.user_avatar, self.display_name, ft.Icon(ft.Icons.KEYBOARD_ARROW_DOWN_ROUNDED, size=16, opacity=0.7)], spacing=8),
-            items=[
-                ft.PopupMenuItem(text="Профиль", icon=ft.Icons.ACCOUNT_CIRCLE_OUTLINED, on_click=lambda _: page.go('/profile')),
-                ft.PopupMenuItem(height=1),
-                ft.PopupMenuItem(text="Выйти", icon=ft.Icons.LOGOUT_ROUNDED, on_click=self._logout_handler)
-            ]
-        )
-
-        self.header = ft.Container(content=ft.Row([self.header_title, user_popup], alignment=ft.MainAxisAlignment.SPACE_BETWEEN), padding=ft.padding.symmetric(horizontal=25, vertical=15))
-
+        self._load_segment_options()
+        self._update_audience(update=False)
         self.main_col.controls.clear()
-        self.main_col.controls.append(self._broadcast_form())
+        self.main_col.controls.extend([self._broadcast_form(), self._subscribers_form()])
 
-        for el in [self.file_picker, self.snackbar]:
+        for el in [self.file_picker, self.import_picker, self.export_picker, self.snackbar]:
             if el not in page.overlay:
                 page.overlay.append(el)
 
-        self._update_styles(page)
-
-        return ft.View(route="/broadcast_custom", padding=0, controls=[
-            ft.Row([
-                self.sidebar,
-                ft.Column([self.header, ft.Divider(height=1), self.main_container], expand=True, spacing=0)
-            ], expand=True)
-        ])
+        return self.shell.show(page, "/broadcast_custom", "Панель управления - Рассылка", "Рассылка", self.main_col)
@@ -0,0 +1,84 @@
+import logging
+import flet as ft
+from flet_route import Params, Basket
+from utils.database import Database
+from utils.user_cache import get_user_cache
+from utils.metrics import REGISTRY, Histogram, METRICS_HOST, METRICS_PORT
+from pages.shell import AppShell
+
+logger = logging.getLogger(__name__)
+
+
+# Значение метрики для таблицы: счётчик/gauge как есть, гистограмма — количество, среднее и p95
+def _format_value(metric, key) -> str:
+    if isinstance(metric, Histogram):
+        total_sum, count = metric.values()[key]
+        labels = dict(zip(metric.labelnames, key))
+        p95 = metric.quantile(0.95, **labels)
+        p95_text = "> " + f"{metric.buckets[-1]:g}" if p95 == float("inf") else f"≤ {p95:g}"
+        return f"n={count}, сред. {total_sum / count:.3f} с, p95 {p95_text} с"
+    return f"{metric.values()[key]:g}"
+
+
+class DiagnosticsPage:
+    def __init__(self, shell: AppShell):
+        self.db = Database()
+        self.shell = shell
+        self.page_ref = None
+        self.user_data = {}
+
+        self.endpoint_text = ft.Text(size=12, opacity=0.7)
+        self.refresh_button = ft.IconButton(icon=ft.Icons.REFRESH_ROUNDED, tooltip="Обновить",
+                                            on_click=self._refresh_handler)
+        self.table = ft.DataTable(columns=[
+            ft.DataColumn(ft.Text("Метрика")),
+            ft.DataColumn(ft.Text("Метки")),
+            ft.DataColumn(ft.Text("Значение")),
+        ], column_spacing=30)
+        self.main_col = ft.Column([
+            ft.Row([ft.Text("Метрики отправки", weight=ft.FontWeight.BOLD, size=18), self.refresh_button],
+                   alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            self.endpoint_text,
+            ft.Row([self.table], scroll=ft.ScrollMode.ADAPTIVE),
+        ], spacing=15, scroll=ft.ScrollMode.ADAPTIVE, expand=True)
+
+    # Загрузка данных пользователя
+    def _fetch_user_data(self, user_id: int, force=False):
+        try:
+            self.user_data = get_user_cache(self.page_ref, self.db).get(user_id, force=force)
+            if not self.user_data:
+                self.page_ref.go('/')
+            else:
+                self.shell.set_user(self.user_data)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки данных пользователя: {e}")
+            self.page_ref.go('/')
+
+    # Снимок реестра метрик в строки таблицы
+    def _fill_table(self):
+        rows = []
+        for metric in REGISTRY.metrics():
+            for key in sorted(metric.values()):
+                labels = ", ".join(f"{name}={value}" for name, value in zip(metric.labelnames, key))
+                rows.append(ft.DataRow(cells=[
+                    ft.DataCell(ft.Text(metric.name, tooltip=metric.documentation)),
+                    ft.DataCell(ft.Text(labels or "—")),
+                    ft.DataCell(ft.Text(_format_value(metric, key))),
+                ]))
+        self.table.rows = rows
+        self.endpoint_text.value = (f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics" if METRICS_PORT
+                                    else "HTTP /metrics выключен (задайте METRICS_PORT)")
+
+    def _refresh_handler(self, e):
+        self._fill_table()
+        self.page_ref.update()
+
+    def view(self, page: ft.Page, params: Params, basket: Basket) -> ft.View:
+        self.page_ref = page
+        uid = page.session.get("auth_user")
+        if not uid:
+            page.go("/")
+            return ft.View()
+        self._fetch_user_data(uid)
+        self._fill_table()
+        return self.shell.show(page, "/diagnostics", "Панель управления - Диагностика", "Диагностика", self.main_col)
@@ -2,6 +2,7 @@ import flet as ft
 from flet_route import Params, Basket
 from utils.style import *
 from utils.database import Database
+from utils.user_cache import get_user_cache
 
 class LoginPage:
     # Инициализация компонентов
@@ -37,43 +38,40 @@ class LoginPage:
         self.subtitle_text = None
         self.theme_icon_button = None
 
-    # Обновление стилей в зависимости от темы
-    def _update_styles(self, page: ft.Page):
-        colors = get_colors(page.theme_mode)
+    # Стили на ролях темы: при смене темы их пересчитывает клиент, сервер ничего не отправляет
+    def _apply_styles(self):
 
         for field in [self.email_input, self.password_input]:
-            field.bgcolor = colors["input_bg"]
-            field.color = colors["primary_text"]
+            field.bgcolor = ft.Colors.SECONDARY_CONTAINER
+            field.color = ft.Colors.ON_SURFACE
             field.border_radius = 10
-            field.label_style = ft.TextStyle(color=colors["secondary_text"])
-            field.hint_style = ft.TextStyle(color=colors["secondary_text"])
-            field.prefix_style = ft.TextStyle(color=colors["secondary_text"])
+            field.label_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
+            field.hint_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
+            field.prefix_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
 
-        self.message_text.color = colors["error"]
+        self.message_text.color = ft.Colors.ERROR
 
         if self.login_button:
-            self.login_button.bgcolor = colors["accent"]
+            self.login_button.bgcolor = ft.Colors.PRIMARY
             if isinstance(self.login_button.content, ft.Text):
-                self.login_button.content.color = colors["button_text"]
+                self.login_button.content.color = ft.Colors.ON_PRIMARY
 
         if self.signup_link and isinstance(self.signup_link.content, ft.Text):
-            self.signup_link.content.color = colors["accent"]
+            self.signup_link.content.color = ft.Colors.PRIMARY
 
         if self.reset_link and isinstance(self.reset_link.content, ft.Text):
-            self.reset_link.content.color = colors["accent"]
+            self.reset_link.content.color = ft.Colors.PRIMARY
 
         if self.title_text:
-            self.title_text.color = colors["primary_text"]
+            self.title_text.color = ft.Colors.ON_SURFACE
         if self.subtitle_text:
-            self.subtitle_text.color = colors["secondary_text"]
+            self.subtitle_text.color = ft.Colors.ON_SURFACE_VARIANT
 
         if self.theme_icon_button:
             self.theme_icon_button.style = ft.ButtonStyle(
-                color={"": colors["secondary_text"], "selected": colors["accent"]}
+                color={"": ft.Colors.ON_SURFACE_VARIANT, "selected": ft.Colors.PRIMARY}
             )
 
-        page.bgcolor = colors["primary_bg"]
-
     # Показ ошибки/успеха
     def _show_message(self, message: str, page: ft.Page):
         self.message_text.value = message
@@ -95,14 +93,13 @@ class LoginPage:
         page.title = "Страница авторизации"
         page.fonts = {TITLE_FONT_FAMILY: "fonts/ofont.ru_Uncage.ttf"}
         page.font_family = DEFAULT_FONT_FAMILY
-        page.theme_mode = page.client_storage.get("theme_mode") or "light"
+        apply_theme(page)
 
         # Смена темы
         def toggle_theme(e):
             page.theme_mode = "dark" if page.theme_mode == "light" else "light"
             page.client_storage.set("theme_mode", page.theme_mode)
             self.theme_icon_button.selected = (page.theme_mode == "dark")
-            self._update_styles(page)
             page.update()
 
         self.theme_icon_button = ft.IconButton(
@@ -135,6 +132,7 @@ class LoginPage:
             self.login_button.disabled = False
 
             if user:
+                get_user_cache(page, self.db).put(user)
                 page.session.set('auth_user', user.id)
                 page.session.set('user_email', user.email)
                 page.go('/dashboard')
@@ -175,7 +173,7 @@ class LoginPage:
         )
         self.subtitle_text = ft.Text("Войдите, чтобы продолжить", size=16)
 
-        self._update_styles(page)
+        self._apply_styles()
 
         # Макет формы
         login_form_content = ft.Column(
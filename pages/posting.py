@@ -1,44 +1,56 @@
-import mimetypes, os, shutil, logging
+import mimetypes, os, shutil, logging, threading, time
 from pathlib import Path
 from datetime import datetime
 import flet as ft
 from flet_route import Params, Basket
-from apscheduler.schedulers.background import BackgroundScheduler
 from utils.style import *
 from utils.database import Database
-from utils.telegram_bot_manager import stop_bot_by_token, is_bot_running
+from utils.user_cache import get_user_cache
 from utils.validation import Validation
-from utils.request import sendMessage, sendMediaMessage
+from utils.request import check_media_group, detect_media_type, MEDIA_GROUP_MAX
+from utils.scheduler import get_scheduler, schedule_post, create_post_rule
+from utils.request import send_post
+from utils.channels import MAIN_CHANNEL, get_targets, fan_out_post, summarize_results
+from utils.recurrence import RULE_CRON, RULE_INTERVAL
+from utils.timezones import to_utc, utc_now
+from utils.media_processing import prepare_media
 from utils.function import p_link_generate
+from utils.preview import request_thumbnail
+from utils.content_plan import import_content_plan, FORMATS as PLAN_FORMATS
+from pages.shell import AppShell
 
 # Константы
 ASSETS = "assets"
 POST_IMAGES_DIR = Path(ASSETS) / "post_images"
-AVATARS_DIR = Path(ASSETS) / "avatars"
 POST_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 # Логирование
 logger = logging.getLogger(__name__)
+
+REPEAT_OPTIONS = {
+    "none": "Без повтора",
+    "daily": "Каждый день",
+    "weekly": "Каждую неделю",
+    "hours": "Каждые N часов",
+    "cron": "Выражение cron",
+}
+CRON_WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
 if not logging.getLogger().hasHandlers():
     logging.basicConfig(level=logging.INFO)
 
 
 class PostingPage:
-    def __init__(self):
+    def __init__(self, shell: AppShell):
         self.db = Database()
+        self.shell = shell
         self.validation = Validation()
-        self.scheduler = BackgroundScheduler(timezone='Europe/Moscow')
-        if not self.scheduler.running:
-            try:
-                self.scheduler.start()
-            except Exception as e:
-                print("Ошибка запуска планировщика")
+        self.scheduler = get_scheduler()
 
         self.page_ref = None
         self.user_data = {}
 
         # Выбор файла и даты
-        self.selected_image_path_on_disk = None
+        self.selected_files: list[Path] = []
         self.selected_image_original_name = None
         self.selected_date = self.selected_time = None
 
@@ -50,8 +62,20 @@ class PostingPage:
         self.pick_files_button = ft.ElevatedButton("Выбрать файл", icon=ft.Icons.UPLOAD,
                                                    on_click=self._pick_files_handler)
         self.file_preview = ft.Container(visible=False)
+        self.thumbnail_slot = ft.Container(width=150, height=150, alignment=ft.alignment.center, border_radius=8)
+        self._preview_token = 0
+        self._thumbnail_pending = False
         self.file_picker = ft.FilePicker(on_result=self._on_pick_files_result)
 
+        # Импорт контент-плана (CSV/JSONL/JSON)
+        self.import_plan_button = ft.OutlinedButton("Импорт контент-плана", icon=ft.Icons.UPLOAD_FILE_ROUNDED,
+                                                    on_click=self._pick_plan_handler)
+        self.plan_picker = ft.FilePicker(on_result=self._on_pick_plan_result)
+
+        # Каналы публикации: основной и дополнительные из настроек Telegram
+        self.channel_checkboxes: dict[int, ft.Checkbox] = {}
+        self.channels_row = ft.Row(wrap=True, spacing=5, visible=False)
+
         # Отложенный постинг
         self.scheduled_post_checkbox = ft.Checkbox(label="Отложенный постинг", on_change=self._toggle_scheduled_fields)
         self.date_display_field = ft.TextField(label="Дата", read_only=True, filled=True, border_radius=8, width=130)
@@ -68,57 +92,46 @@ class PostingPage:
              self.time_display_field, self.pick_time_button],
             visible=False, spacing=5)
 
+        # Повтор: выбранные дата и время — первое срабатывание
+        self.repeat_dropdown = ft.Dropdown(label="Повтор", value="none", width=220, filled=True, border_radius=8,
+                                           options=[ft.dropdown.Option(key, text) for key, text in REPEAT_OPTIONS.items()],
+                                           on_change=self._on_repeat_change)
+        self.repeat_value_input = ft.TextField(filled=True, border_radius=8, expand=True, visible=False)
+        self.repeat_row = ft.Row([self.repeat_dropdown, self.repeat_value_input], spacing=10, visible=False)
+
         # Кнопки отправки
         self.submit_now_button = ft.ElevatedButton("Отправить сейчас", icon=ft.Icons.SEND_ROUNDED,
                                                    on_click=self._submit_now_handler)
         self.submit_scheduled_button = ft.ElevatedButton("Запланировать", icon=ft.Icons.SCHEDULE_SEND_ROUNDED,
                                                          on_click=self._submit_scheduled_handler, visible=False)
 
+        # Прогресс загрузки
+        self.upload_progress = ft.ProgressBar(value=0, expand=True)
+        self.upload_status = ft.Text("", size=11)
+        self.cancel_upload_button = ft.TextButton("Отменить", icon=ft.Icons.CANCEL_OUTLINED, on_click=self._cancel_upload)
+        self.upload_row = ft.Row([self.upload_progress, self.upload_status, self.cancel_upload_button],
+                                 spacing=10, visible=False)
+        self._cancel_upload_event = None
+        self._last_progress = (0.0, 0)
+
         # Дизайн
         self.snackbar = ft.SnackBar(content=ft.Text(""), open=False, duration=4000, action="OK",
                                     on_action=lambda _: setattr(self.snackbar, 'open', False))
 
-        self.sidebar = self.header = None
-        self.logo_text = ft.Text('CHANNEL MANAGER', expand=True, font_family=TITLE_FONT_FAMILY,
-                                 size=18, weight=ft.FontWeight.BOLD)
-        self.menu_title = ft.Text('МЕНЮ', size=13, font_family=TITLE_FONT_FAMILY,
-                                  weight=ft.FontWeight.W_600, opacity=0.7)
-        self.header_title = ft.Text('Создание Поста', size=20, font_family=TITLE_FONT_FAMILY,
-                                    weight=ft.FontWeight.BOLD)
-        self.display_name = ft.Text("Загрузка...", weight=ft.FontWeight.BOLD, size=14)
-        self.user_avatar = ft.Image(width=36, height=36, fit=ft.ImageFit.COVER,
-                                    border_radius=18, tooltip="Ваш аватар")
-        self.theme_icon = None
-
         self.main_col = ft.Column(scroll=ft.ScrollMode.ADAPTIVE, spacing=0, expand=True)
-        self.main_container = ft.Container(expand=True, content=self.main_col, padding=20)
 
     # Загрузка данных пользователя
     def _fetch_user_data(self, user_id: int, force=False):
-        if not force and self.user_data.get('id') == user_id:
-            return
         try:
-            user_row = self.db.get_user_by_id(user_id)
-            self.user_data = dict(user_row._mapping) if user_row else {}
+            self.user_data = get_user_cache(self.page_ref, self.db).get(user_id, force=force)
             if not self.user_data:
                 self.page_ref.go('/')
             else:
-                self._update_user_ui()
+                self.shell.set_user(self.user_data)
         except Exception as e:
             logger.error(f"Ошибка загрузки данных пользователя: {e}")
             self.page_ref.go('/')
 
-    # Обновление UI пользователя
-    def _update_user_ui(self):
-        name = self.user_data.get('login') or self.user_data.get('email') or "User"
-        self.display_name.value = name
-        avatar_url = self.user_data.get('avatar_url')
-        path = AVATARS_DIR.parent / avatar_url if avatar_url else None
-        self.user_avatar.src = avatar_url if path and path.exists() else DEFAULT_AVATAR_FLET_PATH
-        for ctrl in [self.display_name, self.user_avatar]:
-            if ctrl.page:
-                ctrl.update()
-
     # Показ сообщения
     def _show_message(self, msg: str, is_error: bool = True):
         colors = get_colors(self.page_ref.theme_mode or "light")
@@ -129,25 +142,78 @@ class PostingPage:
         self.snackbar.open = True
         self.page_ref.update()
     # Обработка выбора файла
-    def _pick_files_handler(self, e): self.file_picker.pick_files(allow_multiple=False)
+    def _pick_files_handler(self, e): self.file_picker.pick_files(allow_multiple=True)
 
     def _on_pick_files_result(self, e):
         if not e.files:
             return
+        if len(e.files) > MEDIA_GROUP_MAX:
+            self._show_message(f"В альбом можно добавить не больше {MEDIA_GROUP_MAX} файлов.")
+            return
 
-        file_path = Path(e.files[0].path)
-        self.selected_image_original_name = file_path.name
-        unique = p_link_generate(8)
-        new_name = f"{file_path.stem}_{unique}{file_path.suffix}"
-        self.selected_image_path_on_disk = POST_IMAGES_DIR / new_name
+        try:
+            copied = []
+            for f in e.files:
+                file_path = Path(f.path)
+                new_name = f"{file_path.stem}_{p_link_generate(8)}{file_path.suffix}"
+                shutil.copy(str(file_path), str(POST_IMAGES_DIR / new_name))
+                copied.append(POST_IMAGES_DIR / new_name)
+        except Exception as ex:
+            self._show_message(f"Ошибка загрузки файла: {ex}")
+            return
 
+        self._preview_token += 1
+        self.selected_files = copied
+        self.selected_image_original_name = Path(e.files[0].path).name
+        if len(copied) > 1:
+            self._show_album_preview(copied)
+        else:
+            self._show_single_preview(Path(e.files[0].path), copied[0])
+
+    # Превью альбома: сетка миниатюр
+    def _show_album_preview(self, files: list[Path]):
+        token = self._preview_token
+        tiles, callbacks = [], []
+        for path in files:
+            slot = ft.Container(content=ft.ProgressRing(width=20, height=20, stroke_width=2),
+                                width=90, height=90, alignment=ft.alignment.center, border_radius=8,
+                                tooltip=path.name)
+            tiles.append(slot)
+
+            def on_ready(thumb, slot=slot, path=path):
+                if token != self._preview_token:
+                    return
+                if thumb:
+                    slot.content = ft.Image(src=str(thumb), width=90, height=90, fit=ft.ImageFit.COVER, border_radius=8)
+                else:
+                    mime_type, _ = mimetypes.guess_type(path)
+                    icon = ft.Icons.MOVIE_OUTLINED if mime_type and mime_type.startswith("video") else ft.Icons.INSERT_DRIVE_FILE
+                    slot.content = ft.Icon(icon, size=32, opacity=0.6)
+                slot.update()
+
+            callbacks.append((path, on_ready))
+
+        total = sum(os.path.getsize(path) for path in files)
+        self.file_preview.content = ft.Column([
+            ft.Row(tiles, wrap=True, spacing=8, run_spacing=8),
+            ft.Text(f"Альбом: {len(files)} файлов ({self._format_file_size(total)})", size=11)
+        ])
+        self.file_preview.visible = True
+        self.file_preview.update()
+        self.clear_image_button.visible = True
+        self.clear_image_button.update()
+        for path, on_ready in callbacks:
+            request_thumbnail(path, on_ready)
+
+    # Превью одного файла
+    def _show_single_preview(self, file_path: Path, disk_path: Path):
         try:
-            shutil.copy(str(file_path), str(self.selected_image_path_on_disk))
             mime_type, _ = mimetypes.guess_type(file_path)
-            file_size = os.path.getsize(self.selected_image_path_on_disk)
+            file_size = os.path.getsize(disk_path)
             size_str = self._format_file_size(file_size)
 
             # Формируем preview
+            self._thumbnail_pending = False
             self.file_preview.content = None
             self.file_preview.visible = True
             is_web = getattr(self.page_ref, 'web', False)
@@ -157,28 +223,32 @@ class PostingPage:
             if mime_type:
                 if mime_type.startswith("image") and not mime_type.endswith("gif"):
                     self.file_preview.content = ft.Column([
-                        ft.Image(src=str(self.selected_image_path_on_disk), width=150, height=150,
-                                 fit=ft.ImageFit.CONTAIN, border_radius=8),
+                        self._thumbnail_placeholder(),
                         text_info()
                     ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
 
                 elif mime_type.endswith("gif"):
                     self.file_preview.content = ft.Column([
-                        ft.Image(src=str(self.selected_image_path_on_disk), width=150, height=150,
-                                 fit=ft.ImageFit.CONTAIN, border_radius=8),
+                        self._thumbnail_placeholder(),
                         text_info("GIF, ")
                     ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
 
                 elif mime_type.startswith("video") and is_web:
                     self.file_preview.content = ft.Column([
-                        ft.Video(src=str(self.selected_image_path_on_disk), width=220, height=180,
+                        ft.Video(src=str(disk_path), width=220, height=180,
                                  autoplay=False, controls=True, border_radius=8),
                         text_info()
                     ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
 
+                elif mime_type.startswith("video"):
+                    self.file_preview.content = ft.Column([
+                        self._thumbnail_placeholder(is_video=True),
+                        text_info("видео, ")
+                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
+
                 elif mime_type.startswith("audio") and is_web:
                     self.file_preview.content = ft.Column([
-                        ft.Audio(src=str(self.selected_image_path_on_disk), autoplay=False, volume=1.0),
+                        ft.Audio(src=str(disk_path), autoplay=False, volume=1.0),
                         text_info()
                     ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
 
@@ -199,14 +269,47 @@ class PostingPage:
             self.clear_image_button.visible = True
             self.clear_image_button.update()
 
+            if self._thumbnail_pending:
+                self._load_thumbnail(disk_path)
+
         except Exception as ex:
             self._show_message(f"Ошибка загрузки файла: {ex}")
 
+    # Заглушка превью, пока миниатюра строится в фоне
+    def _thumbnail_placeholder(self, is_video: bool = False):
+        self.thumbnail_slot.content = ft.ProgressRing(width=24, height=24, stroke_width=2)
+        self.thumbnail_slot.data = is_video
+        self._thumbnail_pending = True
+        return self.thumbnail_slot
+
+    # Фоновая генерация миниатюры (кэш по хешу содержимого)
+    def _load_thumbnail(self, file_path: Path):
+        self._preview_token += 1
+        token = self._preview_token
+
+        def on_ready(thumb):
+            if token != self._preview_token:
+                return
+            is_video = bool(self.thumbnail_slot.data)
+            if thumb:
+                image = ft.Image(src=str(thumb), width=150, height=150, fit=ft.ImageFit.CONTAIN, border_radius=8)
+                self.thumbnail_slot.content = ft.Stack([
+                    image, ft.Icon(ft.Icons.PLAY_CIRCLE_OUTLINE, size=40, opacity=0.8)
+                ], alignment=ft.alignment.center) if is_video else image
+            else:
+                icon = ft.Icons.MOVIE_OUTLINED if is_video else ft.Icons.IMAGE_OUTLINED
+                self.thumbnail_slot.content = ft.Icon(icon, size=40, opacity=0.6)
+            self.thumbnail_slot.update()
+
+        request_thumbnail(file_path, on_ready)
+
     def _clear_selected_image(self, e):
+        self._preview_token += 1
         self.file_preview.content = None
         self.file_preview.visible = False
         self.clear_image_button.visible = False
-        self.selected_image_path_on_disk = self.selected_image_original_name = None
+        self.selected_files = []
+        self.selected_image_original_name = None
         self.file_preview.update()
         self.clear_image_button.update()
 
@@ -221,28 +324,139 @@ class PostingPage:
     # Проверка формы
     def _validate_inputs_for_submission(self) -> bool:
         msg = self.message_input.value.strip()
-        if not msg and not self.selected_image_path_on_disk:
+        if not msg and not self.selected_files:
             self._show_message("Сообщение не может быть пустым без файла.")
             return False
         if not self.user_data.get('user_telegram_token') or not self.user_data.get('user_telegram_channel'):
             self._show_message("Укажите Telegram-бота и канал в настройках TG.")
             return False
+        if not self._selected_channel_ids():
+            self._show_message("Выберите хотя бы один канал.")
+            return False
         return True
 
-    # Немедленная отправка
+    # Проверка лимитов Bot API для файлов (ужатие, хеширование) — только в фоновом потоке.
+    # Ужатая копия попадает в кэш и при отправке не пересчитывается
+    def _media_error(self, files: list[str]) -> str | None:
+        if len(files) > 1:
+            return check_media_group(files)
+        if files:
+            endpoint, field_name = detect_media_type(files[0])
+            if endpoint:
+                return prepare_media(files[0], endpoint, field_name).error
+        return None
+
+    # Каналы публикации: флажки появляются, только если у пользователя есть дополнительные каналы
+    def _load_channels(self, user_id: int):
+        channels = get_user_cache(self.page_ref, self.db).get_channels(user_id)
+        self.channel_checkboxes = {MAIN_CHANNEL: ft.Checkbox(label="Основной канал", value=True)}
+        for channel in channels:
+            self.channel_checkboxes[channel.id] = ft.Checkbox(label=channel.title, value=False)
+        self.channels_row.controls = [ft.Text("Каналы:", size=12, opacity=0.7), *self.channel_checkboxes.values()]
+        self.channels_row.visible = bool(channels)
+
+    def _selected_channel_ids(self) -> list[int]:
+        return [channel_id for channel_id, checkbox in self.channel_checkboxes.items() if checkbox.value]
+
+    # None — только основной канал (пост отправляется как раньше)
+    def _channel_ids_for_post(self) -> list[int] | None:
+        channel_ids = self._selected_channel_ids()
+        return None if channel_ids == [MAIN_CHANNEL] else channel_ids
+
+    # Немедленная отправка (в фоновом потоке, чтобы интерфейс оставался отзывчивым)
     def _submit_now_handler(self, e):
+        if self._cancel_upload_event is not None:
+            return
         if not self._validate_inputs_for_submission():
             return
+        msg = self.message_input.value.strip()
+        token = self.user_data['user_telegram_token']
+        channel = self.user_data['user_telegram_channel']
+        files = [str(p) for p in self.selected_files]
+        self._cancel_upload_event = threading.Event()
+        self._set_uploading(bool(files))
+        channel_ids = self._channel_ids_for_post()
+        if channel_ids:
+            self.page_ref.run_thread(self._fan_out_worker, channel_ids, msg, files, self._cancel_upload_event)
+            return
+        self.page_ref.run_thread(self._send_now_worker, token, channel, msg, files, self._cancel_upload_event)
+
+    # Публикация в несколько каналов; прогресс — по числу каналов, а не байтам загрузки
+    def _fan_out_worker(self, channel_ids, msg, files, cancel_event):
         try:
-            msg = self.message_input.value.strip()
-            token = self.user_data['user_telegram_token']
-            channel = self.user_data['user_telegram_channel']
-            res = sendMediaMessage(token, channel, str(self.selected_image_path_on_disk), msg) if self.selected_image_path_on_disk else sendMessage(token, channel, msg)
-            self._show_message("Сообщение отправлено!" if res.get("ok") else f"Ошибка: {res.get('description')}", not res.get("ok"))
+            if error := self._media_error(files):
+                self._show_message(error)
+                return
+            user = self.db.get_user_by_id(self.user_data['id'])
+            targets = get_targets(self.db, user, channel_ids)
+            done = []
+
+            def on_result(result):
+                done.append(result)
+                self.upload_progress.value = len(done) / len(targets)
+                self.upload_status.value = f"Каналов: {len(done)} / {len(targets)}"
+                if self.upload_row.page:
+                    self.upload_row.update()
+
+            self.upload_row.visible = True
+            results = fan_out_post(targets, msg, files, cancel_event=cancel_event, on_result=on_result)
+            ok = bool(results) and all(result.ok for result in results)
+            self._show_message(summarize_results(results), is_error=not ok)
+            if ok:
+                self._clear_form()
+        except Exception as ex:
+            self._show_message(f"Ошибка отправки: {ex}")
+        finally:
+            self._cancel_upload_event = None
+            self._set_uploading(False)
+
+    def _send_now_worker(self, token, channel, msg, files, cancel_event):
+        try:
+            if error := self._media_error(files):
+                self._show_message(error)
+                return
+            res = send_post(token, channel, msg, files, on_progress=self._on_upload_progress, cancel_event=cancel_event)
+            if res.get("error_code") == "CANCELLED":
+                self._show_message("Отправка отменена.")
+            else:
+                self._show_message("Сообщение отправлено!" if res.get("ok") else f"Ошибка: {res.get('description')}", not res.get("ok"))
             if res.get("ok"):
                 self._clear_form()
         except Exception as ex:
             self._show_message(f"Ошибка отправки: {ex}")
+        finally:
+            self._cancel_upload_event = None
+            self._set_uploading(False)
+
+    # Отображение прогресса загрузки
+    def _set_uploading(self, active: bool):
+        self.submit_now_button.disabled = active or self._cancel_upload_event is not None
+        self.upload_row.visible = active
+        self.upload_progress.value = 0
+        self.upload_status.value = ""
+        self._last_progress = (0.0, 0)
+        for ctrl in [self.submit_now_button, self.upload_row]:
+            if ctrl.page:
+                ctrl.update()
+
+    def _on_upload_progress(self, sent: int, total: int):
+        fraction = sent / total if total else 1.0
+        now = time.monotonic()
+        last_time, last_fraction = self._last_progress
+        # Не чаще ~10 раз в секунду и только при заметном изменении
+        if fraction < 1.0 and (now - last_time < 0.1 or fraction - last_fraction < 0.01):
+            return
+        self._last_progress = (now, fraction)
+        self.upload_progress.value = fraction
+        self.upload_status.value = f"{self._format_file_size(sent)} / {self._format_file_size(total)}"
+        if self.upload_row.page:
+            self.upload_row.update()
+
+    def _cancel_upload(self, e):
+        if self._cancel_upload_event is not None:
+            self._cancel_upload_event.set()
+            self.upload_status.value = "Отмена..."
+            self.upload_row.update()
 
     # Планирование поста
     def _submit_scheduled_handler(self, e):
@@ -255,8 +469,9 @@ class PostingPage:
             self._show_message("Выберите время")
             return
         try:
-            send_at = datetime.combine(self.selected_date, self.selected_time)
-            if send_at <= datetime.now():
+            # Дата и время в поясе пользователя -> UTC для БД и планировщика
+            send_at = to_utc(datetime.combine(self.selected_date, self.selected_time), self.user_data.get("timezone"))
+            if send_at <= utc_now():
                 self._show_message("Дата и время должны быть в будущем.")
                 return
         except Exception:
@@ -267,13 +482,26 @@ class PostingPage:
         if not user_id:
             self._show_message("Пользователь не найден.")
             return
+        self.page_ref.run_thread(self._schedule_worker, user_id, send_at, list(self.selected_files))
+
+    # Проверка файлов и сохранение поста или правила повтора в фоновом потоке
+    def _schedule_worker(self, user_id: int, send_at: datetime, files: list[Path]):
+        if error := self._media_error([str(p) for p in files]):
+            self._show_message(error)
+            return
 
-        image_filename = None
-        if self.selected_image_path_on_disk:
+        stored_files = []
+        for path in files:
             try:
-                image_filename = str(self.selected_image_path_on_disk.relative_to(Path(ASSETS)))
+                stored_files.append(str(path.relative_to(Path(ASSETS))))
             except ValueError:
-                image_filename = self.selected_image_path_on_disk.name
+                stored_files.append(path.name)
+        image_filename = stored_files[0] if len(stored_files) == 1 else None
+        media_files = stored_files if len(stored_files) > 1 else None
+
+        if self.repeat_dropdown.value != "none":
+            self._submit_rule(user_id, send_at, image_filename, media_files)
+            return
 
         link_post = p_link_generate(10)
 
@@ -282,35 +510,99 @@ class PostingPage:
                 user_id=user_id,
                 message=self.message_input.value,
                 image_filename=image_filename,
+                media_files=media_files,
                 link_post=link_post,
-                scheduled_datetime=send_at
+                scheduled_datetime=send_at,
+                channel_ids=self._channel_ids_for_post()
             )
 
-            self.scheduler.add_job(
-                _execute_scheduled_post_wrapper,
-                'date', run_date=send_at,
-                args=[link_post, Database()],
-                id=f"post_{link_post}", replace_existing=True
-            )
+            schedule_post(link_post, send_at)
 
             self._show_message("Пост запланирован", is_error=False)
             self._clear_form()
         except Exception as ex:
             self._show_message(f"Ошибка планирования: {ex}")
 
+    # Импорт контент-плана: проверка, одна транзакция на все посты и одна постановка в таймер
+    def _pick_plan_handler(self, e):
+        self.plan_picker.pick_files(allow_multiple=False, allowed_extensions=list(PLAN_FORMATS))
+
+    def _on_pick_plan_result(self, e):
+        if not e.files or not e.files[0].path:
+            return
+        user_id = self.user_data.get("id")
+        if not user_id:
+            self._show_message("Пользователь не найден.")
+            return
+        self.import_plan_button.disabled = True
+        self.import_plan_button.update()
+        self.page_ref.run_thread(self._import_plan_worker, user_id, e.files[0].path)
+
+    def _import_plan_worker(self, user_id: int, path: str):
+        try:
+            result = import_content_plan(self.db, user_id, path, self.user_data.get("timezone"))
+            if result.errors:
+                lines = "; ".join(f"строка {error.line}: {error.message}" for error in result.errors[:3])
+                more = f" и ещё {len(result.errors) - 3}" if len(result.errors) > 3 else ""
+                self._show_message(f"План не импортирован — {lines}{more}")
+            else:
+                self._show_message(f"Запланировано постов: {result.inserted}, пропущено повторов: {result.duplicates}",
+                                   is_error=False)
+        except Exception as ex:
+            logger.error(f"Ошибка импорта контент-плана: {ex}")
+            self._show_message(f"Ошибка импорта: {ex}")
+        finally:
+            self.import_plan_button.disabled = False
+            self.import_plan_button.update()
+
+    # Правило повтора: daily/weekly — cron от выбранного местного времени, cron — своё выражение
+    def _submit_rule(self, user_id: int, send_at: datetime, image_filename, media_files):
+        repeat, value = self.repeat_dropdown.value, (self.repeat_value_input.value or "").strip()
+        tz_name = self.user_data.get("timezone")
+        local_time, kind, cron, interval = self.selected_time, RULE_CRON, None, None
+        if repeat == "daily":
+            cron = f"{local_time.minute} {local_time.hour} * * *"
+        elif repeat == "weekly":
+            cron = f"{local_time.minute} {local_time.hour} * * {CRON_WEEKDAYS[self.selected_date.weekday()]}"
+        elif repeat == "cron":
+            cron = value
+        else:
+            kind = RULE_INTERVAL
+            interval = int(value) * 60 if value.isdigit() else 0
+        try:
+            if not create_post_rule(user_id, self.message_input.value, kind, send_at, tz_name, cron=cron,
+                                    interval_minutes=interval, image_filename=image_filename, media_files=media_files,
+                                    channel_ids=self._channel_ids_for_post()):
+                self._show_message("Не удалось сохранить повтор")
+                return
+        except ValueError as ex:
+            self._show_message(f"Ошибка повтора: {ex}")
+            return
+        self._show_message("Повторяющийся пост запланирован", is_error=False)
+        self._clear_form()
+
+    def _on_repeat_change(self, e):
+        repeat = self.repeat_dropdown.value
+        self.repeat_value_input.visible = repeat in ("hours", "cron")
+        self.repeat_value_input.label = "Каждые N часов" if repeat == "hours" else "Cron: мин час день месяц день_недели"
+        self.repeat_value_input.value = ""
+        self.repeat_row.update()
+
     def _clear_form(self):
         self.message_input.value = ""
         self.date_display_field.value = self.time_display_field.value = ""
         self.selected_date = self.selected_time = None
         self._clear_selected_image(None)
         self.scheduled_post_checkbox.value = False
+        self.repeat_dropdown.value, self.repeat_value_input.value = "none", ""
+        self.repeat_value_input.visible = False
         self._toggle_scheduled_fields(None)
         for ctrl in [self.message_input, self.date_display_field, self.time_display_field, self.scheduled_post_checkbox]:
             ctrl.update()
     # Переключение планирования
     def _toggle_scheduled_fields(self, e):
         is_scheduled = self.scheduled_post_checkbox.value
-        self.datetime_selection_container.visible = is_scheduled
+        self.datetime_selection_container.visible = self.repeat_row.visible = is_scheduled
         self.submit_scheduled_button.visible = is_scheduled
         self.submit_now_button.visible = not is_scheduled
         self.page_ref.update()
@@ -329,31 +621,23 @@ class PostingPage:
         self.time_display_field.value = self.selected_time.strftime("%H:%M")
         self.time_display_field.update()
 
-    # Выход из системы
-    def _logout_handler(self, e=None):
-        if self.page_ref:
-            token = self.user_data.get("user_telegram_token")
-            if token and is_bot_running(token):
-                stop_bot_by_token(token)
-            for key in ['auth_user', 'user_email']:
-                if self.page_ref.session.contains_key(key):
-                    self.page_ref.session.remove(key)
-            self.user_data = {}
-            self.page_ref.go('/')
-
     # Пост-карточка
     def _build_posting_form_card(self):
         return ft.Card(
             elevation=2,
             content=ft.Container(
                 content=ft.Column([
-                    ft.Text("Новый пост", weight=ft.FontWeight.BOLD, size=18),
+                    ft.Row([ft.Text("Новый пост", weight=ft.FontWeight.BOLD, size=18), self.import_plan_button],
+                           alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                     ft.Divider(height=10),
                     self.message_input,
                     ft.Row([self.pick_files_button, self.clear_image_button], spacing=10),
                     self.file_preview,
+                    self.upload_row,
+                    self.channels_row,
                     self.scheduled_post_checkbox,
                     self.datetime_selection_container,
+                    self.repeat_row,
                     ft.Row([self.submit_now_button, self.submit_scheduled_button], alignment=ft.MainAxisAlignment.END)
                 ], spacing=10),
                 padding=20,
@@ -361,16 +645,6 @@ class PostingPage:
             )
         )
 
-    # Обновление стилей страницы
-    def _update_styles(self, page: ft.Page):
-        colors = get_colors(page.theme_mode or "light")
-        page.bgcolor = colors["primary_bg"]
-        self.main_container.bgcolor = colors["primary_bg"]
-        self.header.bgcolor = colors["secondary_bg"]
-        self.sidebar.bgcolor = colors["secondary_bg"]
-        self.sidebar.border = ft.border.only(right=ft.BorderSide(1, colors["divider_color"]))
-        self.theme_icon.style = ft.ButtonStyle(color={"": colors["icon_color"], "selected": colors["accent"]})
-
     # Показ страницы
     def view(self, page: ft.Page, params: Params, basket: Basket) -> ft.View:
         self.page_ref = page
@@ -378,109 +652,13 @@ class PostingPage:
         if not uid:
             page.go("/")
             return ft.View()
-        self._fetch_user_data(uid, force=True)
-
-        page.title = "Панель управления - Постинг"
-        page.fonts = {TITLE_FONT_FAMILY: FONT_OFONT_PATH}
-        page.font_family = DEFAULT_FONT_FAMILY
-        page.theme_mode = page.client_storage.get("theme_mode") or "light"
-
-        def toggle_theme(e=None):
-            new_mode = "dark" if page.theme_mode == "light" else "light"
-            page.theme_mode = new_mode
-            page.client_storage.set("theme_mode", new_mode)
-            self.theme_icon.selected = (new_mode == "dark")
-            self._update_styles(page)
-            page.update()
-
-        self.theme_icon = ft.IconButton(
-            icon=ft.Icons.LIGHT_MODE, selected_icon=ft.Icons.DARK_MODE,
-            selected=(page.theme_mode == "dark"), icon_size=20,
-            tooltip="Сменить тему", on_click=toggle_theme
-        )
-
-        def menu_btn(icon, label, route):
-            return ft.TextButton(
-                content=ft.Row([ft.Icon(icon, size=18), ft.Text(label)], spacing=12),
-                on_click=lambda _, r=route: page.go(r)
-            )
-
-        # Сайдбар
-        self.sidebar = ft.Container(
-            width=260, padding=ft.padding.only(bottom=10),
-            content=ft.Column([
-                ft.Container(ft.Row([ft.Image(src=LOGO_FLET_PATH, width=30, height=30), self.logo_text]), padding=20),
-                ft.Divider(height=1),
-                ft.Container(self.menu_title, padding=ft.padding.only(left=20, top=20, bottom=10)),
-                ft.Column([
-                    menu_btn(ft.Icons.SETTINGS_OUTLINED, "Настройки TG", "/dashboard"),
-                    menu_btn(ft.Icons.ACCOUNT_CIRCLE_OUTLINED, "Профиль", "/profile"),
-                    menu_btn(ft.Icons.POST_ADD_ROUNDED, "Постинг", "/posting"),
-                    menu_btn(ft.Icons.PEOPLE_ALT_ROUNDED, "Рассылка", "/broadcast_custom")
-                ], spacing=5),
-                ft.Divider(height=1),
-                ft.Container(self.theme_icon, padding=10)
-            ])
-        )
-
-        # Хедер
-        user_popup = ft.PopupMenuButton(
-            content=ft.Row([self.user_avatar, self.display_name,
-                            ft.Icon(ft.Icons.KEYBOARD_ARROW_DOWN_ROUNDED, size=16, opacity=0.7)], spacing=8),
-            items=[
-                ft.PopupMenuItem(text="Профиль", icon=ft.Icons.ACCOUNT_CIRCLE_OUTLINED, on_click=lambda _: page.go('/profile')),
-                ft.PopupMenuItem(height=1),
-                ft.PopupMenuItem(text="Выйти", icon=ft.Icons.LOGOUT_ROUNDED, on_click=self._logout_handler)
-            ]
-        )
-
-        self.header = ft.Container(
-            content=ft.Row([self.header_title, user_popup], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-            padding=ft.padding.symmetric(horizontal=25, vertical=15)
-        )
+        self._fetch_user_data(uid)
+        self._load_channels(uid)
 
         self.main_col.controls.clear()
         self.main_col.controls.append(self._build_posting_form_card())
-        for el in [self.file_picker, self.date_picker, self.time_picker, self.snackbar]:
+        for el in [self.file_picker, self.plan_picker, self.date_picker, self.time_picker, self.snackbar]:
             if el not in page.overlay:
                 page.overlay.append(el)
 
-        self._update_styles(page)
-
-        return ft.View(
-            route="/posting", padding=0,
-            controls=[ft.Row([
-                self.sidebar,
-                ft.Column([self.header, ft.Divider(height=1), self.main_container], expand=True, spacing=0)
-            ], expand=True)]
-        )
-
-
-# Отправка планированных постов
-def _execute_scheduled_post_wrapper(link_post: str, db_instance: Database):
-    try:
-        _execute_scheduled_post_logic(link_post, db_instance)
-    except Exception as ex:
-        print(f"[FATAL] Ошибка выполнения задачи {link_post}: {ex}")
-
-
-def _execute_scheduled_post_logic(link_post: str, db: Database):
-    post = db.get_pending_post_by_link(link_post)
-    if not post or post.status != "pending":
-        return
-    user = db.get_user_by_id(post.user_id)
-    if not user:
-        return
-    try:
-        if post.image_filename:
-            image_path = Path(ASSETS) / post.image_filename
-            if image_path.exists():
-                sendMediaMessage(user.user_telegram_token, user.user_telegram_channel, str(image_path), post.message)
-            else:
-                sendMessage(user.user_telegram_token, user.user_telegram_channel, post.message)
-        else:
-            sendMessage(user.user_telegram_token, user.user_telegram_channel, post.message)
-        db.update_pending_post_status(link_post, "sent")
-    except Exception:
-        db.update_pending_post_status(link_post, "failed")
-
+        return self.shell.show(page, "/posting", "Панель управления - Постинг", "Создание Поста", self.main_col)
@@ -4,21 +4,22 @@ import flet as ft
 from flet_route import Params, Basket
 from utils.style import *
 from utils.database import Database
-from utils.telegram_bot_manager import is_bot_running, stop_bot_by_token
+from utils.user_cache import get_user_cache
+from utils.timezones import DEFAULT_TIMEZONE, COMMON_TIMEZONES, is_valid_timezone
+from pages.shell import AppShell
 
 # Пути и ресурсы
 ASSETS = "assets"
 AVATARS = "avatars"
 IMAGES = "images"
 DEFAULT_AVATAR = f"{IMAGES}/default_avatar.png"
-LOGO = f"{IMAGES}/logo.png"
-FONT = "fonts/ofont.ru_Uncage.ttf"
 AVATAR_DISK_PATH = Path(ASSETS) / AVATARS
 
 
 class ProfilePage:
-    def __init__(self):
+    def __init__(self, shell: AppShell):
         self.db = Database()
+        self.shell = shell
         self.page_ref, self.user_data = None, {}
 
         # Компоненты уведомлений и загрузки
@@ -28,7 +29,6 @@ class ProfilePage:
 
         # Компоненты аватара
         self.avatar_display = ft.Image(width=80, height=80, fit=ft.ImageFit.COVER, border_radius=40)
-        self.user_avatar = ft.Image(width=36, height=36, fit=ft.ImageFit.COVER, border_radius=18, tooltip="Ваш аватар")
         self.upload_btn = ft.ElevatedButton("Сменить аватар", icon=ft.Icons.UPLOAD_FILE, on_click=self._trigger_picker)
         self.delete_btn = ft.ElevatedButton("Удалить аватар", icon=ft.Icons.DELETE_OUTLINE, on_click=self._delete_avatar)
 
@@ -43,15 +43,17 @@ class ProfilePage:
         self.confirm_password = ft.TextField(label="Подтвердите новый пароль", password=True, can_reveal_password=True, border_radius=8, filled=True, prefix_icon=ft.Icons.LOCK_PERSON_OUTLINED)
         self.password_btn = ft.ElevatedButton("Изменить пароль", icon=ft.Icons.KEY_ROUNDED, on_click=self._change_password)
 
-        # Навигация и заголовки
-        self.logo = ft.Text('CHANNEL MANAGER', expand=True, font_family=TITLE_FONT_FAMILY, size=18, weight=ft.FontWeight.BOLD)
-        self.menu_title = ft.Text('МЕНЮ', size=13, font_family=TITLE_FONT_FAMILY, weight=ft.FontWeight.W_600, opacity=0.7)
-        self.header_title = ft.Text('Настройки профиля', size=20, font_family=TITLE_FONT_FAMILY, weight=ft.FontWeight.BOLD)
-        self.display_name = ft.Text("Загрузка...", weight=ft.FontWeight.BOLD, size=14)
+        # Часовой пояс: в нём вводится и показывается время постов
+        # Полный список IANA (~600 пунктов) не строится: короткий список популярных плюс ручной ввод
+        self.timezone_presets = ft.Dropdown(label="Популярные пояса", filled=True, border_radius=8, expand=True,
+                                            options=[ft.dropdown.Option(name) for name in COMMON_TIMEZONES],
+                                            on_change=self._pick_timezone)
+        self.timezone_input = ft.TextField(label="Часовой пояс", hint_text="Например, Asia/Almaty", filled=True,
+                                           border_radius=8, expand=True, prefix_icon=ft.Icons.PUBLIC,
+                                           on_change=self._validate_timezone)
+        self.timezone_btn = ft.ElevatedButton("Сохранить пояс", icon=ft.Icons.SCHEDULE, on_click=self._save_timezone)
 
-        self.theme_icon, self.sidebar, self.header = None, None, None
         self.main_col = ft.Column(scroll=ft.ScrollMode.ADAPTIVE, spacing=0, expand=True)
-        self.main_container = ft.Container(expand=True, content=self.main_col, padding=20)
 
     # Показ уведомления
     def _show_message(self, msg, is_error=True):
@@ -65,39 +67,41 @@ class ProfilePage:
         self.page_ref.update()
 
     # Получение данных пользователя
-    def _fetch_user_data(self, user_id: int, force=True):
-        if not force and self.user_data.get('id') == user_id:
-            return
+    def _fetch_user_data(self, user_id: int, force=False):
         try:
-            user_row = self.db.get_user_by_id(user_id)
-            self.user_data = dict(user_row._mapping) if user_row else {}
+            self.user_data = get_user_cache(self.page_ref, self.db).get(user_id, force=force)
             if not self.user_data:
                 self.page_ref.go('/')
             else:
-                self._update_profile_ui()
+                self._update_profile_ui(update=False)
         except:
             self.page_ref.go('/')
 
-    # Обновление UI профиля
-    def _update_profile_ui(self):
+    # Обновление UI профиля (update=False внутри view() — страницу обновит роутер)
+    def _update_profile_ui(self, update=True):
         if not self.user_data: return
         avatar_src = self.user_data.get('avatar_url') or DEFAULT_AVATAR
         disk_path = Path(ASSETS) / avatar_src
         src = avatar_src if disk_path.exists() else DEFAULT_AVATAR
-        self.avatar_display.src = self.user_avatar.src = src
+        self.avatar_display.src = src
         if avatar_src != DEFAULT_AVATAR and disk_path.exists():
             self.delete_btn.visible = True
             self.delete_btn.style = ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=6))
         else:
             self.delete_btn.visible = False
         self.current_login.value = self.user_data.get('login', 'Не указан')
+        tz_name = self.user_data.get('timezone') or DEFAULT_TIMEZONE
+        self.timezone_input.value = tz_name
+        self.timezone_input.error_text = None
+        self.timezone_presets.value = tz_name if tz_name in COMMON_TIMEZONES else None
         self.new_login_input.value = ""
         self.new_login_input.error_text = None
         for f in [self.current_password, self.new_password, self.confirm_password]:
             f.value = ""
             f.error_text = None
-        self.display_name.value = self.user_data.get('login', 'User')
-        self.page_ref.update()
+        self.shell.set_user(self.user_data)
+        if update:
+            self.page_ref.update()
 
     # Загрузка нового аватара
     def _trigger_picker(self, e):
@@ -158,6 +162,26 @@ class ProfilePage:
                 return
         self.new_login_input.update()
 
+    # Выбор из популярных подставляет пояс в поле ввода
+    def _pick_timezone(self, e):
+        self.timezone_input.value = self.timezone_presets.value
+        self.timezone_input.error_text = None
+        self.timezone_input.update()
+
+    def _validate_timezone(self, e):
+        tz_name = (self.timezone_input.value or "").strip()
+        self.timezone_input.error_text = None if not tz_name or is_valid_timezone(tz_name) else "Неизвестный часовой пояс"
+        self.timezone_input.update()
+
+    # Изменение часового пояса; уже запланированные посты хранятся в UTC и не сдвигаются
+    def _save_timezone(self, e):
+        tz_name = (self.timezone_input.value or "").strip()
+        if not is_valid_timezone(tz_name):
+            self._show_message("Неизвестный часовой пояс")
+        elif self.db.update_user_timezone(self.user_data["id"], tz_name):
+            self.user_data["timezone"] = tz_name
+            self._show_message("Часовой пояс сохранён", is_error=False)
+
     # Изменение пароля
     def _change_password(self, e):
         uid = self.user_data["id"]
@@ -196,6 +220,16 @@ class ProfilePage:
             ft.Row([self.login_save_btn], alignment=ft.MainAxisAlignment.END)
         ], spacing=15))
 
+    def _timezone_card(self):
+        return self._card("Часовой пояс", ft.Column([
+            ft.Text("Часовой пояс", weight=ft.FontWeight.BOLD, size=18),
+            ft.Text("Время запланированных постов вводится и показывается в этом поясе", opacity=0.7, size=12),
+            ft.Divider(height=10),
+            self.timezone_presets,
+            self.timezone_input,
+            ft.Row([self.timezone_btn], alignment=ft.MainAxisAlignment.END)
+        ], spacing=15))
+
     def _password_card(self):
         return self._card("Пароль", ft.Column([
             ft.Text("Смена пароля", weight=ft.FontWeight.BOLD, size=18),
@@ -206,17 +240,6 @@ class ProfilePage:
             ft.Row([self.password_btn], alignment=ft.MainAxisAlignment.END)
         ], spacing=15))
 
-    # Обновление стилей
-    def _update_styles(self, page: ft.Page):
-        colors = get_colors(page.theme_mode or "light")
-        page.bgcolor = colors["primary_bg"]
-        self.main_container.bgcolor = colors["primary_bg"]
-        self.header.bgcolor = colors["secondary_bg"]
-        self.sidebar.bgcolor = colors["secondary_bg"]
-        self.sidebar.border = ft.border.only(right=ft.BorderSide(1, colors["divider_color"]))
-        self.theme_icon.style = ft.ButtonStyle(color={"": colors["icon_color"], "selected": colors["accent"]})
-        page.update()
-
     # Главная вьюха страницы
     def view(self, page: ft.Page, params: Params, basket: Basket) -> ft.View:
         self.page_ref = page
@@ -225,62 +248,13 @@ class ProfilePage:
             page.go('/')
             return ft.View()
 
-        self._fetch_user_data(uid, force=True)
-
-        # Настройка темы
-        page.title = 'Панель управления - Настройки профиля'
-        page.fonts = {TITLE_FONT_FAMILY: FONT}
-        page.font_family = DEFAULT_FONT_FAMILY
-        page.theme_mode = page.client_storage.get("theme_mode") or "light"
-
-        def toggle_theme(e=None):
-            page.theme_mode = "dark" if page.theme_mode == "light" else "light"
-            page.client_storage.set("theme_mode", page.theme_mode)
-            self.theme_icon.selected = (page.theme_mode == "dark")
-            self._update_styles(page)
-
-        self.theme_icon = ft.IconButton(icon=ft.Icons.LIGHT_MODE, selected_icon=ft.Icons.DARK_MODE,
-                                        selected=(page.theme_mode == "dark"), icon_size=20,
-                                        tooltip="Сменить тему", on_click=toggle_theme)
-
-        def menu_btn(icon, label, route):
-            return ft.TextButton(content=ft.Row([ft.Icon(icon, size=18), ft.Text(label)], spacing=12),
-                                 on_click=lambda _, r=route: page.go(r))
-
-        menu = ft.Column([
-            menu_btn(ft.Icons.SETTINGS_OUTLINED, "Настройки TG", "/dashboard"),
-            menu_btn(ft.Icons.ACCOUNT_CIRCLE_OUTLINED, "Профиль", "/profile"),
-            menu_btn(ft.Icons.POST_ADD_ROUNDED, "Постинг", "/posting"),
-            menu_btn(ft.Icons.PEOPLE_ALT_ROUNDED, "Рассылка", "/broadcast_custom")
-        ], spacing=5)
-
-        self.sidebar = ft.Container(width=260, padding=ft.padding.only(bottom=10),
-            content=ft.Column([
-                ft.Container(ft.Row([ft.Image(src=LOGO, width=30, height=30), self.logo]), padding=20),
-                ft.Divider(height=1),
-                ft.Container(self.menu_title, padding=ft.padding.only(left=20, top=20, bottom=10)),
-                menu,
-                ft.Divider(height=1),
-                ft.Container(self.theme_icon, padding=10, alignment=ft.alignment.center_left)
-            ])
-        )
-
-        user_popup = ft.PopupMenuButton(
-            content=ft.Row([self.user_avatar, self.display_name, ft.Icon(ft.Icons.KEYBOARD_ARROW_DOWN_ROUNDED, size=16, opacity=0.7)], spacing=8),
-            items=[
-                ft.PopupMenuItem(text="Профиль", icon=ft.Icons.ACCOUNT_CIRCLE_OUTLINED, on_click=lambda _: page.go('/profile')),
-                ft.PopupMenuItem(height=1),
-                ft.PopupMenuItem(text="Выйти", icon=ft.Icons.LOGOUT_ROUNDED, on_click=self._logout_handler)
-            ]
-        )
-
-        self.header = ft.Container(content=ft.Row([self.header_title, user_popup], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                                   padding=ft.padding.symmetric(horizontal=25, vertical=15))
+        self._fetch_user_data(uid)
 
         self.main_col.controls.clear()
         self.main_col.controls.extend([
             ft.Container(self._avatar_card(), padding=20),
             ft.Container(self._login_card(), padding=20),
+            ft.Container(self._timezone_card(), padding=20),
             ft.Container(self._password_card(), padding=20)
         ])
 
@@ -289,24 +263,4 @@ class ProfilePage:
         if self.snackbar not in page.overlay:
             page.overlay.append(self.snackbar)
 
-        self._update_styles(page)
-
-        return ft.View(
-            route="/profile", padding=0,
-            controls=[ft.Row([
-                self.sidebar,
-                ft.Column([self.header, ft.Divider(height=1), self.main_container], expand=True, spacing=0)
-            ], expand=True)]
-        )
-
-    # Выход из профиля
-    def _logout_handler(self, e=None):
-        if self.page_ref:
-            token = self.user_data.get("user_telegram_token")
-            if token and is_bot_running(token):
-                stop_bot_by_token(token)
-            for k in ["auth_user", "user_email", "user_login"]:
-                if self.page_ref.session.contains_key(k):
-                    self.page_ref.session.remove(k)
-            self.user_data = {}
-            self.page_ref.go('/')
+        return self.shell.show(page, "/profile", 'Панель управления - Настройки профиля', 'Настройки профиля', self.main_col)
@@ -0,0 +1,253 @@
+import json
+import logging
+import threading
+from datetime import datetime
+import flet as ft
+from flet_route import Params, Basket
+from utils.style import *
+from utils.database import Database
+from utils.user_cache import get_user_cache
+from utils.scheduler import reschedule_post, cancel_post, stop_post_rule
+from utils.timezones import to_utc, from_utc, utc_now
+from pages.shell import AppShell
+
+# Размер страницы очереди и запас до конца списка, при котором подгружается следующая
+PAGE_SIZE = 50
+LOAD_MORE_EXTENT = 600
+
+STATUSES = {
+    "all": "Все",
+    "pending": "Ожидают",
+    "sending": "Отправляются",
+    "sent": "Отправлены",
+    "partial": "Частично",
+    "failed": "Ошибка",
+    "cancelled": "Отменены",
+}
+STATUS_COLORS = {
+    "pending": ft.Colors.PRIMARY,
+    "sending": ft.Colors.PRIMARY,
+    "sent": ft.Colors.GREEN,
+    "partial": ft.Colors.ORANGE,
+    "failed": ft.Colors.ERROR,
+    "cancelled": ft.Colors.ON_SURFACE_VARIANT,
+}
+
+logger = logging.getLogger(__name__)
+
+
+class QueuePage:
+    def __init__(self, shell: AppShell):
+        self.db = Database()
+        self.shell = shell
+        self.page_ref = None
+        self.user_data = {}
+
+        # Состояние списка: курсор последней загруженной строки и признак следующей страницы
+        self._cursor = None
+        self._has_more = False
+        self._loading = threading.Lock()
+        self._reschedule_link = None
+        self._reschedule_date = None
+
+        self.status_dropdown = ft.Dropdown(label="Статус", width=200, value="all", filled=True, border_radius=8,
+                                           options=[ft.dropdown.Option(key, text) for key, text in STATUSES.items()],
+                                           on_change=self._on_status_change)
+        self.refresh_button = ft.IconButton(icon=ft.Icons.REFRESH_ROUNDED, tooltip="Обновить",
+                                            on_click=lambda _: self._reload(update=True))
+        # ListView строит на клиенте только видимые строки, подгрузка — по прокрутке
+        self.list_view = ft.ListView(expand=True, spacing=8, on_scroll_interval=200, on_scroll=self._on_scroll)
+        self.empty_text = ft.Text("Постов нет", opacity=0.7, visible=False)
+        self.load_more_button = ft.TextButton("Загрузить ещё", icon=ft.Icons.EXPAND_MORE_ROUNDED,
+                                              on_click=self._load_more_handler, visible=False)
+
+        self.date_picker = ft.DatePicker(on_change=self._on_date_selected, on_dismiss=self._reset_reschedule,
+                                         first_date=datetime.now())
+        self.time_picker = ft.TimePicker(on_change=self._on_time_selected, on_dismiss=self._reset_reschedule)
+        self.cancel_dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Отмена поста"),
+            content=ft.Text("Пост не будет отправлен. Продолжить?"),
+            actions=[
+                ft.ElevatedButton("Да", on_click=self._cancel_confirmed),
+                ft.OutlinedButton("Нет", on_click=lambda _: self.page_ref.close(self.cancel_dialog)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+        )
+        self.snackbar = ft.SnackBar(content=ft.Text(""), open=False, duration=4000, action="OK",
+                                    on_action=lambda _: setattr(self.snackbar, 'open', False))
+
+        self.main_col = ft.Column([
+            ft.Row([self.status_dropdown, self.refresh_button], spacing=10),
+            self.empty_text,
+            self.list_view,
+            ft.Row([self.load_more_button], alignment=ft.MainAxisAlignment.CENTER),
+        ], spacing=15, expand=True)
+
+    # Загрузка данных пользователя
+    def _fetch_user_data(self, user_id: int, force=False):
+        try:
+            self.user_data = get_user_cache(self.page_ref, self.db).get(user_id, force=force)
+            if not self.user_data:
+                self.page_ref.go('/')
+            else:
+                self.shell.set_user(self.user_data)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки данных пользователя: {e}")
+            self.page_ref.go('/')
+
+    # Показ сообщения
+    def _show_message(self, msg: str, is_error: bool = True):
+        colors = get_colors(self.page_ref.theme_mode or "light")
+        self.snackbar.content = ft.Text(msg)
+        self.snackbar.bgcolor = colors["error"] if is_error else colors["success"]
+        if self.snackbar not in self.page_ref.overlay:
+            self.page_ref.overlay.append(self.snackbar)
+        self.snackbar.open = True
+        self.page_ref.update()
+
+    # Строка поста
+    def _post_row(self, post) -> ft.Container:
+        preview = " ".join((post.message or "").split())
+        media_count = len(json.loads(post.media_files)) if post.media_files else 1 if post.image_filename else 0
+        actions = []
+        if post.status == "pending":
+            actions = [
+                ft.IconButton(icon=ft.Icons.EDIT_CALENDAR_ROUNDED, tooltip="Перенести",
+                              on_click=lambda _, link=post.link_post: self._start_reschedule(link)),
+                ft.IconButton(icon=ft.Icons.CANCEL_OUTLINED, tooltip="Отменить",
+                              on_click=lambda _, link=post.link_post: self._confirm_cancel(link)),
+            ]
+            if post.rule_id:
+                actions.append(ft.IconButton(icon=ft.Icons.REPEAT_ON_ROUNDED, tooltip="Остановить повтор",
+                                             on_click=lambda _, rule_id=post.rule_id: self._stop_rule(rule_id)))
+        info = [ft.Text(preview or "(без текста)", size=13, max_lines=2, overflow=ft.TextOverflow.ELLIPSIS)]
+        if post.rule_id:
+            info.append(ft.Row([ft.Icon(ft.Icons.REPEAT_ROUNDED, size=14, opacity=0.7),
+                                ft.Text("Повторяющийся", size=11, opacity=0.7)], spacing=4))
+        if media_count:
+            info.append(ft.Row([ft.Icon(ft.Icons.ATTACH_FILE_ROUNDED, size=14, opacity=0.7),
+                                ft.Text(f"Файлов: {media_count}", size=11, opacity=0.7)], spacing=4))
+        return ft.Container(
+            padding=15, border_radius=10, bgcolor=ft.Colors.SURFACE,
+            content=ft.Row([
+                ft.Column([
+                    ft.Text(from_utc(post.scheduled_datetime, self.user_data.get("timezone")).strftime("%d.%m.%Y %H:%M"), weight=ft.FontWeight.BOLD),
+                    ft.Text(STATUSES.get(post.status, post.status), size=12,
+                            color=STATUS_COLORS.get(post.status, ft.Colors.ON_SURFACE_VARIANT))
+                ], width=150, spacing=4),
+                ft.Column(info, expand=True, spacing=4),
+                ft.Row(actions, spacing=0)
+            ], vertical_alignment=ft.CrossAxisAlignment.CENTER)
+        )
+
+    # Загрузка списка с начала (смена фильтра, перенос, отмена)
+    def _reload(self, update: bool = False):
+        self._cursor = None
+        self._has_more = False
+        self.list_view.controls.clear()
+        self._load_next_page()
+        if update:
+            self.page_ref.update()
+
+    # Следующая страница по курсору; берём на строку больше, чтобы узнать, есть ли продолжение
+    def _load_next_page(self):
+        if not self._loading.acquire(blocking=False):
+            return
+        try:
+            status = self.status_dropdown.value
+            rows = self.db.get_user_posts_page(self.user_data.get("id"), None if status == "all" else status,
+                                               self._cursor, PAGE_SIZE + 1)
+            self._has_more = len(rows) > PAGE_SIZE
+            rows = rows[:PAGE_SIZE]
+            if rows:
+                self._cursor = (rows[-1].scheduled_datetime, rows[-1].id)
+            self.list_view.controls.extend(self._post_row(post) for post in rows)
+            self.empty_text.visible = not self.list_view.controls
+            self.load_more_button.visible = self._has_more
+        except Exception as e:
+            logger.error(f"Ошибка загрузки очереди постов: {e}")
+        finally:
+            self._loading.release()
+
+    def _on_scroll(self, e: ft.OnScrollEvent):
+        if self._has_more and e.max_scroll_extent - e.pixels < LOAD_MORE_EXTENT:
+            self._load_more_handler(e)
+
+    def _load_more_handler(self, e=None):
+        self._load_next_page()
+        self.page_ref.update()
+
+    def _on_status_change(self, e):
+        self._reload(update=True)
+
+    # Перенос: дата, затем время
+    def _start_reschedule(self, link_post: str):
+        self._reschedule_link = link_post
+        self.date_picker.open = True
+        self.page_ref.update()
+
+    def _on_date_selected(self, e):
+        if not self._reschedule_link or not self.date_picker.value:
+            return
+        self._reschedule_date = self.date_picker.value
+        self.time_picker.open = True
+        self.page_ref.update()
+
+    def _on_time_selected(self, e):
+        if not self._reschedule_link or not self._reschedule_date or not self.time_picker.value:
+            return
+        link_post = self._reschedule_link
+        local_at = datetime.combine(self._reschedule_date, self.time_picker.value)
+        send_at = to_utc(local_at, self.user_data.get("timezone"))
+        self._reset_reschedule()
+        if send_at <= utc_now():
+            self._show_message("Дата и время должны быть в будущем.")
+            return
+        if reschedule_post(link_post, send_at, self.user_data.get("id")):
+            self._reload()
+            self._show_message(f"Пост перенесён на {local_at.strftime('%d.%m.%Y %H:%M')}", is_error=False)
+        else:
+            self._show_message("Пост уже отправлен или отменён.")
+            self._reload(update=True)
+
+    def _reset_reschedule(self, e=None):
+        self._reschedule_link = self._reschedule_date = None
+
+    # Отмена с подтверждением
+    def _confirm_cancel(self, link_post: str):
+        self._reschedule_link = None
+        self.cancel_dialog.data = link_post
+        self.page_ref.open(self.cancel_dialog)
+
+    # Остановка правила: отменяются все его ожидающие посты, новые не создаются
+    def _stop_rule(self, rule_id: int):
+        if stop_post_rule(rule_id, self.user_data.get("id")):
+            self._show_message("Повтор остановлен", is_error=False)
+        else:
+            self._show_message("Не удалось остановить повтор.")
+        self._reload(update=True)
+
+    def _cancel_confirmed(self, e):
+        self.page_ref.close(self.cancel_dialog)
+        if cancel_post(self.cancel_dialog.data, self.user_data.get("id")):
+            self._reload()
+            self._show_message("Пост отменён", is_error=False)
+        else:
+            self._show_message("Пост уже отправлен или отменён.")
+            self._reload(update=True)
+
+    def view(self, page: ft.Page, params: Params, basket: Basket) -> ft.View:
+        self.page_ref = page
+        uid = page.session.get("auth_user")
+        if not uid:
+            page.go("/")
+            return ft.View()
+        self._fetch_user_data(uid)
+
+        for el in [self.date_picker, self.time_picker, self.snackbar]:
+            if el not in page.overlay:
+                page.overlay.append(el)
+        self._reload()
+
+        return self.shell.show(page, "/queue", "Панель управления - Очередь постов", "Очередь постов", self.main_col)
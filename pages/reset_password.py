@@ -80,37 +80,34 @@ class ResetPasswordPage:
         self.generated_code = None
         page.update()
 
-    # Обновление стилей
-    def _update_styles(self, page: ft.Page):
-        colors = get_colors(page.theme_mode)
+    # Стили на ролях темы: при смене темы их пересчитывает клиент, сервер ничего не отправляет
+    def _apply_styles(self):
         for field in [self.email_input, self.code_input, self.password_input, self.confirm_password_input]:
-            field.bgcolor = colors["input_bg"]
-            field.color = colors["primary_text"]
+            field.bgcolor = ft.Colors.SECONDARY_CONTAINER
+            field.color = ft.Colors.ON_SURFACE
             field.border_radius = 10
-            field.label_style = ft.TextStyle(color=colors["secondary_text"])
-            field.hint_style = ft.TextStyle(color=colors["secondary_text"])
-            field.prefix_style = ft.TextStyle(color=colors["secondary_text"])
+            field.label_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
+            field.hint_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
+            field.prefix_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
 
         if self.reset_button:
-            self.reset_button.bgcolor = colors["accent"]
-            self.reset_button.content.color = colors["button_text"]
+            self.reset_button.bgcolor = ft.Colors.PRIMARY
+            self.reset_button.content.color = ft.Colors.ON_PRIMARY
 
         if self.send_code_button:
-            self.send_code_button.bgcolor = colors["accent"]
-            self.send_code_button.content.color = colors["button_text"]
+            self.send_code_button.bgcolor = ft.Colors.PRIMARY
+            self.send_code_button.content.color = ft.Colors.ON_PRIMARY
 
         if self.login_link:
-            self.login_link.content.color = colors["accent"]
+            self.login_link.content.color = ft.Colors.PRIMARY
 
         if self.theme_icon_button:
-            self.theme_icon_button.style = ft.ButtonStyle(color={"": colors["secondary_text"], "selected": colors["accent"]})
+            self.theme_icon_button.style = ft.ButtonStyle(color={"": ft.Colors.ON_SURFACE_VARIANT, "selected": ft.Colors.PRIMARY})
 
         if self.title_text:
-            self.title_text.color = colors["primary_text"]
+            self.title_text.color = ft.Colors.ON_SURFACE
         if self.subtitle_text:
-            self.subtitle_text.color = colors["secondary_text"]
-
-        page.bgcolor = colors["primary_bg"]
+            self.subtitle_text.color = ft.Colors.ON_SURFACE_VARIANT
 
     # Отображение сообщений
     def _show_message(self, text: str, is_error: bool = True):
@@ -126,14 +123,13 @@ class ResetPasswordPage:
         page.title = "Сброс пароля"
         page.fonts = {TITLE_FONT_FAMILY: "fonts/ofont.ru_Uncage.ttf"}
         page.font_family = DEFAULT_FONT_FAMILY
-        page.theme_mode = page.client_storage.get("theme_mode") or "light"
+        apply_theme(page)
 
         # Смена темы
         def toggle_theme(e):
             page.theme_mode = "dark" if page.theme_mode == "light" else "light"
             page.client_storage.set("theme_mode", page.theme_mode)
             self.theme_icon_button.selected = (page.theme_mode == "dark")
-            self._update_styles(page)
             page.update()
 
         # Генерация кода
@@ -233,7 +229,7 @@ class ResetPasswordPage:
         self.password_input.disabled = True
         self.confirm_password_input.disabled = True
 
-        self._update_styles(page)
+        self._apply_styles()
         self._clear_items(page)
 
         # Макет формы
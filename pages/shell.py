@@ -0,0 +1,128 @@
+from pathlib import Path
+import flet as ft
+from utils.style import *
+from utils.telegram_bot_manager import is_bot_running, stop_bot_by_token
+
+ASSETS = Path(ASSETS_DIR)
+SESSION_KEYS = ['auth_user', 'user_email', 'user_login', 'user_cache']
+
+
+# Общий каркас авторизованных страниц: сайдбар, хедер и кнопка темы создаются один раз на сессию,
+# при смене маршрута меняется только содержимое content и заголовок. Возвращается всегда один и тот же
+# ft.View, поэтому Flet отправляет клиенту лишь разницу, а не всё дерево контролов заново
+class AppShell:
+    def __init__(self):
+        self.page_ref = None
+        self.user_data = {}
+        self.view = None
+
+        self.logo = ft.Text('CHANNEL MANAGER', expand=True, font_family=TITLE_FONT_FAMILY, size=18, weight=ft.FontWeight.BOLD)
+        self.menu_title = ft.Text('МЕНЮ', size=13, font_family=TITLE_FONT_FAMILY, weight=ft.FontWeight.W_600, opacity=0.7)
+        self.header_title = ft.Text('', size=20, font_family=TITLE_FONT_FAMILY, weight=ft.FontWeight.BOLD)
+        self.display_name = ft.Text("Загрузка...", weight=ft.FontWeight.BOLD, size=14)
+        self.user_avatar = ft.Image(src=DEFAULT_AVATAR_FLET_PATH, width=36, height=36, fit=ft.ImageFit.COVER,
+                                    border_radius=18, tooltip="Ваш аватар")
+        self.theme_icon = ft.IconButton(icon=ft.Icons.LIGHT_MODE, selected_icon=ft.Icons.DARK_MODE, icon_size=20,
+                                        tooltip="Сменить тему", on_click=self._toggle_theme,
+                                        style=ft.ButtonStyle(color={"": ft.Colors.ON_SURFACE_VARIANT,
+                                                                    "selected": ft.Colors.PRIMARY}))
+        self.sidebar = self.header = None
+        self.content = ft.Container(expand=True, padding=20)
+
+    def _go(self, route):
+        return lambda _: self.page_ref.go(route)
+
+    def _menu_btn(self, icon, label, route):
+        return ft.TextButton(content=ft.Row([ft.Icon(icon, size=18), ft.Text(label)], spacing=12),
+                             on_click=self._go(route))
+
+    # Сборка каркаса (один раз)
+    def _build(self):
+        self.sidebar = ft.Container(
+            width=260, padding=ft.padding.only(bottom=10), bgcolor=ft.Colors.SURFACE,
+            border=ft.border.only(right=ft.BorderSide(1, ft.Colors.OUTLINE_VARIANT)),
+            content=ft.Column([
+                ft.Container(ft.Row([ft.Image(src=LOGO_FLET_PATH, width=30, height=30), self.logo]), padding=20),
+                ft.Divider(height=1),
+                ft.Container(self.menu_title, padding=ft.padding.only(left=20, top=20, bottom=10)),
+                ft.Column([
+                    self._menu_btn(ft.Icons.SETTINGS_OUTLINED, "Настройки TG", "/dashboard"),
+                    self._menu_btn(ft.Icons.ACCOUNT_CIRCLE_OUTLINED, "Профиль", "/profile"),
+                    self._menu_btn(ft.Icons.POST_ADD_ROUNDED, "Постинг", "/posting"),
+                    self._menu_btn(ft.Icons.VIEW_LIST_ROUNDED, "Очередь", "/queue"),
+                    self._menu_btn(ft.Icons.PEOPLE_ALT_ROUNDED, "Рассылка", "/broadcast_custom"),
+                    self._menu_btn(ft.Icons.INSIGHTS_ROUNDED, "Диагностика", "/diagnostics")
+                ], spacing=5),
+                ft.Divider(height=1),
+                ft.Container(self.theme_icon, padding=10, alignment=ft.alignment.center_left)
+            ])
+        )
+
+        user_popup = ft.PopupMenuButton(
+            content=ft.Row([self.user_avatar, self.display_name,
+                            ft.Icon(ft.Icons.KEYBOARD_ARROW_DOWN_ROUNDED, size=16, opacity=0.7)], spacing=8),
+            items=[
+                ft.PopupMenuItem(text="Профиль", icon=ft.Icons.ACCOUNT_CIRCLE_OUTLINED, on_click=self._go('/profile')),
+                ft.PopupMenuItem(height=1),
+                ft.PopupMenuItem(text="Выйти", icon=ft.Icons.LOGOUT_ROUNDED, on_click=self._logout_handler)
+            ]
+        )
+
+        self.header = ft.Container(
+            content=ft.Row([self.header_title, user_popup], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            padding=ft.padding.symmetric(horizontal=25, vertical=15), bgcolor=ft.Colors.SURFACE
+        )
+
+        self.view = ft.View(
+            padding=0,
+            controls=[ft.Row([
+                self.sidebar,
+                ft.Column([self.header, ft.Divider(height=1), self.content], expand=True, spacing=0)
+            ], expand=True)]
+        )
+
+    # Показ страницы внутри каркаса
+    def show(self, page: ft.Page, route: str, title: str, header_title: str, content: ft.Control) -> ft.View:
+        self.page_ref = page
+        if self.view is None:
+            self._build()
+            page.fonts = {TITLE_FONT_FAMILY: FONT_OFONT_PATH}
+            page.font_family = DEFAULT_FONT_FAMILY
+            apply_theme(page)
+        self.theme_icon.selected = (page.theme_mode == "dark")
+        page.title = title
+        self.header_title.value = header_title
+        self.content.content = content
+        self.view.route = route
+        return self.view
+
+    # Данные пользователя в хедере
+    def set_user(self, user_data: dict):
+        self.user_data = user_data
+        self.display_name.value = user_data.get('login') or user_data.get('email') or "User"
+        avatar_url = user_data.get('avatar_url')
+        self.user_avatar.src = avatar_url if avatar_url and (ASSETS / avatar_url).exists() else DEFAULT_AVATAR_FLET_PATH
+        for ctrl in [self.display_name, self.user_avatar]:
+            if ctrl.page:
+                ctrl.update()
+
+    # Цвета каркаса заданы ролями темы (utils.style.build_theme), поэтому смена темы
+    # отправляет клиенту только theme_mode и состояние кнопки
+    def _toggle_theme(self, e=None):
+        page = self.page_ref
+        page.theme_mode = "dark" if page.theme_mode == "light" else "light"
+        page.client_storage.set("theme_mode", page.theme_mode)
+        self.theme_icon.selected = (page.theme_mode == "dark")
+        page.update()
+
+    # Выход из аккаунта
+    def _logout_handler(self, e=None):
+        if not self.page_ref: return
+        token = self.user_data.get("user_telegram_token")
+        if token and is_bot_running(token):
+            stop_bot_by_token(token)
+        for key in SESSION_KEYS:
+            if self.page_ref.session.contains_key(key):
+                self.page_ref.session.remove(key)
+        self.user_data = {}
+        self.page_ref.go('/')
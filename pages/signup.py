@@ -1,10 +1,15 @@
-import asyncio
+import time
+import threading
 import flet as ft
 from flet_route import Params, Basket
 from utils.style import *
 from utils.database import Database
 from utils.validation import Validation
 
+# Пауза после последнего нажатия перед проверкой занятости email/логина
+AVAILABILITY_DEBOUNCE_SECONDS = 0.4
+
+
 class SignupPage:
     # Инициализация компонентов
     def __init__(self):
@@ -49,48 +54,51 @@ class SignupPage:
             max_lines=5
         )
         self.loading_indicator = ft.ProgressRing(visible=False, width=20, height=20, stroke_width=2)
+        # Проверка занятости при вводе: таймер на поле и счётчик, по которому отбрасываются устаревшие ответы
+        self._check_timers: dict[str, threading.Timer] = {}
+        self._check_generation = {"email": 0, "login": 0}
         self.signup_button = None
         self.login_link = None
         self.theme_icon_button = None
         self.title_text = None
         self.subtitle_text = None
 
-    # Обновление стилей в зависимости от темы
-    def _update_styles(self, page: ft.Page):
-        colors = get_colors(page.theme_mode)
-
+    # Стили на ролях темы: при смене темы их пересчитывает клиент, сервер ничего не отправляет
+    def _apply_styles(self):
         for field in [self.email_input, self.login_input, self.password_input, self.confirm_password_input]:
-            field.bgcolor = colors["input_bg"]
-            field.color = colors["primary_text"]
+            field.bgcolor = ft.Colors.SECONDARY_CONTAINER
+            field.color = ft.Colors.ON_SURFACE
             field.border_radius = 10
-            field.label_style = ft.TextStyle(color=colors["secondary_text"])
-            field.hint_style = ft.TextStyle(color=colors["secondary_text"])
-            field.prefix_style = ft.TextStyle(color=colors["secondary_text"])
+            field.label_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
+            field.hint_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
+            field.prefix_style = ft.TextStyle(color=ft.Colors.ON_SURFACE_VARIANT)
 
-        self.message_text.color = colors["error"]
+        self.message_text.color = ft.Colors.ERROR
 
         if self.signup_button:
-            self.signup_button.bgcolor = colors["accent"]
+            self.signup_button.bgcolor = ft.Colors.PRIMARY
             if isinstance(self.signup_button.content, ft.Text):
-                self.signup_button.content.color = colors["button_text"]
+                self.signup_button.content.color = ft.Colors.ON_PRIMARY
 
         if self.login_link and isinstance(self.login_link.content, ft.Text):
-            self.login_link.content.color = colors["accent"]
+            self.login_link.content.color = ft.Colors.PRIMARY
 
         if self.title_text:
-            self.title_text.color = colors["primary_text"]
+            self.title_text.color = ft.Colors.ON_SURFACE
         if self.subtitle_text:
-            self.subtitle_text.color = colors["secondary_text"]
+            self.subtitle_text.color = ft.Colors.ON_SURFACE_VARIANT
 
         if self.theme_icon_button:
             self.theme_icon_button.style = ft.ButtonStyle(
-                color={"": colors["secondary_text"], "selected": colors["accent"]}
+                color={"": ft.Colors.ON_SURFACE_VARIANT, "selected": ft.Colors.PRIMARY}
             )
 
-        page.bgcolor = colors["primary_bg"]
-
     # Очистка страницы
     def clear_items(self):
+        for timer in self._check_timers.values():
+            timer.cancel()
+        self._check_timers.clear()
+        self.email_input.error_text = self.login_input.error_text = None
         self.email_input.value = ""
         self.login_input.value = ""
         self.password_input.value = ""
@@ -99,6 +107,43 @@ class SignupPage:
         self.message_text.value = ""
         self.loading_indicator.visible = False
 
+    def _availability_field(self, field: str) -> ft.TextField:
+        return self.email_input if field == "email" else self.login_input
+
+    # Проверка занятости email/логина во время ввода: через паузу после последнего нажатия, в потоке таймера
+    def _schedule_availability_check(self, field: str, value: str):
+        self._check_generation[field] += 1
+        timer = self._check_timers.pop(field, None)
+        if timer:
+            timer.cancel()
+        control = self._availability_field(field)
+        if control.error_text:
+            control.error_text = None
+            control.update()
+        if not value or (field == "email" and not Validation.is_valid_email(value)):
+            return
+        timer = threading.Timer(AVAILABILITY_DEBOUNCE_SECONDS, self._check_availability,
+                                args=(field, value, self._check_generation[field]))
+        timer.daemon = True
+        self._check_timers[field] = timer
+        timer.start()
+
+    def _check_availability(self, field: str, value: str, generation: int):
+        try:
+            taken = self.db.is_email_taken(value) if field == "email" else self.db.is_login_taken(value)
+        except Exception as e:
+            print(f"Ошибка проверки занятости ({field}): {e}")
+            return
+        if not taken or generation != self._check_generation[field]:
+            return
+        self._show_taken(field)
+
+    def _show_taken(self, field: str):
+        control = self._availability_field(field)
+        control.error_text = "Email уже зарегистрирован" if field == "email" else "Логин уже занят"
+        if control.page:
+            control.update()
+
     # Показ ошибки/успеха
     def _show_message(self, message: str, page: ft.Page, is_error: bool = True):
         colors = get_colors(page.theme_mode)
@@ -116,75 +161,70 @@ class SignupPage:
         page.title = "Страница регистрации"
         page.fonts = {TITLE_FONT_FAMILY: "fonts/ofont.ru_Uncage.ttf"}
         page.font_family = DEFAULT_FONT_FAMILY
-        page.theme_mode = page.client_storage.get("theme_mode") or "light"
+        apply_theme(page)
 
         # 🌗 Переключение темы
         def toggle_theme(e):
             page.theme_mode = "dark" if page.theme_mode == "light" else "light"
             page.client_storage.set("theme_mode", page.theme_mode)
             self.theme_icon_button.selected = (page.theme_mode == "dark")
-            self._update_styles(page)
             page.update()
 
-        # Валидация и регистрация
+        # Валидация и регистрация: проверки формы сразу, запись в БД и bcrypt — в фоновом потоке
         def handle_signup(e):
-            async def async_signup():
+            if self.signup_button.disabled:
+                return
+            self.message_text.visible = False
+            self.loading_indicator.visible = True
+            self.signup_button.disabled = True
+            page.update()
+
+            email = self.email_input.value.strip()
+            login = self.login_input.value.strip()
+            password = self.password_input.value
+            confirm_password = self.confirm_password_input.value
+
+            if not all([email, login, password, confirm_password]):
+                self._show_message("Все поля должны быть заполнены.", page)
+                return
+
+            if not Validation.is_valid_email(email):
+                self._show_message("Некорректный формат Email.", page)
+                return
+
+            password_errors = Validation.validate_password(password, min_length=5)
+            if password_errors:
+                self._show_message("Пароль не соответствует требованиям:\n- " + "\n- ".join(password_errors), page)
+                return
+
+            if password != confirm_password:
+                self._show_message("Пароли не совпадают.", page)
+                return
+
+            page.run_thread(signup_worker, email, login, password)
+
+        def signup_worker(email, login, password):
+            result = self.db.register_user(login, email, password)
+            if result == "email_exists":
+                self._show_taken("email")
+                self._show_message("Пользователь с таким Email уже существует.", page)
+            elif result == "login_exists":
+                self._show_taken("login")
+                self._show_message("Пользователь с таким логином уже существует.", page)
+            elif result != "ok":
+                self._show_message("Произошла ошибка при регистрации. Попробуйте позже.", page)
+            else:
+                # Очистка полей
+                self.email_input.value = ""
+                self.login_input.value = ""
+                self.password_input.value = ""
+                self.confirm_password_input.value = ""
+                self._show_message("Регистрация прошла успешно! Теперь вы можете войти.", page, is_error=False)
+                self.email_input.focus()
+                time.sleep(2)
                 self.message_text.visible = False
-                self.loading_indicator.visible = True
                 page.update()
 
-                email = self.email_input.value.strip()
-                login = self.login_input.value.strip()
-                password = self.password_input.value
-                confirm_password = self.confirm_password_input.value
-
-                if not all([email, login, password, confirm_password]):
-                    self._show_message("Все поля должны быть заполнены.", page)
-                    return
-
-                if not Validation.is_valid_email(email):
-                    self._show_message("Некорректный формат Email.", page)
-                    return
-
-                password_errors = Validation.validate_password(password, min_length=5)
-                if password_errors:
-                    self._show_message("Пароль не соответствует требованиям:\n- " + "\n- ".join(password_errors), page)
-                    return
-
-                if password != confirm_password:
-                    self._show_message("Пароли не совпадают.", page)
-                    return
-
-                if self.db.check_email(email):
-                    self._show_message("Пользователь с таким Email уже существует.", page)
-                    return
-
-                if self.db.check_login(login):
-                    self._show_message("Пользователь с таким логином уже существует.", page)
-                    return
-
-                try:
-                    self.db.insert_user(login, email, password)
-                    self._show_message("Регистрация прошла успешно! Теперь вы можете войти.", page, is_error=False)
-
-                    # Очистка полей
-                    self.email_input.value = ""
-                    self.login_input.value = ""
-                    self.password_input.value = ""
-                    self.confirm_password_input.value = ""
-                    self.email_input.focus()
-                    page.update()
-                    await asyncio.sleep(2)
-                    self.message_text.visible = False
-                    page.update()
-
-                except Exception as ex:
-                    print(f"Ошибка регистрации: {ex}")
-                    self._show_message("Произошла ошибка при регистрации. Попробуйте позже.", page)
-
-            # Запуск async-функции
-            page.run_task(async_signup)
-
         # Очистка сообщений при вводе
         def clear_error_on_change(e):
             if self.message_text.visible:
@@ -222,11 +262,20 @@ class SignupPage:
         )
         self.subtitle_text = ft.Text("Присоединяйтесь к нам!", size=16)
 
-        for field in [self.email_input, self.login_input, self.password_input, self.confirm_password_input]:
-            field.on_change = clear_error_on_change
+        def on_email_change(e):
+            clear_error_on_change(e)
+            self._schedule_availability_check("email", self.email_input.value.strip())
+
+        def on_login_change(e):
+            clear_error_on_change(e)
+            self._schedule_availability_check("login", self.login_input.value.strip())
+
+        self.password_input.on_change = self.confirm_password_input.on_change = clear_error_on_change
+        self.email_input.on_change = on_email_change
+        self.login_input.on_change = on_login_change
         self.confirm_password_input.on_submit = handle_signup
 
-        self._update_styles(page)
+        self._apply_styles()
 
         # Макет формы
         signup_form_content = ft.Column(
@@ -5,20 +5,27 @@ from pages.broadcast import BroadcastPage
 from pages.login import LoginPage
 from pages.posting import PostingPage
 from pages.profile import ProfilePage
+from pages.queue import QueuePage
+from pages.diagnostics import DiagnosticsPage
 from pages.reset_password import ResetPasswordPage
 from pages.signup import SignupPage
 from pages.dashboard import DashboardPage
+from pages.shell import AppShell
 
 class Router:
     def __init__(self, page: ft.Page):
         self.page = page
+        # Каркас один на сессию — общий для всех страниц после входа
+        self.shell = AppShell()
         self.app_routes = [
             path(url='/', clear=True, view=LoginPage().view),
             path(url='/signup', clear=True, view=SignupPage().view),
-            path(url='/dashboard', clear=True, view=DashboardPage().view),
-            path(url='/posting', clear=True, view=PostingPage().view),
-            path(url='/profile', clear=True, view=ProfilePage().view),
-            path(url='/broadcast_custom', clear=True, view=BroadcastPage().view),
+            path(url='/dashboard', clear=True, view=DashboardPage(self.shell).view),
+            path(url='/posting', clear=True, view=PostingPage(self.shell).view),
+            path(url='/profile', clear=True, view=ProfilePage(self.shell).view),
+            path(url='/broadcast_custom', clear=True, view=BroadcastPage(self.shell).view),
+            path(url='/queue', clear=True, view=QueuePage(self.shell).view),
+            path(url='/diagnostics', clear=True, view=DiagnosticsPage(self.shell).view),
             path(url='/reset', clear=True, view=ResetPasswordPage().view)
 
         ]
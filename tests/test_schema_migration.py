@@ -0,0 +1,84 @@
+import sqlite3
+import pytest
+from utils.database import Database
+
+
+# База до появления rule_id: посты двух пользователей на одно и то же время
+def _legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE admin_users (
+            id INTEGER PRIMARY KEY, login VARCHAR(50) NOT NULL UNIQUE, email VARCHAR(255) NOT NULL UNIQUE,
+            password_hash BLOB NOT NULL, avatar_url VARCHAR(255), user_telegram_token VARCHAR(255),
+            user_telegram_channel VARCHAR(255), created_at DATETIME, updated_at DATETIME
+        );
+        CREATE TABLE pending_posts (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, message TEXT NOT NULL, image_filename VARCHAR(255),
+            link_post VARCHAR(50) NOT NULL UNIQUE, scheduled_datetime DATETIME NOT NULL,
+            status VARCHAR(20) NOT NULL, created_at DATETIME
+        );
+        INSERT INTO admin_users (id, login, email, password_hash) VALUES (1, 'one', 'one@x', x'00'), (2, 'two', 'two@x', x'00');
+        INSERT INTO pending_posts (user_id, message, link_post, scheduled_datetime, status) VALUES
+            (1, 'first', 'link1', '2030-01-01 09:00:00', 'pending'),
+            (2, 'second', 'link2', '2030-01-01 09:00:00', 'pending');
+    """)
+    conn.commit()
+    conn.close()
+
+
+def _migrate(path, monkeypatch):
+    monkeypatch.setenv("DB_URL", f"sqlite:///{path}")
+    monkeypatch.setattr(Database, "_schema_ready", False)
+    Database()
+
+
+def test_rule_index_keeps_legacy_posts_at_same_time(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    _legacy_db(path)
+    _migrate(path, monkeypatch)
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT user_id, link_post, rule_id FROM pending_posts ORDER BY user_id").fetchall()
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(pending_posts)")}
+    conn.close()
+    assert rows == [(1, "link1", None), (2, "link2", None)]
+    assert "uq_pending_posts_rule_scheduled" in indexes
+
+
+# Повторные подписки старой базы: остаётся строка с минимальным id
+def test_subscriber_index_drops_repeated_subscriptions(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    _legacy_db(path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE bot_subscribers (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL,
+                                      telegram_chat_id VARCHAR(64) NOT NULL, joined_at DATETIME);
+        INSERT INTO bot_subscribers (id, user_id, telegram_chat_id) VALUES (1, 1, '100'), (2, 1, '100'), (3, 2, '100');
+    """)
+    conn.commit()
+    conn.close()
+    _migrate(path, monkeypatch)
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT id, user_id FROM bot_subscribers ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [(1, 1), (3, 2)]
+
+
+# Дубликаты под другим уникальным индексом не удаляются: миграция останавливается
+def test_other_unique_index_aborts_on_duplicates(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    _legacy_db(path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        ALTER TABLE pending_posts ADD COLUMN rule_id INTEGER;
+        UPDATE pending_posts SET rule_id = 7;
+    """)
+    conn.commit()
+    conn.close()
+    with pytest.raises(RuntimeError, match="uq_pending_posts_rule_scheduled"):
+        _migrate(path, monkeypatch)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM pending_posts").fetchone() == (2,)
+    conn.close()
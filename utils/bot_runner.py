@@ -1,10 +1,14 @@
 import re
 import sys
+import signal
 import logging
 import telebot
 from openai import OpenAI
 from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, CallbackQuery
 from utils.database import Database
+from utils.db_profiler import PROFILER
+from utils.subscription_buffer import SubscriptionBuffer
+from utils.segments import deep_link_source
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
@@ -21,11 +25,15 @@ USER_ID = int(sys.argv[2])
 
 bot = telebot.TeleBot(TOKEN, parse_mode="HTML")
 
+# Подписки/отписки пишутся в БД пачками через журнал (utils/subscription_buffer.py)
+subscriptions = SubscriptionBuffer(db, USER_ID)
+
 # Последние активные сообщения от /start
 last_start_messages = {}
 
 # Команда /start
 @bot.message_handler(commands=['start'])
+@PROFILER.flow("bot /start")
 def start_command(message: Message):
     chat_id = str(message.chat.id)
     user_id = USER_ID
@@ -44,10 +52,7 @@ def start_command(message: Message):
         return
 
     try:
-        subscribers = db.get_subscribers_by_user(user_id)
-        is_subscribed = any(str(sub.telegram_chat_id) == chat_id for sub in subscribers)
-
-        if is_subscribed:
+        if subscriptions.is_subscribed(chat_id):
             keyboard = InlineKeyboardMarkup()
             keyboard.add(InlineKeyboardButton("🚫 Отписаться", callback_data="unsubscribe"))
             sent = bot.send_message(chat_id, "🔔 Вы уже подписаны на рассылку.\nХотите отписаться?", reply_markup=keyboard)
@@ -59,8 +64,10 @@ def start_command(message: Message):
             )
             sent = bot.send_message(chat_id, "📩 Привет! Хочешь подписаться на рассылку?\nУзнать другие команды /help", reply_markup=keyboard)
 
-        # Сохраняем ID и активность сообщения
-        last_start_messages[chat_id] = {"message_id": sent.message_id, "active": True}
+        # Сохраняем ID и активность сообщения, а также язык и источник (/start <payload>) для сегментации
+        last_start_messages[chat_id] = {"message_id": sent.message_id, "active": True,
+                                        "language_code": getattr(message.from_user, "language_code", None),
+                                        "source": deep_link_source(message.text)}
 
     except Exception as e:
         logging.error(f"Ошибка обработки /start: {e}")
@@ -68,6 +75,7 @@ def start_command(message: Message):
 
 # Callback обработка кнопок
 @bot.callback_query_handler(func=lambda call: call.data in ["subscribe_yes", "subscribe_no", "unsubscribe"])
+@PROFILER.flow("bot subscription callback")
 def handle_subscription_decision(call: CallbackQuery):
     chat_id = str(call.message.chat.id)
     user_id = USER_ID
@@ -76,8 +84,7 @@ def handle_subscription_decision(call: CallbackQuery):
     logging.info(f"Callback от chat_id={chat_id}, data={data}")
 
     try:
-        subscribers = db.get_subscribers_by_user(user_id)
-        is_subscribed = any(str(sub.telegram_chat_id) == chat_id for sub in subscribers)
+        is_subscribed = subscriptions.is_subscribed(chat_id)
 
         if data == "subscribe_yes":
             if is_subscribed:
@@ -86,7 +93,10 @@ def handle_subscription_decision(call: CallbackQuery):
                                       message_id=call.message.message_id)
                 logging.info(f"Подписка уже существует: user_id={user_id}, chat_id={chat_id}")
             else:
-                db.insert_subscriber(user_id=user_id, chat_id=chat_id)
+                start = last_start_messages.get(chat_id, {})
+                subscriptions.subscribe(chat_id,
+                                        language_code=start.get("language_code") or getattr(call.from_user, "language_code", None),
+                                        source=start.get("source"))
                 bot.edit_message_text("🎉 Вы успешно подписаны на рассылку!",
                                       chat_id=call.message.chat.id,
                                       message_id=call.message.message_id)
@@ -105,7 +115,7 @@ def handle_subscription_decision(call: CallbackQuery):
                                       message_id=call.message.message_id)
                 logging.info(f"⚠️ Попытка отписки без подписки: chat_id={chat_id}")
             else:
-                db.remove_subscriber(user_id=user_id, chat_id=chat_id)
+                subscriptions.unsubscribe(chat_id)
                 bot.edit_message_text("🗑️ Вы отписались от рассылки.",
                                       chat_id=call.message.chat.id,
                                       message_id=call.message.message_id)
@@ -183,7 +193,11 @@ def help_command(message: Message):
 # Старт
 if __name__ == "__main__":
     logging.info(f"🚀 Запуск бота с token={TOKEN[:5]}..., user_id={USER_ID}")
+    # stop_bot_by_token завершает процесс через SIGTERM — успеваем сбросить буфер подписок
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     try:
         bot.infinity_polling()
     except Exception as e:
         logging.error(f"❌ Критическая ошибка запуска: {e}")
+    finally:
+        subscriptions.close()
@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+import logging
+from datetime import datetime
+from typing import Callable, Iterable, NamedTuple, Optional
+from utils.request import sendMessage, sendMediaMessage, DEAD_CHAT_FAILURES, FAILURE_RATE_LIMITED, retry_after
+from utils.metrics import BROADCAST_MESSAGES, BROADCAST_DURATION, BROADCAST_RATE
+from utils.leases import LeaseLost, LEASE_SECONDS
+from utils.segments import Segment
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Повторы одного получателя после 429 и потолок ожидания retry_after (сек)
+RATE_LIMIT_RETRIES = 3
+MAX_RETRY_AFTER = int(os.getenv("TG_MAX_RETRY_AFTER", "60"))
+
+# Рассылка через задания: подписчиков в порции и как часто (в сообщениях) сохранять прогресс порции
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "5000"))
+BROADCAST_CHECKPOINT_EVERY = int(os.getenv("BROADCAST_CHECKPOINT_EVERY", "50"))
+
+
+class BroadcastResult(NamedTuple):
+    sent: int
+    failed: int
+    elapsed: float
+    dead: int = 0
+
+
+# Недоступные чаты (бот заблокирован, чат не найден) копятся и пачками пишутся в БД.
+# После рассылки счётчик обнуляется у остальных получателей сегмента — считаются ошибки подряд.
+# Удаляет такие чаты задача prune_dead_subscribers (utils/scheduler.py)
+class DeadChatRecorder:
+    def __init__(self, db, user_id: int, segment=None, batch_size: int = 1000,
+                 after_id: int = 0, last_id: Optional[int] = None):
+        self.db = db
+        self.user_id = user_id
+        self.segment = segment
+        self.batch_size = batch_size
+        # Диапазон id подписчиков порции рассылки: обнуление счётчиков только внутри него
+        self.after_id = after_id
+        self.last_id = last_id
+        self.started = datetime.utcnow()
+        self._pending: list[str] = []
+
+    def add(self, chat_id: str):
+        self._pending.append(chat_id)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.db.record_send_failures(self.user_id, self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        if self.segment is not None:
+            self.db.reset_send_failures(self.user_id, self.segment, self.started, self.after_id, self.last_id)
+
+
+def _send(token: str, chat_id: str, message: str, media_path: Optional[str]) -> dict:
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            resp = sendMediaMessage(token, chat_id, str(media_path), message) if media_path else sendMessage(token, chat_id, message)
+        except Exception as ex:
+            logger.warning(f"Ошибка отправки {chat_id}: {ex}")
+            return {"ok": False, "description": str(ex)}
+        if resp.get("failure") != FAILURE_RATE_LIMITED or attempt == RATE_LIMIT_RETRIES:
+            return resp
+        wait = min(retry_after(resp) or 1, MAX_RETRY_AFTER)
+        logger.info(f"429 для {chat_id}, повтор через {wait} с")
+        time.sleep(wait)
+    return resp
+
+
+# Рассылка сообщения (с файлом или без) по списку чатов.
+# on_result(chat_id, response) вызывается после каждой отправки — для прогресса в UI и бенчмарков
+def broadcast(token: str, chat_ids: Iterable, message: str, media_path: Optional[str] = None,
+              delay: float = 0.0, on_result: Optional[Callable[[str, dict], None]] = None,
+              recorder: Optional[DeadChatRecorder] = None) -> BroadcastResult:
+    sent = failed = dead = 0
+    started = time.perf_counter()
+    try:
+        for chat_id in chat_ids:
+            chat_id = str(chat_id)
+            resp = _send(token, chat_id, message, media_path)
+            if resp.get("ok"):
+                sent += 1
+            else:
+                failed += 1
+                if resp.get("failure") in DEAD_CHAT_FAILURES:
+                    dead += 1
+                    if recorder:
+                        recorder.add(chat_id)
+            BROADCAST_MESSAGES.inc(outcome="ok" if resp.get("ok") else resp.get("failure") or "failed")
+            if on_result:
+                on_result(chat_id, resp)
+            if delay:
+                time.sleep(delay)
+        if recorder:
+            recorder.close()
+    finally:
+        # Прерванная рассылка: записываем уже найденные недоступные чаты, счётчики остальных не трогаем
+        if recorder:
+            recorder.flush()
+    elapsed = time.perf_counter() - started
+    BROADCAST_DURATION.observe(elapsed)
+    BROADCAST_RATE.set(sent / elapsed if elapsed else 0)
+    return BroadcastResult(sent, failed, elapsed, dead)
+
+
+# Рассылка как задание в БД: подписчики сегмента делятся на порции, порции разбирают все экземпляры
+# приложения (задача dispatch_broadcast_chunks в utils/scheduler.py)
+def enqueue_broadcast(db, user_id: int, message: str, media_path: Optional[str] = None,
+                      segment: Segment = Segment(), delay: float = 0.0,
+                      chunk_size: int = BROADCAST_CHUNK_SIZE) -> Optional[int]:
+    return db.create_broadcast_job(user_id, message, str(media_path) if media_path else None, segment,
+                                   delay_ms=int(delay * 1000), chunk_size=chunk_size)
+
+
+# Отправка арендованной порции с места, где остановился прошлый владелец (cursor_id).
+# Прогресс сохраняется каждые BROADCAST_CHECKPOINT_EVERY сообщений; если аренду перехватили — LeaseLost.
+# stop_event (остановка процесса) прерывает порцию: курсор сохраняется, аренда отпускается.
+# Сообщения между последней контрольной точкой и потерей аренды могут уйти повторно: отправка в Telegram
+# не идемпотентна, fencing защищает только записи в БД
+def run_broadcast_chunk(db, token: str, chunk, job, owner: str, lease_seconds: int = LEASE_SECONDS,
+                        stop_event: Optional[threading.Event] = None) -> BroadcastResult:
+    segment = Segment.from_json(job.segment)
+    state = {"cursor": chunk.cursor_id, "sent": chunk.sent, "failed": chunk.failed, "dead": chunk.dead, "since": 0}
+    # Счётчики ошибок обнуляются только у получателей этого запуска
+    recorder = DeadChatRecorder(db, job.user_id, segment, after_id=chunk.cursor_id, last_id=chunk.last_id)
+    stopped = False
+
+    def checkpoint():
+        if not db.checkpoint_broadcast_chunk(chunk.id, owner, chunk.fencing_token, state["cursor"],
+                                             state["sent"], state["failed"], state["dead"], lease_seconds):
+            raise LeaseLost(f"Порция {chunk.id} рассылки {job.id} перехвачена другим экземпляром")
+        state["since"] = 0
+
+    def chat_ids():
+        nonlocal stopped
+        for row in db.iter_segment_subscribers(job.user_id, segment, after_id=chunk.cursor_id, last_id=chunk.last_id):
+            if stop_event is not None and stop_event.is_set():
+                stopped = True
+                recorder.last_id = state["cursor"]
+                return
+            # Курсор сдвигается, когда предыдущий получатель уже обработан
+            yield row.telegram_chat_id
+            state["cursor"] = row.id
+            if state["since"] >= BROADCAST_CHECKPOINT_EVERY:
+                checkpoint()
+
+    def on_result(chat_id: str, resp: dict):
+        key = "sent" if resp.get("ok") else "failed"
+        state[key] += 1
+        state["dead"] += resp.get("failure") in DEAD_CHAT_FAILURES
+        state["since"] += 1
+
+    result = broadcast(token, chat_ids(), job.message, job.media_path, delay=job.delay_ms / 1000,
+                       on_result=on_result, recorder=recorder)
+    if stopped:
+        if db.release_broadcast_chunk(chunk.id, owner, chunk.fencing_token, state["cursor"],
+                                      state["sent"], state["failed"], state["dead"]):
+            logger.info(f"Порция {chunk.id} рассылки {job.id} отпущена на id {state['cursor']}")
+        return result
+    if not db.finish_broadcast_chunk(chunk.id, job.id, owner, chunk.fencing_token,
+                                     state["sent"], state["failed"], state["dead"]):
+        raise LeaseLost(f"Порция {chunk.id} рассылки {job.id} перехвачена другим экземпляром")
+    return result
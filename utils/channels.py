@@ -0,0 +1,118 @@
+import os
+import json
+import logging
+from typing import NamedTuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from utils.request import send_post, sendMediaByFileIds, file_id_rejected
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Основной канал пользователя (admin_users.user_telegram_channel) в списках channel_ids
+MAIN_CHANNEL = 0
+# Сколько каналов публикуются одновременно
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))
+
+
+class ChannelTarget(NamedTuple):
+    id: int
+    title: str
+    chat_id: str
+    token: str
+
+
+class ChannelResult(NamedTuple):
+    target: ChannelTarget
+    ok: bool
+    description: str
+
+
+# Приведение ссылки на канал к виду "@channel"; числовой id (-100...) остаётся как есть
+def normalize_channel(value: str) -> str:
+    value = (value or "").strip()
+    for prefix in ("https://t.me/", "http://t.me/", "t.me/"):
+        if value.startswith(prefix):
+            return "@" + value[len(prefix):].strip("/")
+    if value.lstrip("-").isdigit() or value.startswith("@"):
+        return value
+    return f"@{value}"
+
+
+# Каналы, куда публикуется пост: channel_ids — id из таблицы channels и MAIN_CHANNEL;
+# None — только основной канал, как до появления таблицы каналов
+def get_targets(db, user, channel_ids: Optional[list[int]] = None) -> list[ChannelTarget]:
+    targets = []
+    wanted = set(channel_ids) if channel_ids else {MAIN_CHANNEL}
+    if MAIN_CHANNEL in wanted and user.user_telegram_token and user.user_telegram_channel:
+        targets.append(ChannelTarget(MAIN_CHANNEL, "Основной канал", user.user_telegram_channel, user.user_telegram_token))
+    for channel in db.get_channels(user.id):
+        token = channel.bot_token or user.user_telegram_token
+        if channel.id in wanted and token:
+            targets.append(ChannelTarget(channel.id, channel.title, channel.chat_id, token))
+    return targets
+
+
+def parse_channel_ids(value: Optional[str]) -> Optional[list[int]]:
+    return json.loads(value) if value else None
+
+
+def _send_to_target(target: ChannelTarget, message: str, media_paths: list[str],
+                    file_ids: Optional[tuple[str, list[dict]]], cancel_event) -> ChannelResult:
+    try:
+        result = None
+        # file_id действительны только для загрузившего их бота; заново загружаем, только если не принят сам file_id
+        if file_ids and file_ids[0] == target.token:
+            result = sendMediaByFileIds(target.token, target.chat_id, file_ids[1], message)
+            if file_id_rejected(result):
+                result = None
+        if result is None:
+            result = send_post(target.token, target.chat_id, message, media_paths, cancel_event=cancel_event)
+        return ChannelResult(target, bool(result.get("ok")), result.get("description") or "")
+    except Exception as e:
+        logger.error(f"Ошибка публикации в {target.chat_id}: {e}")
+        return ChannelResult(target, False, str(e))
+
+
+# Публикация одного поста во все каналы параллельно. С медиа каждый бот сначала загружает файлы
+# в один свой канал, остальные его каналы получают пост по file_id из кэша utils/request —
+# 12 каналов одного бота это одна загрузка, а не 12. Разные боты загружают одновременно.
+# file_ids — (токен, [{"type", "file_id"}]) заранее загруженных медиа (media_file_ids поста)
+def fan_out_post(targets: list[ChannelTarget], message: str, media_paths: list[str],
+                 file_ids: Optional[tuple[str, list[dict]]] = None, cancel_event=None,
+                 on_result=None) -> list[ChannelResult]:
+    if not targets:
+        return []
+    leads, rest = [], []
+    if media_paths:
+        tokens = set() if not file_ids else {file_ids[0]}
+        for target in targets:
+            (rest if target.token in tokens else leads).append(target)
+            tokens.add(target.token)
+    else:
+        rest = list(targets)
+
+    results = {}
+
+    def send(target: ChannelTarget):
+        result = _send_to_target(target, message, media_paths, file_ids, cancel_event)
+        results[target] = result
+        if on_result:
+            on_result(result)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(FANOUT_CONCURRENCY, len(targets))),
+                            thread_name_prefix="fanout") as pool:
+        list(pool.map(send, leads))
+        if cancel_event is None or not cancel_event.is_set():
+            list(pool.map(send, rest))
+    return [results.get(target) or ChannelResult(target, False, "Отправка отменена") for target in targets]
+
+
+# Итог публикации для пользователя: "Опубликовано в 11 из 12 каналов; @x: chat not found"
+def summarize_results(results: list[ChannelResult]) -> str:
+    ok = sum(result.ok for result in results)
+    text = f"Опубликовано в {ok} из {len(results)} каналов"
+    failed = [f"{result.target.title or result.target.chat_id}: {result.description}"
+              for result in results if not result.ok]
+    if failed:
+        text += "; " + "; ".join(failed[:5]) + (f" и ещё {len(failed) - 5}" if len(failed) > 5 else "")
+    return text
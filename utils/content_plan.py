@@ -0,0 +1,222 @@
+import csv
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Iterator, NamedTuple, Optional
+from utils.function import p_link_generate
+from utils.media_processing import media_digest, TG_UPLOAD_MAX_BYTES
+from utils.request import MEDIA_GROUP_MAX
+from utils.timezones import to_utc, utc_now
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Контент-план: файл с постами на период (CSV, JSONL или JSON-массив).
+# Поля: scheduled_at — время в поясе пользователя ("2025-03-01 09:00", "01.03.2025 09:00" или ISO со смещением),
+# message — текст, media — пути к файлам через ";" (относительно файла плана) или список в JSON
+FORMATS = ("csv", "jsonl", "json")
+ASSETS = Path("assets")
+POST_IMAGES_DIR = ASSETS / "post_images"
+TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y %H:%M:%S")
+MESSAGE_MAX_LENGTH = 4096
+CAPTION_MAX_LENGTH = 1024
+# Сколько ошибок показывать пользователю
+ERRORS_LIMIT = 50
+
+
+class PlanError(NamedTuple):
+    line: int
+    message: str
+
+
+class PlanResult(NamedTuple):
+    rows: int
+    inserted: int
+    duplicates: int
+    media_files: int
+    errors: list
+    elapsed: float
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    fmt = (fmt or Path(path).suffix.lstrip(".")).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат контент-плана: {path} (нужен .csv, .jsonl или .json)")
+    return fmt
+
+
+def _read_records(path: str, fmt: str) -> Iterator[tuple[int, dict]]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        if fmt == "csv":
+            reader = csv.DictReader(file)
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+            for record in reader:
+                yield reader.line_num, record
+        elif fmt == "jsonl":
+            for line_num, line in enumerate(file, 1):
+                if line.strip():
+                    try:
+                        yield line_num, json.loads(line)
+                    except json.JSONDecodeError:
+                        yield line_num, None
+        else:
+            records = json.load(file)
+            if not isinstance(records, list):
+                raise ValueError("JSON-план должен быть массивом постов")
+            yield from enumerate(records, 1)
+
+
+# Время из плана -> UTC: без смещения — в поясе пользователя
+def _parse_time(value, tz_name: Optional[str]) -> Optional[datetime]:
+    value = str(value or "").strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return to_utc(datetime.strptime(value, fmt), tz_name)
+        except ValueError:
+            continue
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return to_utc(parsed, tz_name)
+
+
+def _media_paths(value) -> list[str]:
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value or "").split(";") if item.strip()]
+
+
+# Один проход по медиа: каждый файл хешируется один раз, одинаковое содержимое (в том числе уже
+# загруженное раньше) хранится одной копией post_images/<sha256>.<ext>
+class _MediaStore:
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir
+        self._stored: dict[Path, str] = {}
+        self.copied = 0
+
+    def resolve(self, name: str) -> Path:
+        path = Path(name).expanduser()
+        return (path if path.is_absolute() else self.base_dir / path).resolve()
+
+    def check(self, path: Path) -> Optional[str]:
+        if not path.is_file():
+            return f"файл не найден: {path}"
+        if path.stat().st_size > TG_UPLOAD_MAX_BYTES:
+            return f"файл больше {TG_UPLOAD_MAX_BYTES // 1024 ** 2} МБ: {path.name}"
+        return None
+
+    def store(self, path: Path) -> str:
+        stored = self._stored.get(path)
+        if stored is None:
+            target = POST_IMAGES_DIR / f"{media_digest(path)[:32]}{path.suffix.lower()}"
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy(str(path), str(target))
+                self.copied += 1
+            stored = str(target.relative_to(ASSETS))
+            self._stored[path] = stored
+        return stored
+
+
+# Проверка всего плана, затем одна транзакция на все посты и одна постановка в таймер.
+# При любой ошибке в плане ничего не сохраняется. Посты, уже запланированные на то же время
+# с тем же текстом, пропускаются — повторный импорт того же плана ничего не дублирует
+def import_content_plan(db, user_id: int, path: str, tz_name: Optional[str] = None,
+                        fmt: Optional[str] = None, dry_run: bool = False) -> PlanResult:
+    from utils.scheduler import schedule_posts
+
+    fmt = detect_format(path, fmt)
+    started = time.perf_counter()
+    media = _MediaStore(Path(path).resolve().parent)
+    now = utc_now()
+    errors, posts, seen = [], [], set()
+    rows = 0
+    for line, record in _read_records(path, fmt):
+        rows += 1
+        if not isinstance(record, dict):
+            errors.append(PlanError(line, "строка не является объектом"))
+            continue
+        record = {str(key).strip().lower(): value for key, value in record.items()}
+        message = str(record.get("message") or record.get("text") or "").strip()
+        scheduled_at = _parse_time(record.get("scheduled_at") or record.get("datetime"), tz_name)
+        media_paths = [media.resolve(name) for name in _media_paths(record.get("media"))]
+        problems = []
+        if scheduled_at is None:
+            problems.append("неверное время scheduled_at")
+        elif scheduled_at <= now:
+            problems.append("время в прошлом")
+        if not message and not media_paths:
+            problems.append("пустой пост: нет ни текста, ни файлов")
+        if len(media_paths) > MEDIA_GROUP_MAX:
+            problems.append(f"больше {MEDIA_GROUP_MAX} файлов")
+        limit = CAPTION_MAX_LENGTH if media_paths else MESSAGE_MAX_LENGTH
+        if len(message) > limit:
+            problems.append(f"текст длиннее {limit} символов")
+        problems.extend(error for error in map(media.check, media_paths) if error)
+        if problems:
+            errors.append(PlanError(line, "; ".join(problems)))
+            continue
+        key = (scheduled_at, message, tuple(media_paths))
+        if key in seen:
+            continue
+        seen.add(key)
+        posts.append((scheduled_at, message, media_paths))
+
+    if errors or not posts:
+        return PlanResult(rows, 0, rows - len(errors) - len(posts), 0, errors[:ERRORS_LIMIT],
+                          time.perf_counter() - started)
+
+    existing = db.get_pending_post_keys(user_id, min(post[0] for post in posts), max(post[0] for post in posts))
+    batch = []
+    for scheduled_at, message, media_paths in posts:
+        if (scheduled_at, message) in existing:
+            continue
+        stored = [] if dry_run else [media.store(media_path) for media_path in media_paths]
+        batch.append({"user_id": user_id, "message": message, "scheduled_datetime": scheduled_at,
+                      "image_filename": stored[0] if len(stored) == 1 else None,
+                      "media_files": json.dumps(stored, ensure_ascii=False) if len(stored) > 1 else None,
+                      "link_post": p_link_generate(10)})
+    if batch and not dry_run:
+        db.insert_pending_posts_batch(batch)
+        schedule_posts([(row["scheduled_datetime"], row["link_post"]) for row in batch])
+    elapsed = time.perf_counter() - started
+    result = PlanResult(rows, len(batch), rows - len(batch), media.copied, [], elapsed)
+    logger.info(f"Контент-план user_id={user_id}: строк {rows}, запланировано {len(batch)}, "
+                f"пропущено {result.duplicates}, новых файлов {media.copied}, {elapsed:.2f} с")
+    return result
+
+
+# Запуск: python -m utils.content_plan --user-id N plan.csv|plan.jsonl|plan.json
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт контент-плана (CSV/JSONL/JSON) в очередь постов")
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--dry-run", action="store_true", help="только проверить план")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from utils.database import Database
+    db = Database()
+    user = db.get_user_by_id(args.user_id)
+    if not user:
+        print(f"Пользователь {args.user_id} не найден")
+        return 1
+    result = import_content_plan(db, args.user_id, args.path, user.timezone, args.format, args.dry_run)
+    for error in result.errors:
+        print(f"строка {error.line}: {error.message}")
+    print(f"строк {result.rows}, запланировано {result.inserted}, пропущено {result.duplicates}, "
+          f"ошибок {len(result.errors)}, новых файлов {result.media_files}, {result.elapsed:.2f} с")
+    return 1 if result.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
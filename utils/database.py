@@ -1,42 +1,77 @@
 from sqlalchemy import (
-    create_engine, Table, MetaData, select, insert, update,
-    Column, LargeBinary, Integer, String, Text, DateTime, ForeignKey, and_
+    create_engine, event, Table, MetaData, select, insert, update, inspect, text, type_coerce,
+    Column, LargeBinary, Integer, String, Text, DateTime, ForeignKey, Index, and_, or_, func, exists, literal, bindparam
 )
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 from utils.function import hash_password_bcrypt, verify_password_bcrypt, p_link_generate
+from utils.metrics import DB_QUERY_SECONDS
+from utils.db_profiler import PROFILER, profile_methods
+from utils.segments import Segment
+from utils.timezones import to_utc
+from utils.token_crypto import EncryptedToken, FERNET_PREFIX, encryption_enabled, token_fingerprint
+import json
 import os
+import time
+import threading
+import weakref
 
 load_dotenv()
 
+# Публичные методы обёрнуты профилировщиком (utils/db_profiler.py, включается DB_PROFILE=1)
+@profile_methods
 class Database:
+    _schema_ready = False
+    _schema_lock = threading.Lock()
+    _user_caches = weakref.WeakSet()
+    # Уникальные индексы, перед созданием которых дубликаты удаляются (повторные подписки в старых базах)
+    DEDUPE_INDEXES = {"uq_bot_subscribers_user_chat"}
+
     def __init__(self):
         self._load_env()
         self.engine = self._connect()
         self.metadata = MetaData()
         self._define_tables()
+        self._ensure_schema()
         self.Session = sessionmaker(bind=self.engine)
 
     def _load_env(self):
+        # DB_URL (необязательно) — полный SQLAlchemy URL, например для бенчмарков на SQLite
+        self.db_url = os.getenv("DB_URL")
         self.db_host = os.getenv("DB_HOST")
         self.db_user = os.getenv("DB_USER")
         self.db_password = os.getenv("DB_PASSWORD")
         self.db_name = os.getenv("DB_NAME")
-        if not all([self.db_host, self.db_user, self.db_name]):
+        if not self.db_url and not all([self.db_host, self.db_user, self.db_name]):
             raise ValueError("Не все переменные окружения БД определены.")
 
     def _connect(self):
-        url = f"mysql+pymysql://{self.db_user}:{self.db_password}@{self.db_host}/{self.db_name}?charset=utf8mb4"
+        url = self.db_url or f"mysql+pymysql://{self.db_user}:{self.db_password}@{self.db_host}/{self.db_name}?charset=utf8mb4"
         try:
             engine = create_engine(url)
+            self._track_query_time(engine)
+            PROFILER.attach(engine)
             with engine.connect():
                 pass
             return engine
         except Exception as e:
             raise ConnectionError(f"Ошибка подключения к БД: {e}")
 
+    # Время SQL-запросов в метрику db_query_seconds по типу запроса (SELECT, INSERT, ...)
+    @staticmethod
+    def _track_query_time(engine):
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            context._query_started = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            DB_QUERY_SECONDS.observe(time.perf_counter() - context._query_started, operation=operation)
+
     def _define_tables(self):
         self.adminUserTable = Table(
             'admin_users', self.metadata,
@@ -45,10 +80,16 @@ class Database:
             Column('email', String(255), nullable=False, unique=True),
             Column('password_hash', LargeBinary(60), nullable=False),
             Column('avatar_url', String(255)),
-            Column('user_telegram_token', String(255)),
+            # Токен бота; при заданном TOKEN_ENCRYPTION_KEY хранится зашифрованным (utils/token_crypto.py)
+            Column('user_telegram_token', EncryptedToken(255)),
+            # sha256 токена: поиск владельца по индексу (по шифротексту искать нельзя)
+            Column('token_fingerprint', String(64)),
             Column('user_telegram_channel', String(255)),
+            # Часовой пояс IANA (Europe/Moscow); пусто — DEFAULT_TIMEZONE (utils/timezones.py)
+            Column('timezone', String(64)),
             Column('created_at', DateTime, default=dt.utcnow),
             Column('updated_at', DateTime, default=dt.utcnow, onupdate=dt.utcnow),
+            Index('ix_admin_users_token_fingerprint', 'token_fingerprint'),
         )
         self.postPendingTable = Table(
             'pending_posts', self.metadata,
@@ -56,10 +97,63 @@ class Database:
             Column('user_id', Integer, ForeignKey('admin_users.id', ondelete="CASCADE"), nullable=False),
             Column('message', Text, nullable=False),
             Column('image_filename', String(255)),
+            Column('media_files', Text),
             Column('link_post', String(50), nullable=False, unique=True),
+            # Время отправки в UTC
             Column('scheduled_datetime', DateTime, nullable=False),
             Column('status', String(20), nullable=False, default='pending'),
             Column('created_at', DateTime, default=dt.utcnow),
+            Column('media_file_ids', Text),
+            # Неудачные предзагрузки медиа подряд и время следующей попытки (экспоненциальная пауза)
+            Column('prewarm_failures', Integer, nullable=False, server_default='0'),
+            Column('prewarm_retry_at', DateTime),
+            # Аренда на время отправки (status='sending'): кто отправляет, до какого момента, fencing-токен
+            Column('lease_owner', String(64)),
+            Column('lease_expires_at', DateTime),
+            Column('fencing_token', Integer, nullable=False, server_default='0'),
+            # Каналы поста: JSON-список id из channels, 0 — основной канал пользователя; пусто — только основной
+            Column('channel_ids', Text),
+            # Пост, созданный правилом повтора (post_rules); одно срабатывание правила — одна строка
+            Column('rule_id', Integer, ForeignKey('post_rules.id', ondelete="SET NULL")),
+            Index('ix_pending_posts_status_scheduled', 'status', 'scheduled_datetime'),
+            Index('uq_pending_posts_rule_scheduled', 'rule_id', 'scheduled_datetime', unique=True),
+            Index('ix_pending_posts_status_lease', 'status', 'lease_expires_at'),
+            # Очередь постов пользователя: постраничный вывод по ключу (scheduled_datetime, id)
+            Index('ix_pending_posts_user_scheduled', 'user_id', 'scheduled_datetime', 'id'),
+            Index('ix_pending_posts_user_status_scheduled', 'user_id', 'status', 'scheduled_datetime', 'id'),
+        )
+        # Дополнительные каналы пользователя; bot_token пустой — публикует основной бот пользователя
+        self.channelsTable = Table(
+            'channels', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', Integer, ForeignKey('admin_users.id', ondelete="CASCADE"), nullable=False),
+            Column('title', String(100), nullable=False),
+            Column('chat_id', String(255), nullable=False),
+            Column('bot_token', EncryptedToken(255)),
+            Column('created_at', DateTime, default=dt.utcnow),
+            Index('uq_channels_user_chat', 'user_id', 'chat_id', unique=True),
+        )
+        # Правила повтора постов: посты создаются только на ближайшее окно (RULE_WINDOW_HOURS),
+        # next_fire_at — первое ещё не созданное срабатывание (UTC)
+        self.postRulesTable = Table(
+            'post_rules', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', Integer, ForeignKey('admin_users.id', ondelete="CASCADE"), nullable=False),
+            Column('message', Text, nullable=False),
+            Column('image_filename', String(255)),
+            Column('media_files', Text),
+            Column('channel_ids', Text),
+            Column('kind', String(20), nullable=False),
+            Column('cron', String(100)),
+            Column('interval_minutes', Integer),
+            Column('timezone', String(64)),
+            Column('starts_at', DateTime, nullable=False),
+            Column('ends_at', DateTime),
+            Column('next_fire_at', DateTime),
+            Column('active', Integer, nullable=False, server_default='1'),
+            Column('created_at', DateTime, default=dt.utcnow),
+            Index('ix_post_rules_active_next', 'active', 'next_fire_at'),
+            Index('ix_post_rules_user', 'user_id', 'id'),
         )
         self.botSubscribersTable = Table(
             'bot_subscribers', self.metadata,
@@ -67,11 +161,193 @@ class Database:
             Column('user_id', Integer, ForeignKey('admin_users.id', ondelete="CASCADE"), nullable=False),
             Column('telegram_chat_id', String(64), nullable=False),
             Column('joined_at', DateTime, default=dt.utcnow),
+            # Сегментация: язык клиента Telegram и параметр deep-link из /start <payload>
+            Column('language_code', String(16)),
+            Column('source', String(64)),
+            # Подряд неудачных рассылок с постоянной ошибкой (бот заблокирован, чат не найден)
+            Column('failure_count', Integer, nullable=False, server_default='0'),
+            Column('last_failure_at', DateTime),
+            # Помечен недоступным (SUBSCRIBER_PRUNE_MODE=mark): в рассылки не попадает
+            Column('inactive_since', DateTime),
+            # Один подписчик на бота: по ключу работают INSERT IGNORE и пакетный импорт
+            Index('uq_bot_subscribers_user_chat', 'user_id', 'telegram_chat_id', unique=True),
+            # Выборка сегмента порциями по id внутри фильтра
+            Index('ix_bot_subscribers_user_id', 'user_id', 'id'),
+            Index('ix_bot_subscribers_user_language', 'user_id', 'language_code', 'id'),
+            Index('ix_bot_subscribers_user_source', 'user_id', 'source', 'id'),
+            Index('ix_bot_subscribers_user_joined', 'user_id', 'joined_at'),
+            Index('ix_bot_subscribers_failures', 'failure_count'),
+        )
+        # Рассылка как задание: получатели разбиты на диапазоны id, которые разбирают экземпляры приложения
+        self.broadcastJobsTable = Table(
+            'broadcast_jobs', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', Integer, ForeignKey('admin_users.id', ondelete="CASCADE"), nullable=False),
+            Column('message', Text),
+            Column('media_path', String(255)),
+            Column('segment', Text),
+            Column('delay_ms', Integer, nullable=False, server_default='0'),
+            Column('total', Integer, nullable=False, server_default='0'),
+            Column('status', String(20), nullable=False, server_default='pending'),
+            Column('created_at', DateTime, default=dt.utcnow),
+            Column('finished_at', DateTime),
         )
+        self.broadcastChunksTable = Table(
+            'broadcast_chunks', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('job_id', Integer, ForeignKey('broadcast_jobs.id', ondelete="CASCADE"), nullable=False),
+            Column('first_id', Integer, nullable=False),
+            Column('last_id', Integer, nullable=False),
+            # Последний обработанный подписчик: после перехвата аренды отправка продолжается с него
+            Column('cursor_id', Integer, nullable=False),
+            Column('sent', Integer, nullable=False, server_default='0'),
+            Column('failed', Integer, nullable=False, server_default='0'),
+            Column('dead', Integer, nullable=False, server_default='0'),
+            Column('status', String(20), nullable=False, server_default='pending'),
+            Column('lease_owner', String(64)),
+            Column('lease_expires_at', DateTime),
+            Column('fencing_token', Integer, nullable=False, server_default='0'),
+            Index('ix_broadcast_chunks_status_lease', 'status', 'lease_expires_at'),
+            Index('ix_broadcast_chunks_job', 'job_id', 'status'),
+        )
+        # Аренда бота: getUpdates по одному токену может опрашивать только один процесс,
+        # поэтому bot_runner для токена запускает лишь экземпляр, владеющий арендой
+        self.botLeasesTable = Table(
+            'bot_leases', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('token_fingerprint', String(64), nullable=False),
+            Column('lease_owner', String(64)),
+            Column('lease_expires_at', DateTime),
+            Index('uq_bot_leases_token', 'token_fingerprint', unique=True),
+        )
+        self.subscriberTagsTable = Table(
+            'subscriber_tags', self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('subscriber_id', Integer, ForeignKey('bot_subscribers.id', ondelete="CASCADE"), nullable=False),
+            Column('tag', String(64), nullable=False),
+            Index('uq_subscriber_tags_subscriber_tag', 'subscriber_id', 'tag', unique=True),
+            Index('ix_subscriber_tags_tag', 'tag', 'subscriber_id'),
+        )
+
+    # Создание недостающих таблиц, колонок и индексов (один раз на процесс)
+    def _ensure_schema(self):
+        with Database._schema_lock:
+            if Database._schema_ready:
+                return
+            existing_tables = set(inspect(self.engine).get_table_names())
+            self.metadata.create_all(self.engine, checkfirst=True)
+            inspector = inspect(self.engine)
+            added = set()
+            for table in self.metadata.sorted_tables:
+                existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing_columns:
+                        ddl = CreateColumn(column).compile(dialect=self.engine.dialect)
+                        with self.engine.begin() as conn:
+                            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                        added.add(f"{table.name}.{column.name}")
+                existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing_indexes:
+                        if index.unique:
+                            self._drop_duplicates(table, index)
+                        index.create(self.engine)
+            # Появление admin_users.timezone — признак базы, где время постов записано в поясе
+            # прежнего планировщика (BackgroundScheduler(timezone='Europe/Moscow'), DEFAULT_TIMEZONE)
+            if "admin_users.timezone" in added and "pending_posts" in existing_tables:
+                self._migrate_post_times_to_utc()
+            self._migrate_bot_tokens()
+            Database._schema_ready = True
+
+    # Однократный перевод scheduled_datetime из DEFAULT_TIMEZONE в UTC (не из пояса сервера: прежний
+    # планировщик читал naive-время как Europe/Moscow независимо от настроек хоста)
+    def _migrate_post_times_to_utc(self, batch_size: int = 1000):
+        t = self.postPendingTable
+        last_id, converted = 0, 0
+        while True:
+            with self.engine.begin() as conn:
+                rows = conn.execute(
+                    select(t.c.id, t.c.scheduled_datetime).where(t.c.id > last_id).order_by(t.c.id).limit(batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                conn.execute(
+                    update(t).where(t.c.id == bindparam("post_id")).values(scheduled_datetime=bindparam("utc")),
+                    [{"post_id": row.id, "utc": to_utc(row.scheduled_datetime, None)} for row in rows]
+                )
+            last_id = rows[-1].id
+            converted += len(rows)
+        if converted:
+            print(f"Время {converted} постов переведено в UTC")
+
+    # Отпечатки для токенов без них и шифрование токенов, записанных открытым текстом
+    # (до появления колонки или до задания TOKEN_ENCRYPTION_KEY). Колонка читается как есть, без расшифровки
+    def _migrate_bot_tokens(self):
+        migrated = 0
+        for table, column in ((self.adminUserTable, 'user_telegram_token'), (self.channelsTable, 'bot_token')):
+            raw = type_coerce(table.c[column], String)
+            has_fingerprint = 'token_fingerprint' in table.c
+            conditions = [table.c.token_fingerprint.is_(None)] if has_fingerprint else []
+            if encryption_enabled():
+                conditions.append(raw.not_like(f"{FERNET_PREFIX}%"))
+            if not conditions:
+                continue
+            with self.engine.begin() as conn:
+                rows = conn.execute(
+                    select(table.c.id, table.c[column]).where(and_(raw.isnot(None), raw != '', or_(*conditions)))
+                ).fetchall()
+                for row_id, token in rows:
+                    # None — не удалось расшифровать (другой ключ): строку не трогаем
+                    if token is None:
+                        continue
+                    values = {column: token}
+                    if has_fingerprint:
+                        values['token_fingerprint'] = token_fingerprint(token)
+                    conn.execute(update(table).where(table.c.id == row_id).values(values))
+                    migrated += 1
+        if migrated:
+            print(f"Обновлено хранение токенов ботов: {migrated}")
+
+    # Перед созданием уникального индекса из DEDUPE_INDEXES оставляем по одной строке (с минимальным id)
+    # на ключ; удалённые id пишутся в лог. Для остальных индексов дубликаты — ошибка миграции, строки
+    # не удаляются. Строки с NULL в ключе не трогаются: уникальный индекс допускает несколько NULL
+    def _drop_duplicates(self, table, index, chunk_size: int = 500):
+        columns = list(index.columns)
+        keyed = and_(*[column.is_not(None) for column in columns])
+        keep = select(func.min(table.c.id).label("id")).where(keyed).group_by(*columns).subquery()
+        with self.engine.begin() as conn:
+            ids = list(conn.execute(
+                select(table.c.id).where(and_(keyed, table.c.id.not_in(select(keep.c.id)))).order_by(table.c.id)
+            ).scalars())
+            if not ids:
+                return
+            if index.name not in self.DEDUPE_INDEXES:
+                raise RuntimeError(f"Нельзя создать уникальный индекс {index.name}: в {table.name} {len(ids)} "
+                                   f"повторяющихся строк (id {ids[:20]}). Удалите их вручную и перезапустите")
+            for i in range(0, len(ids), chunk_size):
+                conn.execute(table.delete().where(table.c.id.in_(ids[i:i + chunk_size])))
+        print(f"Удалено дубликатов из {table.name} перед созданием {index.name}: {len(ids)} (id {ids})")
 
     def _get_session(self):
         return self.Session()
 
+    # INSERT с пропуском строк, нарушающих уникальный ключ (MySQL: IGNORE, SQLite: OR IGNORE)
+    def _insert_ignore(self, table):
+        return insert(table).prefix_with("OR IGNORE" if self.engine.dialect.name == "sqlite" else "IGNORE")
+
+    # Кэши профилей (UserCache), которые нужно сбрасывать при изменении admin_users
+    @classmethod
+    def register_user_cache(cls, cache):
+        cls._user_caches.add(cache)
+
+    def _notify_user_changed(self, user_id: int | None = None, email: str | None = None):
+        for cache in list(Database._user_caches):
+            cache.invalidate(user_id=user_id, email=email)
+
+    def _notify_channels_changed(self, user_id: int):
+        for cache in list(Database._user_caches):
+            cache.invalidate_channels(user_id)
+
     # Пользователи
 
     def authorization(self, email: str, plain_password: str):
@@ -102,6 +378,39 @@ class Database:
         finally:
             session.close()
 
+    # Регистрация одной транзакцией: занятость email и логина проверяют уникальные индексы, а не
+    # предварительные SELECT — нет лишних запросов и гонки между проверкой и вставкой.
+    # Возвращает "ok", "email_exists", "login_exists" или False
+    def register_user(self, login: str, email: str, password: str):
+        # bcrypt — сотни миллисекунд, считаем до открытия транзакции
+        password_hash = hash_password_bcrypt(password)
+        session = self._get_session()
+        try:
+            session.execute(insert(self.adminUserTable).values(
+                login=login, email=email, password_hash=password_hash,
+                created_at=dt.utcnow(), updated_at=dt.utcnow()
+            ))
+            session.commit()
+            return "ok"
+        except IntegrityError as e:
+            session.rollback()
+            # Имя нарушенного ключа — после значения, которое само может содержать "email":
+            # MySQL: Duplicate entry '...' for key 'admin_users.email'; SQLite: UNIQUE constraint failed: admin_users.email
+            error = str(e.orig).lower()
+            key = error.rsplit("for key", 1)[-1] if "for key" in error else error.rsplit("failed:", 1)[-1]
+            if "email" in key:
+                return "email_exists"
+            if "login" in key:
+                return "login_exists"
+            print(f"Ошибка регистрации пользователя: {e}")
+            return False
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка регистрации пользователя: {e}")
+            return False
+        finally:
+            session.close()
+
     def get_user_by_id(self, user_id: int):
         with self._get_session() as session:
             return session.execute(
@@ -117,16 +426,33 @@ class Database:
     def check_email(self, email: str):
         return self.get_user_by_email(email)
 
+    # Проверка занятости при вводе на странице регистрации: только индекс, без чтения строки
+    def is_email_taken(self, email: str) -> bool:
+        with self._get_session() as session:
+            return session.execute(
+                select(self.adminUserTable.c.id).where(self.adminUserTable.c.email == email).limit(1)
+            ).first() is not None
+
+    def is_login_taken(self, login: str) -> bool:
+        with self._get_session() as session:
+            return session.execute(
+                select(self.adminUserTable.c.id).where(self.adminUserTable.c.login == login).limit(1)
+            ).first() is not None
+
     def check_login(self, login: str):
         with self._get_session() as session:
             return session.execute(
                 select(self.adminUserTable).where(self.adminUserTable.c.login == login)
             ).fetchone()
 
+    # Владелец токена по индексу token_fingerprint: сам токен в БД может быть зашифрован
     def get_admin_by_token(self, token: str):
+        fingerprint = token_fingerprint(token)
+        if not fingerprint:
+            return None
         with self._get_session() as session:
             return session.execute(
-                select(self.adminUserTable).where(self.adminUserTable.c.user_telegram_token == token)
+                select(self.adminUserTable).where(self.adminUserTable.c.token_fingerprint == fingerprint).limit(1)
             ).fetchone()
 
     def update_user_avatar(self, user_id: int, avatar_url: str | None):
@@ -154,9 +480,64 @@ class Database:
     def update_user_telegram_settings(self, user_id: int, token: str | None, channel: str | None):
         return self._update_user(user_id, {
             "user_telegram_token": token,
+            "token_fingerprint": token_fingerprint(token),
             "user_telegram_channel": channel
         })
 
+    # Пользователи с настроенным ботом: (id, user_telegram_token) для супервизора ботов в python -m worker
+    def get_users_with_bot_token(self) -> list:
+        t = self.adminUserTable
+        with self._get_session() as session:
+            return session.execute(
+                select(t.c.id, t.c.user_telegram_token)
+                .where(and_(t.c.user_telegram_token.isnot(None), t.c.user_telegram_token != ''))
+            ).fetchall()
+
+    def get_channels(self, user_id: int) -> list:
+        with self._get_session() as session:
+            return session.execute(
+                select(self.channelsTable).where(self.channelsTable.c.user_id == user_id).order_by(self.channelsTable.c.id)
+            ).fetchall()
+
+    # Новый канал; "channel_exists" — канал уже добавлен этим пользователем
+    def add_channel(self, user_id: int, title: str, chat_id: str, bot_token: str | None = None):
+        session = self._get_session()
+        try:
+            result = session.execute(insert(self.channelsTable).values(
+                user_id=user_id, title=title, chat_id=chat_id, bot_token=bot_token or None, created_at=dt.utcnow()
+            ))
+            session.commit()
+            self._notify_channels_changed(user_id)
+            return result.inserted_primary_key[0]
+        except IntegrityError:
+            session.rollback()
+            return "channel_exists"
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка добавления канала: {e}")
+            return None
+        finally:
+            session.close()
+
+    def delete_channel(self, channel_id: int, user_id: int) -> bool:
+        session = self._get_session()
+        try:
+            result = session.execute(self.channelsTable.delete().where(and_(
+                self.channelsTable.c.id == channel_id, self.channelsTable.c.user_id == user_id
+            )))
+            session.commit()
+            self._notify_channels_changed(user_id)
+            return result.rowcount > 0
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка удаления канала: {e}")
+            return False
+        finally:
+            session.close()
+
+    def update_user_timezone(self, user_id: int, tz_name: str | None):
+        return self._update_user(user_id, {"timezone": tz_name})
+
     def verify_user_password(self, user_id: int, plain_password: str) -> bool:
         user = self.get_user_by_id(user_id)
         return verify_password_bcrypt(plain_password, user.password_hash) if user else False
@@ -169,6 +550,7 @@ class Database:
                 update(self.adminUserTable).where(self.adminUserTable.c.id == user_id).values(**fields)
             )
             session.commit()
+            self._notify_user_changed(user_id=user_id)
             return True
         except Exception as e:
             session.rollback()
@@ -185,6 +567,7 @@ class Database:
                 update(self.adminUserTable).where(self.adminUserTable.c.email == email).values(**fields)
             )
             session.commit()
+            self._notify_user_changed(email=email)
             return True
         except Exception as e:
             session.rollback()
@@ -199,11 +582,11 @@ class Database:
         session = self._get_session()
         try:
             session.execute(
-                insert(self.botSubscribersTable).values(
+                self._insert_ignore(self.botSubscribersTable).values(
                     user_id=user_id,
                     telegram_chat_id=chat_id,
                     joined_at=dt.utcnow()
-                ).prefix_with("IGNORE")
+                )
             )
             session.commit()
         except Exception as e:
@@ -218,6 +601,275 @@ class Database:
                 select(self.botSubscribersTable).where(self.botSubscribersTable.c.user_id == user_id)
             ).fetchall()
 
+    # Пакетная вставка в одной транзакции (executemany → многострочный INSERT); возвращает число новых строк.
+    # rows: [{"user_id", "telegram_chat_id", "joined_at"}, ...], дубликаты пропускаются
+    def insert_subscribers_batch(self, rows: list[dict]) -> int:
+        if not rows:
+            return 0
+        session = self._get_session()
+        try:
+            result = session.execute(self._insert_ignore(self.botSubscribersTable), rows)
+            session.commit()
+            return max(result.rowcount, 0)
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка пакетного добавления подписчиков: {e}")
+            raise
+        finally:
+            session.close()
+
+    # Чат, помеченный недоступным, не считается подписанным: /start предложит подписаться заново,
+    # и подписка снимет пометку (apply_subscription_changes)
+    def is_subscriber(self, user_id: int, chat_id: str) -> bool:
+        with self._get_session() as session:
+            return session.execute(
+                select(self.botSubscribersTable.c.id).where(and_(
+                    self.botSubscribersTable.c.user_id == user_id,
+                    self.botSubscribersTable.c.telegram_chat_id == chat_id,
+                    self.botSubscribersTable.c.inactive_since.is_(None)
+                )).limit(1)
+            ).first() is not None
+
+    # Пачка подписок и отписок одной транзакцией (буфер bot_runner, utils/subscription_buffer.py)
+    def apply_subscription_changes(self, user_id: int, subscribed: list[dict], unsubscribed: list[str],
+                                   chunk_size: int = 1000):
+        session = self._get_session()
+        try:
+            if subscribed:
+                session.execute(self._insert_ignore(self.botSubscribersTable), subscribed)
+                # Повторная подписка возвращает чат, помеченный недоступным
+                chat_ids = [row["telegram_chat_id"] for row in subscribed]
+                for i in range(0, len(chat_ids), chunk_size):
+                    session.execute(self.botSubscribersTable.update().where(and_(
+                        self.botSubscribersTable.c.user_id == user_id,
+                        self.botSubscribersTable.c.telegram_chat_id.in_(chat_ids[i:i + chunk_size]),
+                        or_(self.botSubscribersTable.c.failure_count > 0,
+                            self.botSubscribersTable.c.inactive_since.is_not(None))
+                    )).values(failure_count=0, last_failure_at=None, inactive_since=None))
+            for i in range(0, len(unsubscribed), chunk_size):
+                session.execute(self.botSubscribersTable.delete().where(and_(
+                    self.botSubscribersTable.c.user_id == user_id,
+                    self.botSubscribersTable.c.telegram_chat_id.in_(unsubscribed[i:i + chunk_size])
+                )))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка записи подписок: {e}")
+            raise
+        finally:
+            session.close()
+
+    # Подписчики бота порциями по id — выгрузка любого объёма без загрузки всей таблицы в память
+    def iter_subscribers(self, user_id: int, batch_size: int = 5000):
+        last_id = 0
+        while True:
+            with self._get_session() as session:
+                rows = session.execute(
+                    select(self.botSubscribersTable)
+                    .where(and_(self.botSubscribersTable.c.user_id == user_id,
+                                self.botSubscribersTable.c.id > last_id))
+                    .order_by(self.botSubscribersTable.c.id)
+                    .limit(batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1].id
+
+    # Теги подписчикам по chat_id одним INSERT ... SELECT; уже назначенные пропускаются
+    def tag_subscribers(self, user_id: int, tag: str, chat_ids: list[str]) -> int:
+        if not chat_ids:
+            return 0
+        subs = self.botSubscribersTable
+        session = self._get_session()
+        try:
+            result = session.execute(
+                self._insert_ignore(self.subscriberTagsTable).from_select(
+                    ['subscriber_id', 'tag'],
+                    select(subs.c.id, literal(tag)).where(and_(subs.c.user_id == user_id,
+                                                               subs.c.telegram_chat_id.in_(chat_ids)))
+                )
+            )
+            session.commit()
+            return max(result.rowcount, 0)
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка назначения тега: {e}")
+            raise
+        finally:
+            session.close()
+
+    # Теги для пачки подписчиков: id подписчика -> [теги]
+    def get_subscriber_tags(self, subscriber_ids: list[int]) -> dict[int, list[str]]:
+        if not subscriber_ids:
+            return {}
+        tags = {}
+        with self._get_session() as session:
+            for row in session.execute(
+                select(self.subscriberTagsTable.c.subscriber_id, self.subscriberTagsTable.c.tag)
+                .where(self.subscriberTagsTable.c.subscriber_id.in_(subscriber_ids))
+            ):
+                tags.setdefault(row.subscriber_id, []).append(row.tag)
+        return tags
+
+    # Условия сегмента для WHERE: всё считает БД, в Python фильтрации нет
+    def _segment_conditions(self, user_id: int, segment: Segment) -> list:
+        subs, tags = self.botSubscribersTable, self.subscriberTagsTable
+        conditions = [subs.c.user_id == user_id, subs.c.inactive_since.is_(None)]
+        if segment.language_code:
+            conditions.append(subs.c.language_code == segment.language_code)
+        if segment.source:
+            conditions.append(subs.c.source == segment.source)
+        if segment.joined_from:
+            conditions.append(subs.c.joined_at >= segment.joined_from)
+        if segment.joined_to:
+            conditions.append(subs.c.joined_at < segment.joined_to)
+        if segment.tags:
+            conditions.append(exists().where(and_(tags.c.subscriber_id == subs.c.id, tags.c.tag.in_(segment.tags))))
+        return conditions
+
+    def count_segment(self, user_id: int, segment: Segment = Segment()) -> int:
+        with self._get_session() as session:
+            return session.execute(
+                select(func.count()).select_from(self.botSubscribersTable)
+                .where(and_(*self._segment_conditions(user_id, segment)))
+            ).scalar() or 0
+
+    # chat_id сегмента порциями по id: один и тот же запрос с курсором, соединение не держится
+    # открытым на всё время рассылки (в отличие от серверного курсора)
+    def iter_segment_chat_ids(self, user_id: int, segment: Segment = Segment(), batch_size: int = 5000):
+        for row in self.iter_segment_subscribers(user_id, segment, batch_size=batch_size):
+            yield row.telegram_chat_id
+
+    # Строки (id, telegram_chat_id) сегмента, при необходимости в диапазоне id (after_id, last_id]
+    def iter_segment_subscribers(self, user_id: int, segment: Segment = Segment(), after_id: int = 0,
+                                 last_id: int | None = None, batch_size: int = 5000):
+        subs = self.botSubscribersTable
+        conditions = self._segment_conditions(user_id, segment)
+        if last_id is not None:
+            conditions.append(subs.c.id <= last_id)
+        while True:
+            with self._get_session() as session:
+                rows = session.execute(
+                    select(subs.c.id, subs.c.telegram_chat_id)
+                    .where(and_(subs.c.id > after_id, *conditions))
+                    .order_by(subs.c.id)
+                    .limit(batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            after_id = rows[-1].id
+
+    # Границы (first_id, last_id) порций сегмента по chunk_size подписчиков: на порцию два запроса по индексу
+    def segment_chunk_bounds(self, user_id: int, segment: Segment, chunk_size: int):
+        subs = self.botSubscribersTable
+        conditions = self._segment_conditions(user_id, segment)
+        after_id = 0
+        with self._get_session() as session:
+            while True:
+                first_id = session.execute(
+                    select(func.min(subs.c.id)).where(and_(subs.c.id > after_id, *conditions))
+                ).scalar()
+                if first_id is None:
+                    return
+                last_id = session.execute(
+                    select(subs.c.id).where(and_(subs.c.id >= first_id, *conditions))
+                    .order_by(subs.c.id).limit(1).offset(chunk_size - 1)
+                ).scalar()
+                if last_id is None:
+                    last_id = session.execute(
+                        select(func.max(subs.c.id)).where(and_(subs.c.id >= first_id, *conditions))
+                    ).scalar()
+                yield first_id, last_id
+                after_id = last_id
+
+    # Значения для фильтров сегмента на странице рассылки
+    def get_segment_options(self, user_id: int) -> dict:
+        subs, tags = self.botSubscribersTable, self.subscriberTagsTable
+        with self._get_session() as session:
+            def distinct(column):
+                return [value for value in session.execute(
+                    select(column).where(and_(subs.c.user_id == user_id, column.is_not(None)))
+                    .distinct().order_by(column).limit(200)
+                ).scalars()]
+            return {
+                "languages": distinct(subs.c.language_code),
+                "sources": distinct(subs.c.source),
+                "tags": list(session.execute(
+                    select(tags.c.tag).join(subs, subs.c.id == tags.c.subscriber_id)
+                    .where(subs.c.user_id == user_id).distinct().order_by(tags.c.tag).limit(200)
+                ).scalars()),
+            }
+
+    # Постоянные ошибки отправки (utils/broadcast.py): +1 к счётчику пачкой UPDATE ... IN
+    def record_send_failures(self, user_id: int, chat_ids: list[str], chunk_size: int = 1000):
+        subs = self.botSubscribersTable
+        session = self._get_session()
+        try:
+            now = dt.utcnow()
+            for i in range(0, len(chat_ids), chunk_size):
+                session.execute(subs.update().where(and_(
+                    subs.c.user_id == user_id, subs.c.telegram_chat_id.in_(chat_ids[i:i + chunk_size])
+                )).values(failure_count=subs.c.failure_count + 1, last_failure_at=now))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка записи неудачных отправок: {e}")
+        finally:
+            session.close()
+
+    # После рассылки: получателям сегмента без ошибки в этой рассылке счётчик обнуляется (ошибки только подряд)
+    def reset_send_failures(self, user_id: int, segment: Segment, since: dt,
+                            after_id: int = 0, last_id: int | None = None):
+        subs = self.botSubscribersTable
+        conditions = self._segment_conditions(user_id, segment)
+        if last_id is not None:
+            conditions.append(subs.c.id <= last_id)
+        session = self._get_session()
+        try:
+            session.execute(subs.update().where(and_(
+                subs.c.id > after_id, *conditions,
+                subs.c.failure_count > 0,
+                or_(subs.c.last_failure_at.is_(None), subs.c.last_failure_at < since)
+            )).values(failure_count=0))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка сброса счётчика ошибок: {e}")
+        finally:
+            session.close()
+
+    # Недоступные подписчики (failure_count >= threshold) удаляются или помечаются пачками по id,
+    # каждая пачка — своя короткая транзакция. Возвращает число обработанных строк
+    def prune_dead_subscribers(self, threshold: int, mark_only: bool = False, batch_size: int = 1000) -> int:
+        subs = self.botSubscribersTable
+        total = 0
+        while True:
+            session = self._get_session()
+            try:
+                ids = list(session.execute(
+                    select(subs.c.id).where(and_(subs.c.failure_count >= threshold, subs.c.inactive_since.is_(None)))
+                    .limit(batch_size)
+                ).scalars())
+                if not ids:
+                    return total
+                if mark_only:
+                    session.execute(subs.update().where(subs.c.id.in_(ids)).values(inactive_since=dt.utcnow()))
+                else:
+                    session.execute(self.subscriberTagsTable.delete().where(self.subscriberTagsTable.c.subscriber_id.in_(ids)))
+                    session.execute(subs.delete().where(subs.c.id.in_(ids)))
+                session.commit()
+                total += len(ids)
+            except Exception as e:
+                session.rollback()
+                print(f"Ошибка очистки недоступных подписчиков: {e}")
+                return total
+            finally:
+                session.close()
+            if len(ids) < batch_size:
+                return total
+
     def remove_subscriber(self, user_id: int, chat_id: str):
         session = self._get_session()
         try:
@@ -239,7 +891,8 @@ class Database:
     # Посты
 
     def insert_pending_post(self, user_id: int, message: str, scheduled_datetime: dt,
-                            image_filename: str | None = None, link_post: str | None = None):
+                            image_filename: str | None = None, link_post: str | None = None,
+                            media_files: list[str] | None = None, channel_ids: list[int] | None = None):
         session = self._get_session()
         try:
             if not link_post:
@@ -249,6 +902,8 @@ class Database:
                     user_id=user_id,
                     message=message,
                     image_filename=image_filename,
+                    media_files=json.dumps(media_files, ensure_ascii=False) if media_files else None,
+                    channel_ids=json.dumps(channel_ids) if channel_ids else None,
                     link_post=link_post,
                     scheduled_datetime=scheduled_datetime,
                     status='pending',
@@ -263,6 +918,37 @@ class Database:
         finally:
             session.close()
 
+    # Пачка постов (импорт контент-плана) одним многострочным INSERT в одной транзакции: либо все, либо ничего.
+    # rows: [{"user_id", "message", "scheduled_datetime", "image_filename", "media_files", "link_post"}, ...]
+    def insert_pending_posts_batch(self, rows: list[dict]) -> int:
+        if not rows:
+            return 0
+        created_at = dt.utcnow()
+        session = self._get_session()
+        try:
+            session.execute(insert(self.postPendingTable),
+                            [{**row, "status": 'pending', "created_at": created_at} for row in rows])
+            session.commit()
+            return len(rows)
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка пакетного добавления постов: {e}")
+            raise
+        finally:
+            session.close()
+
+    # (scheduled_datetime, message) ожидающих постов пользователя в диапазоне — для пропуска дублей при импорте
+    def get_pending_post_keys(self, user_id: int, date_from: dt, date_to: dt) -> set:
+        t = self.postPendingTable
+        with self._get_session() as session:
+            return {tuple(row) for row in session.execute(
+                select(t.c.scheduled_datetime, t.c.message).where(and_(
+                    t.c.user_id == user_id,
+                    t.c.status == 'pending',
+                    t.c.scheduled_datetime.between(date_from, date_to)
+                ))
+            )}
+
     def get_pending_post_by_link(self, link_post_val: str):
         with self._get_session() as session:
             return session.execute(
@@ -285,3 +971,428 @@ class Database:
             return False
         finally:
             session.close()
+
+    # Страница очереди постов пользователя (keyset-пагинация).
+    # after — (scheduled_datetime, id) последней строки предыдущей страницы; OFFSET не используется,
+    # поэтому любая страница читается по индексу за одно и то же время
+    def get_user_posts_page(self, user_id: int, status: str | None = None,
+                            after: tuple[dt, int] | None = None, limit: int = 50):
+        t = self.postPendingTable
+        conditions = [t.c.user_id == user_id]
+        if status:
+            conditions.append(t.c.status == status)
+        if after:
+            after_dt, after_id = after
+            conditions.append(t.c.scheduled_datetime >= after_dt)
+            conditions.append(or_(t.c.scheduled_datetime > after_dt, t.c.id > after_id))
+        with self._get_session() as session:
+            return session.execute(
+                select(t).where(and_(*conditions))
+                .order_by(t.c.scheduled_datetime, t.c.id).limit(limit)
+            ).fetchall()
+
+    # Перенос и отмена меняют только ещё не отправленные посты
+    def reschedule_pending_post(self, link_post_val: str, scheduled_datetime: dt, user_id: int) -> bool:
+        return self._update_waiting_post(link_post_val, user_id, {"scheduled_datetime": scheduled_datetime})
+
+    def cancel_pending_post(self, link_post_val: str, user_id: int) -> bool:
+        return self._update_waiting_post(link_post_val, user_id, {"status": "cancelled"})
+
+    # Изменить можно только свой ожидающий пост
+    def _update_waiting_post(self, link_post_val: str, user_id: int, fields: dict) -> bool:
+        t = self.postPendingTable
+        session = self._get_session()
+        try:
+            result = session.execute(
+                update(t).where(and_(t.c.link_post == link_post_val, t.c.user_id == user_id,
+                                     t.c.status == 'pending')).values(**fields)
+            )
+            session.commit()
+            return result.rowcount > 0
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка изменения поста: {e}")
+            return False
+        finally:
+            session.close()
+
+    # Правила повтора
+
+    def insert_post_rule(self, user_id: int, message: str, kind: str, starts_at: dt, next_fire_at: dt | None,
+                         cron: str | None = None, interval_minutes: int | None = None, tz_name: str | None = None,
+                         ends_at: dt | None = None, image_filename: str | None = None,
+                         media_files: list[str] | None = None, channel_ids: list[int] | None = None) -> int | None:
+        session = self._get_session()
+        try:
+            rule_id = session.execute(
+                insert(self.postRulesTable).values(
+                    user_id=user_id, message=message, image_filename=image_filename,
+                    media_files=json.dumps(media_files, ensure_ascii=False) if media_files else None,
+                    channel_ids=json.dumps(channel_ids) if channel_ids else None,
+                    kind=kind, cron=cron, interval_minutes=interval_minutes, timezone=tz_name,
+                    starts_at=starts_at, ends_at=ends_at, next_fire_at=next_fire_at,
+                    active=1 if next_fire_at else 0, created_at=dt.utcnow(),
+                )
+            ).inserted_primary_key[0]
+            session.commit()
+            return rule_id
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка создания правила повтора: {e}")
+            return None
+        finally:
+            session.close()
+
+    # Активные правила, у которых следующее срабатывание попадает в окно до until
+    def get_rules_to_materialize(self, until: dt, limit: int = 500, rule_id: int | None = None) -> list:
+        t = self.postRulesTable
+        conditions = [t.c.active == 1, t.c.next_fire_at <= until]
+        if rule_id is not None:
+            conditions.append(t.c.id == rule_id)
+        with self._get_session() as session:
+            return session.execute(
+                select(t).where(and_(*conditions)).order_by(t.c.next_fire_at).limit(limit)
+            ).fetchall()
+
+    # Посты срабатываний правила и новый курсор next_fire_at одной транзакцией.
+    # Курсор сдвигается, только если его не сдвинул другой экземпляр (сравнение с прежним значением);
+    # повтор срабатывания отсекает уникальный индекс (rule_id, scheduled_datetime).
+    # Возвращает [(scheduled_datetime, link_post)] созданных постов или None, если правило уже обработано
+    def materialize_rule(self, rule, fire_times: list[dt], next_fire_at: dt | None):
+        rules, posts = self.postRulesTable, self.postPendingTable
+        rows = [{"user_id": rule.user_id, "message": rule.message, "image_filename": rule.image_filename,
+                 "media_files": rule.media_files, "channel_ids": rule.channel_ids,
+                 "link_post": p_link_generate(10), "scheduled_datetime": fire_at,
+                 "status": 'pending', "created_at": dt.utcnow(), "rule_id": rule.id} for fire_at in fire_times]
+        session = self._get_session()
+        try:
+            moved = session.execute(
+                update(rules).where(and_(rules.c.id == rule.id, rules.c.active == 1,
+                                         rules.c.next_fire_at == rule.next_fire_at))
+                .values(next_fire_at=next_fire_at, active=1 if next_fire_at else 0)
+            ).rowcount
+            if not moved:
+                session.rollback()
+                return None
+            if rows:
+                session.execute(self._insert_ignore(posts), rows)
+            session.commit()
+            return [(row["scheduled_datetime"], row["link_post"]) for row in rows]
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка создания постов правила {rule.id}: {e}")
+            return None
+        finally:
+            session.close()
+
+    # Остановка правила: новые посты не создаются, уже созданные ожидающие отменяются.
+    # Возвращает link_post отменённых постов
+    def stop_post_rule(self, rule_id: int, user_id: int) -> list[str] | None:
+        rules, posts = self.postRulesTable, self.postPendingTable
+        session = self._get_session()
+        try:
+            stopped = session.execute(
+                update(rules).where(and_(rules.c.id == rule_id, rules.c.user_id == user_id)).values(active=0)
+            ).rowcount
+            if not stopped:
+                session.rollback()
+                return None
+            waiting = and_(posts.c.rule_id == rule_id, posts.c.status == 'pending')
+            links = [row.link_post for row in session.execute(select(posts.c.link_post).where(waiting)).fetchall()]
+            session.execute(update(posts).where(waiting).values(status='cancelled'))
+            session.commit()
+            return links
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка остановки правила повтора: {e}")
+            return None
+        finally:
+            session.close()
+
+    # Время и ссылка ожидающих постов до until (включая просроченные) — для таймера отправки
+    def get_pending_post_times(self, until: dt) -> list:
+        t = self.postPendingTable
+        with self._get_session() as session:
+            return session.execute(
+                select(t.c.scheduled_datetime, t.c.link_post)
+                .where(and_(t.c.status == 'pending', t.c.scheduled_datetime <= until))
+            ).fetchall()
+
+    # Посты с медиа, которые скоро нужно отправить и которые ещё не загружены в Telegram
+    # Посты без file_id, чья пауза после неудачной предзагрузки истекла; после max_failures попыток
+    # пост не предзагружается — файлы загрузятся при отправке
+    def get_posts_to_prewarm(self, until: dt, max_failures: int, limit: int = 50):
+        t = self.postPendingTable
+        with self._get_session() as session:
+            return session.execute(
+                select(t).where(and_(
+                    t.c.status == 'pending',
+                    t.c.scheduled_datetime <= until,
+                    t.c.media_file_ids.is_(None),
+                    t.c.prewarm_failures < max_failures,
+                    or_(t.c.prewarm_retry_at.is_(None), t.c.prewarm_retry_at <= dt.utcnow()),
+                    or_(t.c.image_filename.isnot(None), t.c.media_files.isnot(None))
+                )).order_by(t.c.scheduled_datetime).limit(limit)
+            ).fetchall()
+
+    def record_prewarm_failure(self, link_post_val: str, retry_at: dt):
+        t = self.postPendingTable
+        session = self._get_session()
+        try:
+            session.execute(update(t).where(t.c.link_post == link_post_val).values(
+                prewarm_failures=t.c.prewarm_failures + 1, prewarm_retry_at=retry_at))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка записи неудачной предзагрузки: {e}")
+        finally:
+            session.close()
+
+    def set_post_media_file_ids(self, link_post_val: str, media: list[dict] | None):
+        session = self._get_session()
+        try:
+            session.execute(
+                update(self.postPendingTable).where(
+                    self.postPendingTable.c.link_post == link_post_val
+                ).values(media_file_ids=json.dumps(media) if media else None)
+            )
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка сохранения file_id поста: {e}")
+            return False
+        finally:
+            session.close()
+
+    # Аренда (lease) строк для нескольких экземпляров приложения.
+    # Захват — условный UPDATE: строку получает тот, чей UPDATE её изменил, остальные видят rowcount 0.
+    # fencing_token растёт при каждом захвате, и результат пишется только при совпадении владельца и токена,
+    # поэтому экземпляр, у которого аренду перехватили после паузы, не перезапишет итог нового владельца.
+    # SELECT ... FOR UPDATE SKIP LOCKED не используется: схема должна работать и на SQLite
+
+    def _claimable(self, table, ready, now: dt):
+        return or_(
+            and_(table.c.status == 'pending', ready),
+            and_(table.c.status == 'sending', table.c.lease_expires_at < now),
+        )
+
+    # Захват по одной строке: строка наша, только если наш UPDATE её изменил (rowcount == 1).
+    # Поиск по lease_owner не годится — у потоков одного экземпляра (таймер постов и dispatch_due_posts)
+    # владелец один и тот же, и оба получили бы один пост
+    def _claim(self, table, ready, owner: str, lease_seconds: int, limit: int, order_by) -> list:
+        now = dt.utcnow()
+        condition = self._claimable(table, ready, now)
+        session = self._get_session()
+        try:
+            ids = [row.id for row in session.execute(
+                select(table.c.id).where(condition).order_by(order_by).limit(limit)
+            ).fetchall()]
+            claimed = []
+            for row_id in ids:
+                result = session.execute(
+                    update(table).where(and_(table.c.id == row_id, condition)).values(
+                        status='sending', lease_owner=owner,
+                        lease_expires_at=now + timedelta(seconds=lease_seconds),
+                        fencing_token=table.c.fencing_token + 1,
+                    )
+                )
+                if result.rowcount == 1:
+                    claimed.append(row_id)
+            session.commit()
+            if not claimed:
+                return []
+            return session.execute(select(table).where(table.c.id.in_(claimed)).order_by(order_by)).fetchall()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка захвата аренды {table.name}: {e}")
+            return []
+        finally:
+            session.close()
+
+    def _update_leased(self, table, row_id: int, owner: str, fencing_token: int, values: dict) -> bool:
+        session = self._get_session()
+        try:
+            result = session.execute(
+                update(table).where(and_(
+                    table.c.id == row_id, table.c.lease_owner == owner,
+                    table.c.fencing_token == fencing_token, table.c.status == 'sending',
+                )).values(**values)
+            )
+            session.commit()
+            return result.rowcount > 0
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка обновления арендованной строки {table.name}: {e}")
+            return False
+        finally:
+            session.close()
+
+    # Захват и продление аренды ботов (отпечатки токенов); возвращает отпечатки, которыми владеет owner.
+    # Вызывается одним потоком супервизора на процесс; None — ошибка БД (запущенных ботов не трогать)
+    def acquire_bot_leases(self, fingerprints: list[str], owner: str, lease_seconds: int) -> set | None:
+        if not fingerprints:
+            return set()
+        t = self.botLeasesTable
+        now = dt.utcnow()
+        session = self._get_session()
+        try:
+            session.execute(self._insert_ignore(t), [{"token_fingerprint": fp} for fp in fingerprints])
+            session.execute(
+                update(t).where(and_(
+                    t.c.token_fingerprint.in_(fingerprints),
+                    or_(t.c.lease_owner == owner, t.c.lease_owner.is_(None), t.c.lease_expires_at < now),
+                )).values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+            )
+            session.commit()
+            return {row.token_fingerprint for row in session.execute(
+                select(t.c.token_fingerprint).where(and_(t.c.token_fingerprint.in_(fingerprints), t.c.lease_owner == owner))
+            )}
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка захвата аренды ботов: {e}")
+            return None
+        finally:
+            session.close()
+
+    def release_bot_leases(self, owner: str):
+        session = self._get_session()
+        try:
+            session.execute(update(self.botLeasesTable).where(self.botLeasesTable.c.lease_owner == owner)
+                            .values(lease_owner=None, lease_expires_at=None))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка освобождения аренды ботов: {e}")
+        finally:
+            session.close()
+
+    # Продление всех аренд экземпляра (постов и порций рассылок)
+    def renew_leases(self, owner: str, lease_seconds: int) -> int:
+        expires_at = dt.utcnow() + timedelta(seconds=lease_seconds)
+        session = self._get_session()
+        try:
+            renewed = 0
+            for table in (self.postPendingTable, self.broadcastChunksTable):
+                renewed += session.execute(
+                    update(table).where(and_(table.c.lease_owner == owner, table.c.status == 'sending'))
+                    .values(lease_expires_at=expires_at)
+                ).rowcount
+            session.commit()
+            return renewed
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка продления аренды: {e}")
+            return 0
+        finally:
+            session.close()
+
+    # Посты, время которых наступило; link_post — захват одного конкретного поста
+    def claim_due_posts(self, owner: str, lease_seconds: int, limit: int = 20, link_post: str | None = None) -> list:
+        t = self.postPendingTable
+        ready = t.c.scheduled_datetime <= dt.utcnow()
+        if link_post:
+            ready = and_(ready, t.c.link_post == link_post)
+        return self._claim(t, ready, owner, lease_seconds, limit, t.c.scheduled_datetime)
+
+    def finish_post(self, post_id: int, owner: str, fencing_token: int, status: str) -> bool:
+        return self._update_leased(self.postPendingTable, post_id, owner, fencing_token,
+                                   {"status": status, "lease_owner": None, "lease_expires_at": None})
+
+    # Задания рассылки
+
+    # Задание и его порции одной транзакцией; границы порций — по id подписчиков сегмента
+    def create_broadcast_job(self, user_id: int, message: str, media_path: str | None, segment: Segment,
+                             delay_ms: int = 0, chunk_size: int = 5000) -> int | None:
+        bounds = list(self.segment_chunk_bounds(user_id, segment, chunk_size))
+        total = self.count_segment(user_id, segment)
+        session = self._get_session()
+        try:
+            job_id = session.execute(
+                insert(self.broadcastJobsTable).values(
+                    user_id=user_id, message=message, media_path=media_path, segment=segment.to_json(),
+                    delay_ms=delay_ms, total=total, status='pending' if bounds else 'done',
+                    created_at=dt.utcnow(), finished_at=None if bounds else dt.utcnow(),
+                )
+            ).inserted_primary_key[0]
+            if bounds:
+                session.execute(insert(self.broadcastChunksTable), [
+                    {"job_id": job_id, "first_id": first_id, "last_id": last_id, "cursor_id": first_id - 1}
+                    for first_id, last_id in bounds
+                ])
+            session.commit()
+            return job_id
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка создания рассылки: {e}")
+            return None
+        finally:
+            session.close()
+
+    # Свободные порции вместе с параметрами их задания
+    def claim_broadcast_chunks(self, owner: str, lease_seconds: int, limit: int = 1) -> list:
+        chunks = self.broadcastChunksTable
+        claimed = self._claim(chunks, literal(True), owner, lease_seconds, limit, chunks.c.id)
+        if not claimed:
+            return []
+        jobs = self.broadcastJobsTable
+        with self._get_session() as session:
+            job_rows = {row.id: row for row in session.execute(
+                select(jobs).where(jobs.c.id.in_({chunk.job_id for chunk in claimed}))
+            ).fetchall()}
+        return [(chunk, job_rows[chunk.job_id]) for chunk in claimed if chunk.job_id in job_rows]
+
+    # Прогресс порции; заодно продлевает аренду. False — аренда потеряна, отправку нужно прекратить
+    def checkpoint_broadcast_chunk(self, chunk_id: int, owner: str, fencing_token: int, cursor_id: int,
+                                   sent: int, failed: int, dead: int, lease_seconds: int) -> bool:
+        return self._update_leased(self.broadcastChunksTable, chunk_id, owner, fencing_token, {
+            "cursor_id": cursor_id, "sent": sent, "failed": failed, "dead": dead,
+            "lease_expires_at": dt.utcnow() + timedelta(seconds=lease_seconds),
+        })
+
+    # Возврат порции в очередь при остановке экземпляра: другой экземпляр продолжит с cursor_id без ожидания аренды
+    def release_broadcast_chunk(self, chunk_id: int, owner: str, fencing_token: int, cursor_id: int,
+                                sent: int, failed: int, dead: int) -> bool:
+        return self._update_leased(self.broadcastChunksTable, chunk_id, owner, fencing_token, {
+            "cursor_id": cursor_id, "sent": sent, "failed": failed, "dead": dead,
+            "status": 'pending', "lease_owner": None, "lease_expires_at": None,
+        })
+
+    # Завершение порции; последняя завершённая порция закрывает задание
+    def finish_broadcast_chunk(self, chunk_id: int, job_id: int, owner: str, fencing_token: int,
+                               sent: int, failed: int, dead: int) -> bool:
+        chunks, jobs = self.broadcastChunksTable, self.broadcastJobsTable
+        finished = self._update_leased(chunks, chunk_id, owner, fencing_token, {
+            "sent": sent, "failed": failed, "dead": dead, "status": 'done',
+            "lease_owner": None, "lease_expires_at": None,
+        })
+        if not finished:
+            return False
+        session = self._get_session()
+        try:
+            session.execute(
+                update(jobs).where(and_(
+                    jobs.c.id == job_id, jobs.c.status == 'pending',
+                    ~exists().where(and_(chunks.c.job_id == job_id, chunks.c.status != 'done')),
+                )).values(status='done', finished_at=dt.utcnow())
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка завершения рассылки: {e}")
+        finally:
+            session.close()
+        return True
+
+    def get_broadcast_progress(self, job_id: int) -> dict | None:
+        chunks, jobs = self.broadcastChunksTable, self.broadcastJobsTable
+        with self._get_session() as session:
+            job = session.execute(select(jobs).where(jobs.c.id == job_id)).fetchone()
+            if not job:
+                return None
+            sent, failed, dead = session.execute(
+                select(func.coalesce(func.sum(chunks.c.sent), 0), func.coalesce(func.sum(chunks.c.failed), 0),
+                       func.coalesce(func.sum(chunks.c.dead), 0)).where(chunks.c.job_id == job_id)
+            ).one()
+        return {"total": job.total, "sent": int(sent), "failed": int(failed), "dead": int(dead),
+                "done": job.status == 'done'}
@@ -0,0 +1,185 @@
+import os
+import time
+import atexit
+import inspect
+import logging
+import threading
+import functools
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from utils.metrics import counter, histogram, DB_BUCKETS
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Профилирование SQL включается только при DB_PROFILE=1:
+# DB_SLOW_QUERY_MS — порог медленного запроса (в лог уходят текст и параметры),
+# DB_REPEAT_THRESHOLD / DB_REPEAT_WINDOW — сколько одинаковых SELECT за окно (сек) считать N+1
+DB_PROFILE = os.getenv("DB_PROFILE", "").lower() in ("1", "true", "yes")
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+DB_REPEAT_THRESHOLD = int(os.getenv("DB_REPEAT_THRESHOLD", "5"))
+DB_REPEAT_WINDOW = float(os.getenv("DB_REPEAT_WINDOW", "10"))
+# Сколько разных запросов помнить для поиска повторов
+REPEAT_KEYS_LIMIT = 512
+PARAMS_LOG_LIMIT = 500
+
+DB_METHOD_CALLS = counter("db_method_calls_total", "Вызовы методов Database (DB_PROFILE)", ("method",))
+DB_METHOD_QUERIES = counter("db_method_queries_total", "SQL-запросы по методам Database (DB_PROFILE)", ("method",))
+DB_METHOD_ROWS = counter("db_method_rows_total", "Строки, возвращённые методами Database (DB_PROFILE)", ("method",))
+DB_METHOD_SECONDS = histogram("db_method_seconds", "Время методов Database (DB_PROFILE)", ("method",),
+                              buckets=DB_BUCKETS)
+DB_SLOW_QUERIES = counter("db_slow_queries_total", "Запросы дольше DB_SLOW_QUERY_MS", ("method",))
+DB_REPEATED_QUERIES = counter("db_repeated_queries_total", "Срабатывания детектора N+1", ("method",))
+
+# Текущий метод Database и текущий сценарий (обработчик бота, задача планировщика) в этом потоке
+_current_method: ContextVar[Optional[str]] = ContextVar("db_method", default=None)
+_current_flow: ContextVar[Optional[dict]] = ContextVar("db_flow", default=None)
+
+
+# Число строк в результате метода: список — его длина, одна строка — 1
+def _count_rows(result) -> int:
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1 if hasattr(result, "_mapping") else 0
+
+
+def _short(value, limit: int = PARAMS_LOG_LIMIT) -> str:
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class QueryProfiler:
+    def __init__(self, enabled: bool = DB_PROFILE, slow_ms: float = DB_SLOW_QUERY_MS,
+                 repeat_threshold: int = DB_REPEAT_THRESHOLD, repeat_window: float = DB_REPEAT_WINDOW):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.repeat_window = repeat_window
+        self._lock = threading.Lock()
+        # (текст, параметры) -> моменты выполнения за окно; порядок — для вытеснения старых ключей
+        self._recent: OrderedDict[tuple, deque] = OrderedDict()
+
+    # Подключение к событиям движка (для каждого engine один раз)
+    def attach(self, engine):
+        if not self.enabled or getattr(engine, "_profiler_attached", False):
+            return
+        engine._profiler_attached = True
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            context._profile_started = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            self._on_query(statement, parameters, time.perf_counter() - context._profile_started)
+
+    def _on_query(self, statement: str, parameters, elapsed: float):
+        method = _current_method.get() or "-"
+        DB_METHOD_QUERIES.inc(method=method)
+        if elapsed * 1000 >= self.slow_ms:
+            DB_SLOW_QUERIES.inc(method=method)
+            logger.warning(f"Медленный запрос ({elapsed * 1000:.0f} мс, {method}): "
+                           f"{' '.join(statement.split())} | параметры: {_short(parameters)}")
+        if not statement.lstrip()[:6].upper() == "SELECT":
+            return
+        flow = _current_flow.get()
+        if flow is not None:
+            flow["queries"][statement] = flow["queries"].get(statement, 0) + 1
+            flow["methods"].setdefault(statement, method)
+        self._check_repeat(statement, parameters, method)
+
+    # Один и тот же SELECT с теми же параметрами много раз за окно — кандидат на кэш или пакетный запрос
+    def _check_repeat(self, statement: str, parameters, method: str):
+        key = (statement, _short(parameters))
+        now = time.monotonic()
+        with self._lock:
+            times = self._recent.pop(key, None) or deque()
+            self._recent[key] = times
+            if len(self._recent) > REPEAT_KEYS_LIMIT:
+                self._recent.popitem(last=False)
+            times.append(now)
+            while times and now - times[0] > self.repeat_window:
+                times.popleft()
+            repeated = len(times)
+            if repeated >= self.repeat_threshold:
+                times.clear()
+        if repeated >= self.repeat_threshold:
+            DB_REPEATED_QUERIES.inc(method=method)
+            logger.warning(f"N+1: одинаковый запрос {repeated} раз за {self.repeat_window:g} с ({method}): "
+                           f"{' '.join(statement.split())} | параметры: {_short(parameters)}")
+
+    # Вызов метода Database: количество запросов, время и строки результата
+    def call(self, name: str, func, *args, **kwargs):
+        token = _current_method.set(name)
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            DB_METHOD_ROWS.inc(_count_rows(result), method=name)
+            return result
+        finally:
+            DB_METHOD_CALLS.inc(method=name)
+            DB_METHOD_SECONDS.observe(time.perf_counter() - started, method=name)
+            _current_method.reset(token)
+
+    # Сценарий (обработчик, задача): повтор одного SELECT с разными параметрами внутри него — N+1.
+    # Работает и как декоратор
+    @contextmanager
+    def flow(self, name: str):
+        if not self.enabled or _current_flow.get() is not None:
+            yield
+            return
+        token = _current_flow.set({"queries": {}, "methods": {}})
+        try:
+            yield
+        finally:
+            state = _current_flow.get()
+            _current_flow.reset(token)
+            for statement, count in state["queries"].items():
+                if count >= self.repeat_threshold:
+                    method = state["methods"][statement]
+                    DB_REPEATED_QUERIES.inc(method=method)
+                    logger.warning(f"N+1 в «{name}»: запрос выполнен {count} раз ({method}): "
+                                   f"{' '.join(statement.split())}")
+
+    # Сводка по методам: самые дорогие по суммарному времени
+    def summary(self, limit: int = 15) -> list[str]:
+        queries = DB_METHOD_QUERIES.values()
+        rows = DB_METHOD_ROWS.values()
+        calls = DB_METHOD_CALLS.values()
+        timings = sorted(DB_METHOD_SECONDS.values().items(), key=lambda item: item[1][0], reverse=True)
+        lines = []
+        for key, (total, count) in timings[:limit]:
+            lines.append(f"{key[0]}: вызовов {calls.get(key, count):g}, запросов {queries.get(key, 0):g}, "
+                         f"строк {rows.get(key, 0):g}, всего {total * 1000:.1f} мс, сред. {total / count * 1000:.2f} мс")
+        return lines
+
+
+PROFILER = QueryProfiler()
+
+
+# Обёртка публичных методов класса; без DB_PROFILE вызов идёт напрямую
+def profile_methods(cls):
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(attr):
+            continue
+
+        def wrap(func, method_name=f"{cls.__name__}.{name}"):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    return func(*args, **kwargs)
+                return PROFILER.call(method_name, func, *args, **kwargs)
+            return wrapper
+
+        setattr(cls, name, wrap(attr))
+    return cls
+
+
+@atexit.register
+def _log_summary():
+    if PROFILER.enabled:
+        for line in PROFILER.summary():
+            logger.info(f"[db profile] {line}")
@@ -1,3 +1,4 @@
+import hashlib
 import random
 import string
 import bcrypt
@@ -14,3 +15,11 @@ def verify_password_bcrypt(plain_password: str, hashed_password_from_db: bytes)
 #Генерирует случайную строку из букв и цифр заданной длины
 def p_link_generate(length: int) -> str:
     return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+#Считает SHA-256 содержимого файла, читая его блоками
+def file_sha256(path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,15 @@
+import os
+import uuid
+import socket
+
+# Аренда строк (постов и порций рассылок) между экземплярами приложения:
+# LEASE_SECONDS — срок аренды; продлевается каждые LEASE_SECONDS / 3, после истечения строку забирает другой экземпляр
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "120"))
+
+# Идентификатор экземпляра: хост, pid и случайный суффикс (pid после перезапуска контейнера может совпасть)
+WORKER_ID = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# Аренду перехватил другой экземпляр (fencing-токен не совпал) — работу нужно прекратить без записи итога
+class LeaseLost(Exception):
+    pass
@@ -0,0 +1,182 @@
+import os
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from dotenv import load_dotenv
+from utils.function import file_sha256
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+load_dotenv()
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API для загрузки файлов через multipart
+TG_PHOTO_MAX_BYTES = 10 * 1024 ** 2
+TG_PHOTO_MAX_DIMENSIONS_SUM = 10000
+TG_PHOTO_MAX_RATIO = 20
+TG_UPLOAD_MAX_BYTES = 50 * 1024 ** 2
+
+# Настройки предобработки (можно переопределить в .env)
+MEDIA_PREPROCESS = os.getenv("MEDIA_PREPROCESS", "1").lower() not in ("0", "false", "no")
+MEDIA_IMAGE_MAX_SIDE = int(os.getenv("MEDIA_IMAGE_MAX_SIDE", "2560"))
+MEDIA_IMAGE_MAX_BYTES = min(int(os.getenv("MEDIA_IMAGE_MAX_BYTES", str(5 * 1024 ** 2))), TG_PHOTO_MAX_BYTES)
+MEDIA_JPEG_QUALITY_STEPS = (87, 80, 72, 64, 55)
+# Сколько изображений перекодируется одновременно (ограничение по CPU и памяти)
+MEDIA_ENCODE_WORKERS = int(os.getenv("MEDIA_ENCODE_WORKERS", "4"))
+
+PROCESSED_DIR = Path("assets") / "processed"
+
+# Хешей в памяти не больше DIGEST_MEMO_SIZE: давно не отправлявшиеся файлы вытесняются первыми
+DIGEST_MEMO_SIZE = 4096
+_digest_memo: OrderedDict[tuple, str] = OrderedDict()
+_memo_lock = threading.Lock()
+# Одно и то же содержимое кодирует один поток (остальные ждут его результата), разные — параллельно
+_encoding: dict[Path, threading.Event] = {}
+_encode_slots = threading.BoundedSemaphore(MEDIA_ENCODE_WORKERS)
+# Файлы, которые не удалось ужать под бюджет: при следующих отправках сразу уходят документом
+_encode_failed: OrderedDict[Path, bool] = OrderedDict()
+
+
+class PreparedMedia(NamedTuple):
+    path: str
+    endpoint: str
+    field_name: str
+    error: Optional[str] = None
+
+
+# Хеш файла с мемоизацией по (путь, размер, mtime), чтобы не перечитывать файл при повторных отправках
+def media_digest(path) -> str:
+    path = Path(path)
+    st = path.stat()
+    key = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    with _memo_lock:
+        digest = _digest_memo.get(key)
+        if digest is not None:
+            _digest_memo.move_to_end(key)
+    if digest is None:
+        digest = file_sha256(path)
+        with _memo_lock:
+            _digest_memo[key] = digest
+            if len(_digest_memo) > DIGEST_MEMO_SIZE:
+                _digest_memo.popitem(last=False)
+    return digest
+
+
+def _photo_within_limits(width: int, height: int, size: int) -> bool:
+    if size > TG_PHOTO_MAX_BYTES or width + height > TG_PHOTO_MAX_DIMENSIONS_SUM:
+        return False
+    return max(width, height) / max(1, min(width, height)) <= TG_PHOTO_MAX_RATIO
+
+
+# Уменьшение и перекодирование изображения в JPEG под бюджет по размеру
+def _encode_image(source: Path, target: Path) -> bool:
+    with Image.open(source) as img:
+        img.draft("RGB", (MEDIA_IMAGE_MAX_SIDE, MEDIA_IMAGE_MAX_SIDE))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MEDIA_IMAGE_MAX_SIDE, MEDIA_IMAGE_MAX_SIDE))
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        tmp = target.with_name(target.name + ".tmp")
+        try:
+            for quality in MEDIA_JPEG_QUALITY_STEPS:
+                img.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+                if tmp.stat().st_size <= MEDIA_IMAGE_MAX_BYTES:
+                    tmp.replace(target)
+                    return True
+        finally:
+            tmp.unlink(missing_ok=True)
+    return False
+
+
+# Ужатая копия в target; False — не уложились в MEDIA_IMAGE_MAX_BYTES (результат запоминается)
+def _encode_once(source: Path, target: Path) -> bool:
+    while True:
+        with _memo_lock:
+            if target in _encode_failed:
+                return False
+            event = _encoding.get(target)
+            if event is None:
+                event = _encoding[target] = threading.Event()
+                break
+        event.wait()
+        if target.exists():
+            return True
+    try:
+        if target.exists():
+            return True
+        PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+        with _encode_slots:
+            encoded = _encode_image(source, target)
+        if not encoded:
+            logger.warning(f"Не удалось ужать {source.name} до {MEDIA_IMAGE_MAX_BYTES} байт")
+            with _memo_lock:
+                _encode_failed[target] = True
+                if len(_encode_failed) > DIGEST_MEMO_SIZE:
+                    _encode_failed.popitem(last=False)
+        return encoded
+    finally:
+        with _memo_lock:
+            _encoding.pop(target, None)
+        event.set()
+
+
+def _prepare_photo(path: Path, size: int) -> PreparedMedia:
+    with Image.open(path) as img:
+        width, height = img.size
+
+    oversized = max(width, height) > MEDIA_IMAGE_MAX_SIDE or size > MEDIA_IMAGE_MAX_BYTES
+    if not oversized and _photo_within_limits(width, height, size):
+        return PreparedMedia(str(path), "sendPhoto", "photo")
+
+    digest = media_digest(path)
+    target = PROCESSED_DIR / f"{digest}_{MEDIA_IMAGE_MAX_SIDE}_{MEDIA_IMAGE_MAX_BYTES}.jpg"
+    encoded_now = not target.exists()
+    if not _encode_once(path, target):
+        return PreparedMedia(str(path), "sendDocument", "document")
+    if encoded_now:
+        logger.info(f"Изображение {path.name} ужато: {size} → {target.stat().st_size} байт")
+
+    with Image.open(target) as img:
+        width, height = img.size
+    if not _photo_within_limits(width, height, target.stat().st_size):
+        # Слишком вытянутое изображение Telegram не примет как фото — отправляем файлом
+        return PreparedMedia(str(path), "sendDocument", "document")
+    return PreparedMedia(str(target), "sendPhoto", "photo")
+
+
+# Предобработка медиа перед отправкой: ужатие фото и проверка лимитов Bot API
+def prepare_media(media_path: str, endpoint: str, field_name: str) -> PreparedMedia:
+    path = Path(media_path)
+    size = path.stat().st_size
+
+    if endpoint == "sendPhoto":
+        if MEDIA_PREPROCESS and Image is not None:
+            try:
+                prepared = _prepare_photo(path, size)
+            except Exception as e:
+                logger.warning(f"Ошибка предобработки {path.name}: {e}")
+                prepared = PreparedMedia(str(path), endpoint, field_name)
+            if prepared.endpoint == "sendPhoto":
+                return prepared
+            endpoint, field_name = prepared.endpoint, prepared.field_name
+        elif size > TG_PHOTO_MAX_BYTES:
+            endpoint, field_name = "sendDocument", "document"
+
+    if size > TG_UPLOAD_MAX_BYTES:
+        limit_mb = TG_UPLOAD_MAX_BYTES // 1024 ** 2
+        return PreparedMedia(str(path), endpoint, field_name,
+                             f"Файл {path.name} больше {limit_mb} MB — Telegram Bot API его не примет.")
+    return PreparedMedia(str(path), endpoint, field_name)
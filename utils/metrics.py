@@ -0,0 +1,238 @@
+import os
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Локальный /metrics в формате Prometheus включается только при заданном METRICS_PORT
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Границы корзин гистограмм (секунды)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+LAG_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 300)
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: tuple, key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> dict[tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = super().render()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+# Gauge: значение задаётся явно или считается функцией в момент чтения
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def values(self) -> dict[tuple, float]:
+        if self._function is not None:
+            try:
+                return {(): float(self._function())}
+            except Exception as e:
+                logger.warning(f"Метрика {self.name} не посчитана: {e}")
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = super().render()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ключ меток -> [счётчики по корзинам (+Inf последней), сумма, количество]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    # Сумма и количество по каждому набору меток
+    def values(self) -> dict[tuple, tuple[float, int]]:
+        with self._lock:
+            return {key: (series[1], series[2]) for key, series in self._series.items()}
+
+    # Приближённый квантиль по корзинам (верхняя граница корзины)
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        with self._lock:
+            series = self._series.get(_label_key(self.labelnames, labels))
+            if not series or not series[2]:
+                return None
+            counts, total = list(series[0]), series[2]
+        rank, seen = q * total, 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = super().render()
+        with self._lock:
+            items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total_sum, total_count) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total_sum:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {total_count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def metrics(self) -> list[_Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    # Текстовый формат Prometheus (exposition format 0.0.4)
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Метрики приложения
+TELEGRAM_REQUESTS = counter("telegram_requests_total", "Запросы к Bot API по методу и результату", ("method", "outcome"))
+TELEGRAM_LATENCY = histogram("telegram_request_seconds", "Время запроса к Bot API", ("method",))
+TELEGRAM_RATE_LIMITED = counter("telegram_rate_limited_total", "Ответы 429 Too Many Requests", ("method",))
+UPLOAD_BYTES = counter("telegram_upload_bytes_total", "Байт медиа отправлено в Bot API")
+BROADCAST_MESSAGES = counter("broadcast_messages_total", "Сообщения рассылок по результату", ("outcome",))
+BROADCAST_DURATION = histogram("broadcast_duration_seconds", "Длительность рассылки",
+                               buckets=(1, 5, 10, 30, 60, 300, 900, 3600))
+BROADCAST_RATE = gauge("broadcast_last_rate_messages_per_second", "Скорость последней рассылки")
+SUBSCRIBERS_PRUNED = counter("subscribers_pruned_total", "Недоступные подписчики, удалённые или помеченные", ("mode",))
+SCHEDULER_LAG = histogram("scheduler_lag_seconds", "Задержка отправки: запуск задачи минус время по плану",
+                          buckets=LAG_BUCKETS)
+DB_QUERY_SECONDS = histogram("db_query_seconds", "Время SQL-запросов по типу", ("operation",), buckets=DB_BUCKETS)
+BOT_PROCESSES = gauge("bot_processes", "Запущенные процессы bot_runner")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+# HTTP-сервер /metrics в фоновом потоке (только если задан порт)
+def start_metrics_server(port: Optional[int] = None, host: str = METRICS_HOST):
+    global _server
+    port = port or METRICS_PORT
+    if _server is not None or not port:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Не удалось запустить /metrics на {host}:{port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, daemon=True, name="metrics-server").start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return _server
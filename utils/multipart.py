@@ -0,0 +1,73 @@
+import os
+import uuid
+import mimetypes
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadCancelled(Exception):
+    pass
+
+
+# Потоковое multipart/form-data тело: файлы читаются блоками во время отправки,
+# длина известна заранее, поэтому requests выставляет Content-Length без буферизации
+class MultipartStream:
+    def __init__(self, fields: dict, files: dict, chunk_size: int = CHUNK_SIZE,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 cancel_event: Optional[threading.Event] = None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+        self.sent = 0
+        self._parts = []
+
+        for name, value in fields.items():
+            if value is None:
+                continue
+            header = (f"--{self.boundary}\r\n"
+                      f'Content-Disposition: form-data; name="{name}"\r\n\r\n').encode()
+            self._parts.append((header, str(value).encode("utf-8"), None))
+
+        for name, path in files.items():
+            path = Path(path)
+            mime_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            filename = path.name.replace('"', "'")
+            header = (f"--{self.boundary}\r\n"
+                      f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                      f"Content-Type: {mime_type}\r\n\r\n").encode("utf-8")
+            self._parts.append((header, None, path))
+
+        self._closing = f"--{self.boundary}--\r\n".encode()
+        self._length = len(self._closing)
+        for header, body, path in self._parts:
+            self._length += len(header) + (len(body) if body is not None else os.path.getsize(path)) + 2
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        self.sent = 0
+        for header, body, path in self._parts:
+            yield self._track(header)
+            if body is not None:
+                yield self._track(body)
+            else:
+                with open(path, "rb") as f:
+                    while chunk := f.read(self.chunk_size):
+                        yield self._track(chunk)
+            yield self._track(b"\r\n")
+        yield self._track(self._closing)
+
+    # Учёт отправленных байт, прогресс и проверка отмены между блоками
+    def _track(self, chunk: bytes) -> bytes:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise UploadCancelled("Загрузка отменена")
+        self.sent += len(chunk)
+        if self.on_progress:
+            self.on_progress(self.sent, self._length)
+        return chunk
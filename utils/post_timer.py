@@ -0,0 +1,125 @@
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+from utils.metrics import gauge
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+POST_TIMER_QUEUED = gauge("post_timer_queued", "Посты в таймере отправки (в пределах горизонта)")
+
+
+def _timestamp(value: datetime | float) -> float:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+    return value
+
+
+# Таймер запланированных постов: min-heap из (время отправки, link_post) вместо задачи APScheduler на пост.
+# Держит только посты ближайшего горизонта — дальние остаются в БД (индекс status, scheduled_datetime)
+# и подгружаются периодическим refill. Текст и медиа поста читаются в момент срабатывания.
+# Перенос поста — новая запись; старая пропускается при срабатывании, т.к. время в _scheduled уже другое.
+# Отменённый пост тоже срабатывает, но захват в БД (claim_due_posts) вернёт пусто
+class PostTimer:
+    def __init__(self, on_fire: Callable[[str], None], workers: int = 4):
+        self.on_fire = on_fire
+        self._heap: list[tuple[float, str]] = []
+        # link_post -> актуальное время срабатывания
+        self._scheduled: dict[str, float] = {}
+        # До какого момента посты из БД уже загружены; более поздние push не кладёт — их принесёт refill
+        self.loaded_until = 0.0
+        self._cond = threading.Condition()
+        self._stopped = False
+        # Отправка в пуле, чтобы медленный пост не задерживал срабатывание следующих
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="post-send")
+        self._thread = threading.Thread(target=self._run, daemon=True, name="post-timer")
+        POST_TIMER_QUEUED.set_function(lambda: len(self._scheduled))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    # fire_at — naive datetime в UTC (как в БД) или unix-время
+    def push(self, fire_at: datetime | float, link_post: str) -> bool:
+        ts = _timestamp(fire_at)
+        with self._cond:
+            if ts > self.loaded_until or self._scheduled.get(link_post) == ts:
+                return False
+            self._scheduled[link_post] = ts
+            heapq.heappush(self._heap, (ts, link_post))
+            if self._heap[0][1] == link_post:
+                self._cond.notify()
+        return True
+
+    # Пачка постов (scheduled_datetime, link_post) под одной блокировкой: для больших пачек
+    # куча перестраивается целиком за O(n) вместо n вставок по O(log n)
+    def push_many(self, rows: Iterable) -> int:
+        added = []
+        with self._cond:
+            for fire_at, link_post in rows:
+                ts = _timestamp(fire_at)
+                if ts > self.loaded_until or self._scheduled.get(link_post) == ts:
+                    continue
+                self._scheduled[link_post] = ts
+                added.append((ts, link_post))
+            if not added:
+                return 0
+            head = self._heap[0] if self._heap else None
+            if len(added) > len(self._heap):
+                self._heap.extend(added)
+                heapq.heapify(self._heap)
+            else:
+                for item in added:
+                    heapq.heappush(self._heap, item)
+            if self._heap[0] != head:
+                self._cond.notify()
+        return len(added)
+
+    # Загрузка постов из БД: rows — (scheduled_datetime, link_post) со временем не позже until
+    def load(self, rows: Iterable, until: datetime) -> int:
+        with self._cond:
+            self.loaded_until = max(self.loaded_until, _timestamp(until))
+        return self.push_many(rows)
+
+    def discard(self, link_post: str):
+        with self._cond:
+            self._scheduled.pop(link_post, None)
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                fire_at, link_post = self._heap[0]
+                delay = fire_at - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if self._scheduled.get(link_post) != fire_at:
+                    continue
+                del self._scheduled[link_post]
+                self._executor.submit(self._fire, link_post)
+
+    def _fire(self, link_post: str):
+        try:
+            self.on_fire(link_post)
+        except Exception as e:
+            logger.error(f"Ошибка отправки поста {link_post}: {e}")
+
+    # Остановка: новые срабатывания прекращаются, начатые отправки дожидаются завершения
+    def stop(self, wait: bool = True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,114 @@
+import mimetypes
+import shutil
+import logging
+import subprocess
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from utils.function import file_sha256
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Константы
+ASSETS = Path("assets")
+THUMBNAILS_DIR = ASSETS / "thumbnails"
+THUMBNAIL_SIZE = (300, 300)
+THUMBNAIL_QUALITY = 80
+VIDEO_DECODE_TIMEOUT = 20
+FFMPEG = shutil.which("ffmpeg")
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preview")
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(digest: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(digest, threading.Lock())
+
+
+# Миниатюра изображения (для JPEG декодируется сразу в уменьшенном виде)
+def _image_thumbnail(source: Path, target: Path) -> bool:
+    if Image is None:
+        return False
+    with Image.open(source) as img:
+        img.draft("RGB", THUMBNAIL_SIZE)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(THUMBNAIL_SIZE)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(target, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return True
+
+
+# Кадр-обложка видео через ffmpeg, если он установлен
+def _video_poster(source: Path, target: Path) -> bool:
+    if not FFMPEG:
+        return False
+    scale = f"scale={THUMBNAIL_SIZE[0]}:{THUMBNAIL_SIZE[1]}:force_original_aspect_ratio=decrease"
+    # Сначала кадр на первой секунде, для коротких роликов — самый первый кадр
+    for seek in (["-ss", "1"], []):
+        cmd = [FFMPEG, "-v", "error", *seek, "-i", str(source), "-frames:v", "1",
+               "-vf", scale, "-f", "image2", "-y", str(target)]
+        try:
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=VIDEO_DECODE_TIMEOUT, check=True)
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.debug(f"ffmpeg не смог получить кадр из {source}: {e}")
+            continue
+        if target.exists() and target.stat().st_size > 0:
+            return True
+    return False
+
+
+# Строит (или берёт из кэша) миниатюру; кэш ключуется хешем содержимого
+def build_thumbnail(file_path) -> Optional[Path]:
+    source = Path(file_path)
+    mime_type, _ = mimetypes.guess_type(str(source))
+    if not mime_type or not (mime_type.startswith("image") or mime_type.startswith("video")):
+        return None
+
+    digest = file_sha256(source)
+    target = THUMBNAILS_DIR / f"{digest}.jpg"
+    with _lock_for(digest):
+        if target.exists():
+            return target
+        THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{digest}.tmp.jpg")
+        try:
+            if mime_type.startswith("image"):
+                ok = _image_thumbnail(source, tmp)
+            else:
+                ok = _video_poster(source, tmp)
+            if not ok:
+                return None
+            tmp.replace(target)
+            return target
+        except Exception as e:
+            logger.warning(f"Не удалось построить превью для {source}: {e}")
+            return None
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+# Фоновое построение превью, результат передаётся в callback (Path или None)
+def request_thumbnail(file_path, callback: Callable[[Optional[Path]], None]):
+    def job():
+        try:
+            thumb = build_thumbnail(file_path)
+        except Exception as e:
+            logger.warning(f"Ошибка построения превью: {e}")
+            thumb = None
+        try:
+            callback(thumb)
+        except Exception as e:
+            logger.warning(f"Ошибка обработки превью: {e}")
+
+    return _executor.submit(job)
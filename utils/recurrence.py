@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from utils.timezones import get_zone
+
+# Правила повтора постов (таблица post_rules): cron — выражение crontab из 5 полей в поясе правила,
+# interval — каждые N минут от начала. Следующее время считают триггеры APScheduler, поэтому
+# «каждый день в 09:00» остаётся 09:00 по местному времени и после перевода часов
+RULE_CRON, RULE_INTERVAL = "cron", "interval"
+
+
+def _aware_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# Триггер правила; ValueError — неверное выражение или интервал
+def make_trigger(kind: str, cron: Optional[str], interval_minutes: Optional[int], tz_name: Optional[str],
+                 starts_at: datetime):
+    zone = get_zone(tz_name)
+    if kind == RULE_CRON:
+        return CronTrigger.from_crontab(cron or "", timezone=zone)
+    if kind == RULE_INTERVAL:
+        if not interval_minutes or interval_minutes <= 0:
+            raise ValueError("Интервал должен быть больше нуля")
+        return IntervalTrigger(minutes=interval_minutes, start_date=_aware_utc(starts_at), timezone=zone)
+    raise ValueError(f"Неизвестный тип правила: {kind}")
+
+
+def trigger_for_rule(rule):
+    return make_trigger(rule.kind, rule.cron, rule.interval_minutes, rule.timezone, rule.starts_at)
+
+
+# Первое срабатывание не раньше start (UTC); None — правило больше не сработает
+def first_fire_time(trigger, start: datetime) -> Optional[datetime]:
+    fire_at = trigger.get_next_fire_time(None, _aware_utc(start))
+    return _naive_utc(fire_at) if fire_at else None
+
+
+# Срабатывания начиная с first (уже посчитанного) до until включительно; последним значением
+# возвращается следующее срабатывание после until (или None) — его правило сохраняет как курсор
+def fire_times(trigger, first: datetime, until: datetime,
+               ends_at: Optional[datetime] = None) -> Iterator[Optional[datetime]]:
+    fire_at = _aware_utc(first)
+    limit = _aware_utc(until)
+    end = _aware_utc(ends_at) if ends_at else None
+    while fire_at is not None and fire_at <= limit:
+        if end and fire_at > end:
+            fire_at = None
+            break
+        yield _naive_utc(fire_at)
+        fire_at = trigger.get_next_fire_time(fire_at, fire_at + timedelta(seconds=1))
+    if fire_at is not None and end and fire_at > end:
+        fire_at = None
+    yield _naive_utc(fire_at) if fire_at else None
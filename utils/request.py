@@ -1,38 +1,157 @@
+import re
+import json
 import mimetypes
 import requests
 import logging
-from typing import Optional
+import os
+import time
+import threading
+from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from utils.media_processing import prepare_media, media_digest, PreparedMedia
+from utils.multipart import MultipartStream, UploadCancelled
+from utils.metrics import TELEGRAM_REQUESTS, TELEGRAM_LATENCY, TELEGRAM_RATE_LIMITED, UPLOAD_BYTES
 
 # Логирование
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-BASE_TELEGRAM_API_URL = 'https://api.telegram.org/bot'
+# TG_API_BASE_URL — другой сервер Bot API (локальный telegram-bot-api или тестовый, см. benchmarks/fake_bot_api.py)
+BASE_TELEGRAM_API_URL = os.getenv("TG_API_BASE_URL", "https://api.telegram.org").rstrip("/") + "/bot"
 DEFAULT_TIMEOUT = 10
+# Минимальная ожидаемая скорость загрузки (байт/с) для расчёта таймаута больших файлов
+MIN_UPLOAD_SPEED = int(os.getenv("TG_MIN_UPLOAD_SPEED", str(64 * 1024)))
+MEDIA_GROUP_MIN, MEDIA_GROUP_MAX = 2, 10
+MEDIA_PREPARE_WORKERS = 4
+MEDIA_FIELDS = ("photo", "video", "animation", "audio", "document")
 
+# Классы неудачных ответов Bot API (поле "failure" в ответе _make_telegram_request)
+FAILURE_RATE_LIMITED = "rate_limited"      # 429, повтор через parameters.retry_after
+FAILURE_BLOCKED = "blocked"                # бот заблокирован, пользователь удалён, бот исключён из чата
+FAILURE_CHAT_NOT_FOUND = "chat_not_found"  # чата нет или он недоступен боту
+FAILURE_BAD_REQUEST = "bad_request"        # ошибка в самом запросе (текст, файл, параметры)
+FAILURE_TRANSIENT = "transient"            # сеть, таймаут, 5xx — можно повторить позже
+FAILURE_CANCELLED = "cancelled"
+# Постоянные ошибки получателя: такой чат кандидат на удаление из подписчиков
+DEAD_CHAT_FAILURES = frozenset({FAILURE_BLOCKED, FAILURE_CHAT_NOT_FOUND})
+_BLOCKED_MARKERS = ("bot was blocked by the user", "user is deactivated", "bot was kicked",
+                    "bot is not a member", "bot can't initiate conversation", "bot can't send messages to bots")
+_NOT_FOUND_MARKERS = ("chat not found", "user not found", "peer_id_invalid", "chat_id is empty")
+# 400 из-за самого file_id (истёк, выдан другому боту, не того типа): только тогда файл загружается заново
+_FILE_ID_MARKERS = ("file identifier", "file_id", "remote file", "file reference", "media_empty",
+                    "wrong type of the web page content", "failed to get http url content")
 
-def _make_telegram_request(method_url: str, data: dict, files: Optional[dict] = None) -> dict:
+# Кэш file_id: (токен бота, хеш файла, тип) -> file_id, чтобы не загружать один и тот же файл повторно
+_file_id_cache: dict[tuple, str] = {}
+_file_id_lock = threading.Lock()
+
+
+# Таймаут (connect, read), растущий с размером загрузки: медленный канал не обрывает большие видео
+def _upload_timeout(total_bytes: int) -> tuple:
+    return DEFAULT_TIMEOUT, DEFAULT_TIMEOUT + total_bytes / MIN_UPLOAD_SPEED
+
+
+# Класс ошибки по ответу Bot API; None — запрос успешен
+def classify_failure(response: dict) -> Optional[str]:
+    if response.get("ok"):
+        return None
+    code = response.get("error_code")
+    description = str(response.get("description", "")).lower()
+    if code == "CANCELLED":
+        return FAILURE_CANCELLED
+    if code == 429:
+        return FAILURE_RATE_LIMITED
+    if code == 403 or any(marker in description for marker in _BLOCKED_MARKERS):
+        return FAILURE_BLOCKED
+    if code == 400 and any(marker in description for marker in _NOT_FOUND_MARKERS):
+        return FAILURE_CHAT_NOT_FOUND
+    if isinstance(code, int):
+        return FAILURE_BAD_REQUEST if 400 <= code < 500 else FAILURE_TRANSIENT
+    # Свои коды (MISSING_PARAMETERS, FILE_TOO_LARGE, ...) — ошибка запроса, сетевые — временные
+    return FAILURE_TRANSIENT if code in (None, "REQUEST_EXCEPTION", "UNEXPECTED_ERROR") else FAILURE_BAD_REQUEST
+
+
+# Отправка по file_id не принята из-за самого file_id. Остальные ошибки (блокировка, 429, таймаут)
+# повторная загрузка не исправит, а после таймаута сообщение могло уже дойти
+def file_id_rejected(response: dict) -> bool:
+    description = str(response.get("description", "")).lower()
+    return classify_failure(response) == FAILURE_BAD_REQUEST and any(m in description for m in _FILE_ID_MARKERS)
+
+
+# Сколько секунд ждать после 429 (parameters.retry_after)
+def retry_after(response: dict) -> Optional[int]:
+    value = (response.get("parameters") or {}).get("retry_after")
+    return int(value) if isinstance(value, (int, float)) else None
+
+
+def _failed(description: str, error_code) -> dict:
+    response = {"ok": False, "description": description, "error_code": error_code}
+    response["failure"] = classify_failure(response)
+    return response
+
+
+# Текст исключения без токена: requests пишет в него URL вида .../bot<TOKEN>/method,
+# а описание ошибки попадает в логи, статусы постов и интерфейс
+_TOKEN_IN_URL = re.compile(r"bot\d+:[\w-]+")
+
+
+def _error_text(e: Exception) -> str:
+    return _TOKEN_IN_URL.sub("bot<TOKEN>", str(e)) or type(e).__name__
+
+
+def _make_telegram_request(method_url: str, data: dict, files: Optional[dict] = None,
+                           stream: Optional[MultipartStream] = None) -> dict:
+    method = method_url.rsplit('/', 1)[-1]
+    started, outcome = time.perf_counter(), "error"
     try:
-        response = requests.post(method_url, data=data, files=files, timeout=DEFAULT_TIMEOUT)
-        response.raise_for_status()
-        json_data = response.json()
-        if not json_data.get("ok"):
-            logger.warning(f"Telegram API error: {json_data}")
+        if stream is not None:
+            response = requests.post(method_url, data=stream, headers={"Content-Type": stream.content_type},
+                                     timeout=_upload_timeout(len(stream)))
+        else:
+            response = requests.post(method_url, data=data, files=files, timeout=DEFAULT_TIMEOUT)
+        # Ответ Bot API с ошибкой (4xx) тоже JSON: в нём описание и parameters.retry_after,
+        # поэтому raise_for_status только для ответов не от Bot API
+        try:
+            json_data = response.json()
+        except ValueError:
+            json_data = None
+        if not isinstance(json_data, dict) or "ok" not in json_data:
+            response.raise_for_status()
+            raise ValueError(f"Unexpected response: HTTP {response.status_code}")
+        if json_data.get("ok"):
+            outcome = "ok"
+            return json_data
+        json_data["failure"] = outcome = classify_failure(json_data)
+        if outcome == FAILURE_RATE_LIMITED:
+            TELEGRAM_RATE_LIMITED.inc(method=method)
+        if outcome in DEAD_CHAT_FAILURES:
+            logger.info(f"{method}: чат недоступен ({json_data.get('description')})")
+        else:
+            logger.warning(f"Telegram API error in {method}: {json_data}")
         return json_data
+    except UploadCancelled:
+        outcome = FAILURE_CANCELLED
+        logger.info(f"Upload to {method} cancelled")
+        return _failed("Загрузка отменена.", "CANCELLED")
     except requests.exceptions.RequestException as e:
-        logger.error(f"Request error to {method_url}: {e}")
-        return {
-            "ok": False,
-            "description": str(e),
-            "error_code": getattr(e.response, 'status_code', 'REQUEST_EXCEPTION')
-        }
+        if stream is not None and stream.cancel_event is not None and stream.cancel_event.is_set():
+            outcome = FAILURE_CANCELLED
+            return _failed("Загрузка отменена.", "CANCELLED")
+        status_code = getattr(e.response, 'status_code', None)
+        result = _failed(_error_text(e), status_code or 'REQUEST_EXCEPTION')
+        outcome = result["failure"]
+        if outcome == FAILURE_RATE_LIMITED:
+            TELEGRAM_RATE_LIMITED.inc(method=method)
+        logger.error(f"Request error to {method}: {type(e).__name__} (HTTP {status_code})")
+        return result
     except Exception as e:
-        logger.error(f"Unexpected error to {method_url}: {e}")
-        return {
-            "ok": False,
-            "description": f"Unexpected error: {e}",
-            "error_code": "UNEXPECTED_ERROR"
-        }
+        logger.error(f"Unexpected error to {method}: {_error_text(e)}")
+        return _failed(f"Unexpected error: {_error_text(e)}", "UNEXPECTED_ERROR")
+    finally:
+        TELEGRAM_LATENCY.observe(time.perf_counter() - started, method=method)
+        TELEGRAM_REQUESTS.inc(method=method, outcome=outcome)
+        if stream is not None:
+            UPLOAD_BYTES.inc(stream.sent)
 
 
 def sendMessage(token: str, channel: str, text: str) -> dict:
@@ -52,7 +171,7 @@ def sendMessage(token: str, channel: str, text: str) -> dict:
     return _make_telegram_request(method_url, data)
 
 
-def _detect_media_type(media_path: str):
+def detect_media_type(media_path: str):
     mime_type, _ = mimetypes.guess_type(media_path)
     if not mime_type:
         return "sendDocument", "document"
@@ -72,14 +191,25 @@ def sendMediaMessage(
     media_path: str,
     caption: Optional[str] = None,
     performer: Optional[str] = None,
-    title: Optional[str] = None
+    title: Optional[str] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    cancel_event: Optional[threading.Event] = None
 ) -> dict:
     if not all([token, channel, media_path]):
         return {"ok": False, "description": "Token, channel or file path missing."}
-    endpoint, field_name = _detect_media_type(media_path)
+    endpoint, field_name = detect_media_type(media_path)
     if not endpoint:
         return {"ok": False, "description": "Unknown media type."}
 
+    try:
+        prepared = prepare_media(media_path, endpoint, field_name)
+    except OSError as e:
+        logger.error(f"Media prepare error: {_error_text(e)}")
+        return {"ok": False, "description": _error_text(e)}
+    if prepared.error:
+        return {"ok": False, "description": prepared.error, "error_code": "FILE_TOO_LARGE"}
+    media_path, endpoint, field_name = prepared.path, prepared.endpoint, prepared.field_name
+
     method_url = f"{BASE_TELEGRAM_API_URL}{token}/{endpoint}"
     data = {"chat_id": channel}
 
@@ -96,8 +226,206 @@ def sendMediaMessage(
             data["caption"] = caption
             data["parse_mode"] = "HTML"
     try:
-        with open(media_path, "rb") as media:
-            return _make_telegram_request(method_url, data, files={field_name: media})
+        file_id = _get_cached_file_id(token, prepared)
+        if file_id:
+            result = _make_telegram_request(method_url, {**data, field_name: file_id})
+            if result.get("ok") or not file_id_rejected(result):
+                return result
+            _forget_file_id(token, prepared)
+        stream = MultipartStream(data, {field_name: media_path}, on_progress=on_progress, cancel_event=cancel_event)
+        result = _make_telegram_request(method_url, {}, stream=stream)
+        if result.get("ok"):
+            _remember_file_id(token, prepared, result.get("result") or {})
+        return result
     except Exception as e:
-        logger.error(f"Media send error: {e}")
-        return {"ok": False, "description": str(e)}
+        logger.error(f"Media send error: {_error_text(e)}")
+        return {"ok": False, "description": _error_text(e)}
+
+
+def _file_id_key(token: str, prepared: PreparedMedia) -> tuple:
+    return token, media_digest(prepared.path), prepared.field_name
+
+
+def _get_cached_file_id(token: str, prepared: PreparedMedia) -> Optional[str]:
+    with _file_id_lock:
+        return _file_id_cache.get(_file_id_key(token, prepared))
+
+
+def _forget_file_id(token: str, prepared: PreparedMedia):
+    with _file_id_lock:
+        _file_id_cache.pop(_file_id_key(token, prepared), None)
+
+
+# Достаёт тип и file_id из отправленного сообщения (для фото — самый большой размер)
+def _extract_media(message: dict, field_name: Optional[str] = None) -> tuple[Optional[str], Optional[str]]:
+    for field in (field_name, *MEDIA_FIELDS) if field_name else MEDIA_FIELDS:
+        media = message.get(field)
+        if isinstance(media, list):
+            media = media[-1] if media else None
+        if media and media.get("file_id"):
+            return field, media["file_id"]
+    return None, None
+
+
+def _extract_file_id(message: dict, field_name: str) -> Optional[str]:
+    return _extract_media(message, field_name)[1]
+
+
+def _remember_file_id(token: str, prepared: PreparedMedia, message: dict):
+    file_id = _extract_file_id(message, prepared.field_name)
+    if file_id:
+        with _file_id_lock:
+            _file_id_cache[_file_id_key(token, prepared)] = file_id
+
+
+def _prepare_group_item(media_path: str) -> PreparedMedia:
+    endpoint, field_name = detect_media_type(media_path)
+    return prepare_media(media_path, endpoint, field_name)
+
+
+# Проверка состава альбома по правилам sendMediaGroup
+def _media_group_error(items: list[PreparedMedia]) -> Optional[str]:
+    kinds = {item.field_name for item in items}
+    if "animation" in kinds:
+        return "GIF нельзя отправить в альбоме."
+    for solo_kind in ("document", "audio"):
+        if solo_kind in kinds and kinds != {solo_kind}:
+            return "Документы и аудио нельзя смешивать с другими типами в одном альбоме."
+    return None
+
+
+def _build_media_group(token: str, items: list[PreparedMedia], caption: Optional[str], use_cache: bool):
+    media, files = [], {}
+    for i, item in enumerate(items):
+        entry = {"type": item.field_name}
+        file_id = _get_cached_file_id(token, item) if use_cache else None
+        if file_id:
+            entry["media"] = file_id
+        else:
+            files[f"file{i}"] = item.path
+            entry["media"] = f"attach://file{i}"
+        if i == 0 and caption:
+            entry["caption"] = caption
+            entry["parse_mode"] = "HTML"
+        media.append(entry)
+    return media, files
+
+
+def _prepare_media_group(media_paths: list[str]):
+    with ThreadPoolExecutor(max_workers=min(MEDIA_PREPARE_WORKERS, len(media_paths))) as pool:
+        items = list(pool.map(_prepare_group_item, media_paths))
+    for item in items:
+        if item.error:
+            return items, item.error
+    return items, _media_group_error(items)
+
+
+# Проверка альбома до отправки (лимиты и допустимое сочетание типов)
+def check_media_group(media_paths: list[str]) -> Optional[str]:
+    if not MEDIA_GROUP_MIN <= len(media_paths) <= MEDIA_GROUP_MAX:
+        return f"В альбоме должно быть от {MEDIA_GROUP_MIN} до {MEDIA_GROUP_MAX} файлов."
+    try:
+        return _prepare_media_group(media_paths)[1]
+    except OSError as e:
+        return str(e)
+
+
+def sendMediaGroup(token: str, channel: str, media_paths: list[str], caption: Optional[str] = None,
+                   on_progress: Optional[Callable[[int, int], None]] = None,
+                   cancel_event: Optional[threading.Event] = None) -> dict:
+    if not all([token, channel, media_paths]):
+        return {"ok": False, "description": "Token, channel or files missing.", "error_code": "MISSING_PARAMETERS"}
+    if not MEDIA_GROUP_MIN <= len(media_paths) <= MEDIA_GROUP_MAX:
+        return {"ok": False, "description": f"В альбоме должно быть от {MEDIA_GROUP_MIN} до {MEDIA_GROUP_MAX} файлов.",
+                "error_code": "BAD_MEDIA_GROUP"}
+
+    # Части готовятся параллельно: ужатие, проверка лимитов и хеширование для поиска file_id
+    try:
+        items, error = _prepare_media_group(media_paths)
+    except OSError as e:
+        logger.error(f"Media group prepare error: {_error_text(e)}")
+        return {"ok": False, "description": _error_text(e)}
+    if error:
+        return {"ok": False, "description": error, "error_code": "BAD_MEDIA_GROUP"}
+
+    method_url = f"{BASE_TELEGRAM_API_URL}{token}/sendMediaGroup"
+    result = {}
+    for use_cache in (True, False):
+        media, files = _build_media_group(token, items, caption, use_cache)
+        fields = {"chat_id": channel, "media": json.dumps(media, ensure_ascii=False)}
+        if files:
+            stream = MultipartStream(fields, files, on_progress=on_progress, cancel_event=cancel_event)
+            result = _make_telegram_request(method_url, {}, stream=stream)
+        else:
+            result = _make_telegram_request(method_url, fields)
+        if result.get("ok"):
+            for item, message in zip(items, result.get("result") or []):
+                _remember_file_id(token, item, message)
+            return result
+        if len(files) == len(items) or not file_id_rejected(result):
+            break
+        # Какой-то из закэшированных file_id не принят — повторяем с полной загрузкой
+        for item in items:
+            _forget_file_id(token, item)
+    return result
+
+
+def deleteMessage(token: str, chat_id: str, message_id: int) -> dict:
+    method_url = f"{BASE_TELEGRAM_API_URL}{token}/deleteMessage"
+    return _make_telegram_request(method_url, {"chat_id": chat_id, "message_id": message_id})
+
+
+# Загрузка медиа в служебный чат только ради file_id; сообщения сразу удаляются
+def uploadMediaForFileIds(token: str, chat_id: str, media_paths: list[str]) -> dict:
+    if len(media_paths) > 1:
+        result = sendMediaGroup(token, chat_id, media_paths)
+    else:
+        result = sendMediaMessage(token, chat_id, media_paths[0])
+    if not result.get("ok"):
+        return result
+    messages = result["result"] if isinstance(result.get("result"), list) else [result.get("result") or {}]
+
+    media = []
+    for message in messages:
+        field, file_id = _extract_media(message)
+        if file_id:
+            media.append({"type": field, "file_id": file_id})
+        deleteMessage(token, chat_id, message.get("message_id"))
+    if len(media) != len(media_paths):
+        return {"ok": False, "description": "Telegram не вернул file_id для всех файлов.", "error_code": "NO_FILE_ID"}
+    return {"ok": True, "result": media}
+
+
+# Отправка по заранее полученным file_id — без загрузки файлов
+def sendMediaByFileIds(token: str, channel: str, media: list[dict], caption: Optional[str] = None) -> dict:
+    if not all([token, channel, media]):
+        return {"ok": False, "description": "Token, channel or media missing.", "error_code": "MISSING_PARAMETERS"}
+    if len(media) == 1:
+        field = media[0]["type"]
+        method_url = f"{BASE_TELEGRAM_API_URL}{token}/send{field.capitalize()}"
+        data = {"chat_id": channel, field: media[0]["file_id"]}
+        if caption:
+            data["caption"] = caption
+            data["parse_mode"] = "HTML"
+        return _make_telegram_request(method_url, data)
+
+    entries = []
+    for i, item in enumerate(media):
+        entry = {"type": item["type"], "media": item["file_id"]}
+        if i == 0 and caption:
+            entry["caption"] = caption
+            entry["parse_mode"] = "HTML"
+        entries.append(entry)
+    method_url = f"{BASE_TELEGRAM_API_URL}{token}/sendMediaGroup"
+    return _make_telegram_request(method_url, {"chat_id": channel, "media": json.dumps(entries, ensure_ascii=False)})
+
+
+# Отправка поста: текст, один файл или альбом
+def send_post(token: str, channel: str, message: str, media_paths: list[str],
+              on_progress=None, cancel_event=None) -> dict:
+    if len(media_paths) > 1:
+        return sendMediaGroup(token, channel, media_paths, message, on_progress=on_progress, cancel_event=cancel_event)
+    if media_paths:
+        return sendMediaMessage(token, channel, media_paths[0], message,
+                                on_progress=on_progress, cancel_event=cancel_event)
+    return sendMessage(token, channel, message)
@@ -0,0 +1,388 @@
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import JobLookupError
+from utils.database import Database
+from utils.metrics import SCHEDULER_LAG, SUBSCRIBERS_PRUNED
+from utils.db_profiler import PROFILER
+from utils.leases import WORKER_ID, LEASE_SECONDS, LeaseLost
+from utils.broadcast import run_broadcast_chunk
+from utils.post_timer import PostTimer
+from utils.timezones import utc_now
+from utils.recurrence import make_trigger, trigger_for_rule, first_fire_time, fire_times
+from utils.request import send_post, sendMediaByFileIds, uploadMediaForFileIds, file_id_rejected
+from utils.channels import get_targets, fan_out_post, parse_channel_ids
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+ASSETS = "assets"
+# Планировщик и время постов в БД — в UTC; пояс пользователя учитывается только в интерфейсе
+SCHEDULER_TIMEZONE = 'UTC'
+
+# Предзагрузка медиа: за сколько минут до отправки и как часто проверять
+PREWARM_CHAT_ID = os.getenv("TG_PREWARM_CHAT_ID")
+PREWARM_HORIZON_MINUTES = int(os.getenv("TG_PREWARM_HORIZON_MINUTES", "30"))
+PREWARM_INTERVAL_SECONDS = int(os.getenv("TG_PREWARM_INTERVAL_SECONDS", "60"))
+# После неудачи пауза удваивается (интервал, 2×, 4×, ...); после стольких попыток пост не предзагружается
+PREWARM_MAX_FAILURES = int(os.getenv("TG_PREWARM_MAX_FAILURES", "5"))
+
+# Очистка подписчиков, недоступных SUBSCRIBER_FAILURE_THRESHOLD рассылок подряд:
+# SUBSCRIBER_PRUNE_MODE=delete — удалить, mark — только исключить из рассылок
+SUBSCRIBER_FAILURE_THRESHOLD = int(os.getenv("SUBSCRIBER_FAILURE_THRESHOLD", "2"))
+SUBSCRIBER_PRUNE_MODE = os.getenv("SUBSCRIBER_PRUNE_MODE", "delete")
+SUBSCRIBER_PRUNE_INTERVAL_MINUTES = int(os.getenv("SUBSCRIBER_PRUNE_INTERVAL_MINUTES", "60"))
+
+# Несколько экземпляров на одной БД: посты и порции рассылок выбираются опросом и захватываются арендой
+# (utils/leases.py), поэтому каждый пост уходит один раз. Опрос заодно подхватывает посты, чьи задачи
+# планировщика потерялись при перезапуске процесса
+POST_POLL_SECONDS = int(os.getenv("POST_POLL_SECONDS", "10"))
+BROADCAST_POLL_SECONDS = int(os.getenv("BROADCAST_POLL_SECONDS", "5"))
+# Сколько порций рассылок экземпляр отправляет одновременно
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "2"))
+# Таймер постов держит в памяти посты на POST_TIMER_HORIZON_MINUTES вперёд и подгружает следующие
+# каждые POST_TIMER_REFILL_SECONDS; POST_SEND_WORKERS — сколько постов отправляется одновременно
+POST_TIMER_HORIZON_MINUTES = int(os.getenv("POST_TIMER_HORIZON_MINUTES", "60"))
+POST_TIMER_REFILL_SECONDS = int(os.getenv("POST_TIMER_REFILL_SECONDS", "30"))
+POST_SEND_WORKERS = int(os.getenv("POST_SEND_WORKERS", "4"))
+# Правила повтора: посты создаются на RULE_WINDOW_HOURS вперёд, окно сдвигается раз в RULE_MATERIALIZE_MINUTES
+RULE_WINDOW_HOURS = int(os.getenv("RULE_WINDOW_HOURS", "48"))
+RULE_MATERIALIZE_MINUTES = int(os.getenv("RULE_MATERIALIZE_MINUTES", "10"))
+# Пропущенные срабатывания (процесс был остановлен) старше этого срока не создаются — курсор догоняет текущее время
+RULE_MISFIRE_GRACE_MINUTES = int(os.getenv("RULE_MISFIRE_GRACE_MINUTES", "5"))
+# HEADLESS_WORKER=1 — фоновую работу (опрос постов, рассылки, очистку) выполняет отдельный процесс
+# python -m worker, а планировщик окна Flet её не запускает
+HEADLESS_WORKER = os.getenv("HEADLESS_WORKER", "").lower() in ("1", "true", "yes")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_post_timer: PostTimer | None = None
+_jobs_lock = threading.Lock()
+# Остановка процесса: новые посты и порции не захватываются, начатые порции отпускаются
+_draining = threading.Event()
+_db = None
+
+
+def _get_db() -> Database:
+    global _db
+    if _db is None:
+        _db = Database()
+    return _db
+
+
+# Общий планировщик на процесс (вместо отдельного на каждую страницу)
+def get_scheduler() -> BackgroundScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BackgroundScheduler(timezone=SCHEDULER_TIMEZONE)
+            try:
+                _scheduler.start()
+            except Exception as e:
+                print(f"Ошибка запуска планировщика: {e}")
+            if not HEADLESS_WORKER:
+                start_background_jobs(_scheduler)
+        return _scheduler
+
+
+# Фоновые задачи экземпляра: в окне Flet (без HEADLESS_WORKER) или в python -m worker.
+# Повторный вызов ничего не делает — второй таймер постов дублировал бы срабатывания
+def start_background_jobs(scheduler: BackgroundScheduler):
+    global _post_timer
+    with _jobs_lock:
+        if _post_timer is not None:
+            return
+        _post_timer = PostTimer(_execute_scheduled_post_wrapper, workers=POST_SEND_WORKERS).start()
+    materialize_post_rules()
+    refill_post_timer()
+    scheduler.add_job(materialize_post_rules, 'interval', minutes=RULE_MATERIALIZE_MINUTES,
+                      id="materialize_post_rules", replace_existing=True, max_instances=1)
+    scheduler.add_job(refill_post_timer, 'interval', seconds=POST_TIMER_REFILL_SECONDS,
+                      id="refill_post_timer", replace_existing=True, max_instances=1)
+    if PREWARM_CHAT_ID:
+        scheduler.add_job(prewarm_due_media, 'interval', seconds=PREWARM_INTERVAL_SECONDS,
+                          id="prewarm_media", replace_existing=True, max_instances=1,
+                          next_run_time=datetime.now(timezone.utc))
+    else:
+        logger.info("TG_PREWARM_CHAT_ID не задан — предзагрузка медиа отключена")
+    scheduler.add_job(prune_dead_subscribers, 'interval', minutes=SUBSCRIBER_PRUNE_INTERVAL_MINUTES,
+                      id="prune_dead_subscribers", replace_existing=True, max_instances=1)
+    scheduler.add_job(dispatch_due_posts, 'interval', seconds=POST_POLL_SECONDS,
+                      id="dispatch_due_posts", replace_existing=True, max_instances=1,
+                      next_run_time=datetime.now(timezone.utc))
+    scheduler.add_job(dispatch_broadcast_chunks, 'interval', seconds=BROADCAST_POLL_SECONDS,
+                      id="dispatch_broadcast_chunks", replace_existing=True,
+                      max_instances=BROADCAST_CONCURRENCY, next_run_time=datetime.now(timezone.utc))
+    scheduler.add_job(renew_leases, 'interval', seconds=max(1, LEASE_SECONDS // 3),
+                      id="renew_leases", replace_existing=True, max_instances=1)
+
+
+# Плавная остановка: захваты прекращаются, начатые порции рассылок сохраняют курсор и отпускают аренду,
+# планировщик ждёт завершения выполняющихся задач не дольше timeout
+def drain(timeout: float = 30.0) -> bool:
+    _draining.set()
+    if _scheduler is None:
+        return True
+
+    def stop():
+        _scheduler.shutdown(wait=True)
+        if _post_timer is not None:
+            _post_timer.stop(wait=True)
+
+    stopper = threading.Thread(target=stop, daemon=True)
+    stopper.start()
+    stopper.join(timeout)
+    return not stopper.is_alive()
+
+
+# Пост в пределах горизонта сразу попадает в таймер; более поздний загрузит refill_post_timer.
+# Без фоновых задач в этом процессе (HEADLESS_WORKER) пост подхватит таймер python -m worker
+def schedule_post(link_post: str, run_date: datetime):
+    get_scheduler()
+    if _post_timer is not None:
+        _post_timer.push(run_date, link_post)
+
+
+# Пачка постов (scheduled_datetime, link_post) одной постановкой в таймер — для импорта контент-плана.
+# Планировщик здесь не запускается: в CLI (python -m utils.content_plan) таймера нет, и посты
+# подхватит refill работающего приложения или worker
+def schedule_posts(posts: list[tuple[datetime, str]]) -> int:
+    if _post_timer is None:
+        return 0
+    return _post_timer.push_many(posts)
+
+
+# Правило повтора поста; ValueError — неверное выражение cron или интервал.
+# Посты ближайшего окна создаются сразу, остальные — задачей materialize_post_rules по мере приближения
+def create_post_rule(user_id: int, message: str, kind: str, starts_at: datetime, tz_name: str | None,
+                     cron: str | None = None, interval_minutes: int | None = None, ends_at: datetime | None = None,
+                     image_filename: str | None = None, media_files: list[str] | None = None,
+                     channel_ids: list[int] | None = None) -> int | None:
+    trigger = make_trigger(kind, cron, interval_minutes, tz_name, starts_at)
+    next_fire_at = first_fire_time(trigger, starts_at)
+    if next_fire_at is None or (ends_at and next_fire_at > ends_at):
+        raise ValueError("Правило не сработает ни разу")
+    rule_id = _get_db().insert_post_rule(user_id, message, kind, starts_at, next_fire_at, cron=cron,
+                                         interval_minutes=interval_minutes, tz_name=tz_name, ends_at=ends_at,
+                                         image_filename=image_filename, media_files=media_files,
+                                         channel_ids=channel_ids)
+    if rule_id:
+        materialize_post_rules(rule_id)
+    return rule_id
+
+
+# Остановка правила и отмена его ожидающих постов
+def stop_post_rule(rule_id: int, user_id: int) -> bool:
+    links = _get_db().stop_post_rule(rule_id, user_id)
+    if links is None:
+        return False
+    if _post_timer is not None:
+        for link_post in links:
+            _post_timer.discard(link_post)
+    return True
+
+
+# Создание постов по правилам на окно RULE_WINDOW_HOURS: для каждого правила — срабатывания от курсора
+# next_fire_at до конца окна; год ежедневного правила не превращается в 365 строк заранее
+def materialize_post_rules(rule_id: int | None = None):
+    if _draining.is_set():
+        return
+    db = _get_db()
+    now = utc_now()
+    until = now + timedelta(hours=RULE_WINDOW_HOURS)
+    grace_floor = now - timedelta(minutes=RULE_MISFIRE_GRACE_MINUTES)
+    created = 0
+    while True:
+        rules = db.get_rules_to_materialize(until, rule_id=rule_id)
+        if not rules:
+            break
+        progressed = False
+        for rule in rules:
+            try:
+                trigger = trigger_for_rule(rule)
+                first = rule.next_fire_at
+                if first < grace_floor:
+                    skipped_from, first = first, first_fire_time(trigger, grace_floor)
+                    logger.warning(f"Правило {rule.id}: пропущенные срабатывания с {skipped_from} не создаются")
+                times = list(fire_times(trigger, first, until, rule.ends_at)) if first else [None]
+            except ValueError as e:
+                logger.error(f"Правило {rule.id} с ошибкой, пропускаем: {e}")
+                continue
+            posts = db.materialize_rule(rule, times[:-1], times[-1])
+            if posts is None:
+                continue
+            progressed = True
+            created += len(posts)
+            if _post_timer is not None:
+                _post_timer.push_many(posts)
+        if not progressed:
+            break
+    if created:
+        logger.info(f"По правилам повтора создано постов: {created}")
+
+
+# Подгрузка в таймер постов следующего горизонта (и просроченных, например после перезапуска)
+def refill_post_timer():
+    if _post_timer is None or _draining.is_set():
+        return
+    until = utc_now() + timedelta(minutes=POST_TIMER_HORIZON_MINUTES)
+    added = _post_timer.load(_get_db().get_pending_post_times(until), until)
+    if added:
+        logger.info(f"В таймер постов добавлено: {added}, всего {len(_post_timer)}")
+
+
+# Перенос поста: новая дата в БД и новая запись в таймере (старая будет пропущена)
+def reschedule_post(link_post: str, run_date: datetime, user_id: int) -> bool:
+    if not _get_db().reschedule_pending_post(link_post, run_date, user_id):
+        return False
+    schedule_post(link_post, run_date)
+    return True
+
+
+# Отмена поста: статус cancelled и удаление из таймера
+def cancel_post(link_post: str, user_id: int) -> bool:
+    if not _get_db().cancel_pending_post(link_post, user_id):
+        return False
+    if _post_timer is not None:
+        _post_timer.discard(link_post)
+    return True
+
+
+def _post_media_paths(post) -> list[str]:
+    stored_files = json.loads(post.media_files) if post.media_files else [post.image_filename] if post.image_filename else []
+    return [str(Path(ASSETS) / name) for name in stored_files if (Path(ASSETS) / name).exists()]
+
+
+# Загрузка медиа ближайших постов заранее: в момент отправки остаётся один лёгкий вызов API по file_id
+def prewarm_due_media():
+    db = _get_db()
+    until = utc_now() + timedelta(minutes=PREWARM_HORIZON_MINUTES)
+    for post in db.get_posts_to_prewarm(until, PREWARM_MAX_FAILURES):
+        user = db.get_user_by_id(post.user_id)
+        media_paths = _post_media_paths(post)
+        if not user or not user.user_telegram_token or not media_paths:
+            res = {"description": "нет токена бота или файлов поста"}
+        else:
+            res = uploadMediaForFileIds(user.user_telegram_token, PREWARM_CHAT_ID, media_paths)
+        if res.get("ok"):
+            db.set_post_media_file_ids(post.link_post, res["result"])
+            logger.info(f"Медиа поста {post.link_post} загружено заранее")
+        else:
+            retry_at = utc_now() + timedelta(seconds=PREWARM_INTERVAL_SECONDS * 2 ** post.prewarm_failures)
+            db.record_prewarm_failure(post.link_post, retry_at)
+            logger.warning(f"Не удалось заранее загрузить медиа поста {post.link_post} "
+                           f"(попытка {post.prewarm_failures + 1}): {res.get('description')}")
+
+
+def prune_dead_subscribers():
+    pruned = _get_db().prune_dead_subscribers(SUBSCRIBER_FAILURE_THRESHOLD,
+                                              mark_only=SUBSCRIBER_PRUNE_MODE == "mark")
+    if pruned:
+        SUBSCRIBERS_PRUNED.inc(pruned, mode=SUBSCRIBER_PRUNE_MODE)
+        logger.info(f"Недоступных подписчиков {'помечено' if SUBSCRIBER_PRUNE_MODE == 'mark' else 'удалено'}: {pruned}")
+
+
+# Немедленный запуск разбора порций (после постановки рассылки), не дожидаясь интервала опроса
+def wake_broadcast_dispatcher():
+    try:
+        get_scheduler().modify_job("dispatch_broadcast_chunks", next_run_time=datetime.now(timezone.utc))
+    except JobLookupError:
+        # Рассылки разбирает python -m worker
+        pass
+
+
+def renew_leases():
+    _get_db().renew_leases(WORKER_ID, LEASE_SECONDS)
+
+
+# Разбор наступивших постов, в том числе брошенных упавшим экземпляром (аренда истекла)
+def dispatch_due_posts():
+    if _draining.is_set():
+        return
+    db = _get_db()
+    for post in db.claim_due_posts(WORKER_ID, LEASE_SECONDS):
+        _send_claimed_post(post, db)
+
+
+# Порции берутся по одной, пока есть свободные; параллельность ограничена max_instances задачи
+def dispatch_broadcast_chunks():
+    db = _get_db()
+    while not _draining.is_set():
+        claimed = db.claim_broadcast_chunks(WORKER_ID, LEASE_SECONDS)
+        if not claimed:
+            return
+        chunk, job = claimed[0]
+        user = db.get_user_by_id(job.user_id)
+        if not user or not user.user_telegram_token:
+            logger.warning(f"Рассылка {job.id}: бот пользователя не настроен, порция {chunk.id} пропущена")
+            db.finish_broadcast_chunk(chunk.id, job.id, WORKER_ID, chunk.fencing_token,
+                                      chunk.sent, chunk.failed, chunk.dead)
+            continue
+        try:
+            result = run_broadcast_chunk(db, user.user_telegram_token, chunk, job, WORKER_ID, LEASE_SECONDS,
+                                         stop_event=_draining)
+            logger.info(f"Порция {chunk.id} рассылки {job.id}: отправлено {result.sent}, ошибок {result.failed}")
+        except LeaseLost as ex:
+            logger.warning(str(ex))
+        except Exception as ex:
+            # Аренда истечёт, и порцию продолжит этот или другой экземпляр
+            logger.error(f"Ошибка порции {chunk.id} рассылки {job.id}: {ex}")
+
+
+# Отправка планированных постов: таймер только захватывает пост, как и опрос
+def _execute_scheduled_post_wrapper(link_post: str):
+    try:
+        _execute_scheduled_post_logic(link_post, _get_db())
+    except Exception as ex:
+        print(f"[FATAL] Ошибка выполнения задачи {link_post}: {ex}")
+
+
+def _execute_scheduled_post_logic(link_post: str, db: Database):
+    for post in db.claim_due_posts(WORKER_ID, LEASE_SECONDS, limit=1, link_post=link_post):
+        _send_claimed_post(post, db)
+
+
+@PROFILER.flow("scheduled post")
+def _send_claimed_post(post, db: Database):
+    link_post = post.link_post
+    SCHEDULER_LAG.observe(max(0.0, (utc_now() - post.scheduled_datetime).total_seconds()))
+    user = db.get_user_by_id(post.user_id)
+    if not user:
+        db.finish_post(post.id, WORKER_ID, post.fencing_token, "failed")
+        return
+    try:
+        channel_ids = parse_channel_ids(post.channel_ids)
+        if channel_ids:
+            status = _fan_out_claimed_post(post, user, channel_ids, db)
+        else:
+            token, channel = user.user_telegram_token, user.user_telegram_channel
+            res = None
+            if post.media_file_ids:
+                res = sendMediaByFileIds(token, channel, json.loads(post.media_file_ids), post.message)
+                if file_id_rejected(res):
+                    logger.warning(f"file_id поста {link_post} не принят, загружаем файлы заново")
+                    res = None
+            if res is None:
+                res = send_post(token, channel, post.message, _post_media_paths(post))
+            status = "sent" if res.get("ok") else "failed"
+    except Exception:
+        status = "failed"
+    if not db.finish_post(post.id, WORKER_ID, post.fencing_token, status):
+        logger.warning(f"Пост {link_post} перехвачен другим экземпляром, статус {status} не записан")
+
+
+# Пост в несколько каналов: sent — во все, partial — в часть, failed — ни в один
+def _fan_out_claimed_post(post, user, channel_ids: list[int], db: Database) -> str:
+    targets = get_targets(db, user, channel_ids)
+    file_ids = (user.user_telegram_token, json.loads(post.media_file_ids)) if post.media_file_ids else None
+    results = fan_out_post(targets, post.message, _post_media_paths(post), file_ids=file_ids)
+    for result in results:
+        if not result.ok:
+            logger.warning(f"Пост {post.link_post} не опубликован в {result.target.chat_id}: {result.description}")
+    sent = sum(result.ok for result in results)
+    return "sent" if results and sent == len(results) else "partial" if sent else "failed"
+
@@ -0,0 +1,50 @@
+import re
+import json
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+# Параметр deep-link /start <payload>: Telegram допускает A-Z, a-z, 0-9, _ и -, до 64 символов
+_PAYLOAD_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Тег подписчика: буквы, цифры, _ и -
+_TAG_RE = re.compile(r"^[\w-]{1,64}$")
+
+
+# Сегмент аудитории рассылки; пустые поля не ограничивают выборку, теги — «любой из»
+class Segment(NamedTuple):
+    language_code: Optional[str] = None
+    source: Optional[str] = None
+    joined_from: Optional[datetime] = None
+    joined_to: Optional[datetime] = None
+    tags: tuple = ()
+
+    def is_all(self) -> bool:
+        return not any(self)
+
+    # Сегмент хранится в задании рассылки (broadcast_jobs.segment) как JSON
+    def to_json(self) -> str:
+        return json.dumps({"language_code": self.language_code, "source": self.source,
+                           "joined_from": self.joined_from.isoformat() if self.joined_from else None,
+                           "joined_to": self.joined_to.isoformat() if self.joined_to else None,
+                           "tags": list(self.tags)})
+
+    @classmethod
+    def from_json(cls, value: str | None) -> "Segment":
+        data = json.loads(value) if value else {}
+        parse = lambda key: datetime.fromisoformat(data[key]) if data.get(key) else None
+        return cls(language_code=data.get("language_code"), source=data.get("source"),
+                   joined_from=parse("joined_from"), joined_to=parse("joined_to"), tags=tuple(data.get("tags") or ()))
+
+
+# Источник подписки из текста команды "/start <payload>"
+def deep_link_source(text: Optional[str]) -> Optional[str]:
+    parts = (text or "").split(maxsplit=1)
+    payload = parts[1].strip() if len(parts) > 1 else ""
+    return payload if _PAYLOAD_RE.match(payload) else None
+
+
+# Теги из строки "vip; ru-promo, beta" (разделители ; , | и пробел)
+def parse_tags(value) -> list[str]:
+    if not value:
+        return []
+    items = value if isinstance(value, (list, tuple)) else re.split(r"[;,|\s]+", str(value))
+    return [tag for tag in dict.fromkeys(str(item).strip().lower() for item in items) if _TAG_RE.match(tag)]
@@ -1,4 +1,5 @@
 # style.py
+import flet as ft
 
 # Настройки окна
 DEFAULT_WIDTH_WINDOW = 1300
@@ -64,3 +65,34 @@ def get_colors(page_theme_mode: str):
     if page_theme_mode == "dark":
         return dark_theme_colors
     return light_theme_colors
+
+
+# Тема Flet из палитры: цвета задаются ролями ColorScheme, и контролы ссылаются на роли
+# (ft.Colors.SURFACE, ft.Colors.PRIMARY...), а не на hex. При смене темы клиенту уходит
+# только page.theme_mode, клиент сам перекрашивает всё дерево.
+# Фон полей ввода — secondary_container: surface_container_highest нет в ColorScheme этой версии Flet
+def build_theme(colors: dict) -> ft.Theme:
+    return ft.Theme(
+        scaffold_bgcolor=colors["primary_bg"],
+        color_scheme=ft.ColorScheme(
+            primary=colors["accent"],
+            on_primary=colors["button_text"],
+            primary_container=colors["accent_subtle"],
+            surface=colors["secondary_bg"],
+            on_surface=colors["primary_text"],
+            on_surface_variant=colors["secondary_text"],
+            surface_container_low=colors["card_bg"],
+            secondary_container=colors["input_bg"],
+            outline=colors["border_color_input"],
+            outline_variant=colors["divider_color"],
+            error=colors["error"],
+        ),
+    )
+
+
+# Светлая и тёмная темы страницы (задаются один раз за сессию)
+def apply_theme(page: ft.Page):
+    if page.theme is None:
+        page.theme = build_theme(light_theme_colors)
+        page.dark_theme = build_theme(dark_theme_colors)
+    page.theme_mode = page.client_storage.get("theme_mode") or "light"
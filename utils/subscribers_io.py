@@ -0,0 +1,197 @@
+import re
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Iterator, NamedTuple, Optional
+from utils.segments import parse_tags
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Строк в одной транзакции импорта
+BATCH_SIZE = 5000
+FORMATS = ("csv", "jsonl")
+# Колонки, в которых ищется chat_id (CSV-заголовок или ключи JSONL)
+CHAT_ID_FIELDS = ("telegram_chat_id", "chat_id", "id")
+_CHAT_ID_RE = re.compile(r"^-?\d{1,20}$")
+EXPORT_FIELDS = ("telegram_chat_id", "joined_at", "language_code", "source", "tags")
+
+
+class TransferResult(NamedTuple):
+    rows: int
+    inserted: int
+    skipped: int
+    invalid: int
+    elapsed: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    fmt = (fmt or Path(path).suffix.lstrip(".")).lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат файла: {path} (нужен .csv или .jsonl)")
+    return fmt
+
+
+def _parse_joined_at(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip().replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+# Записи из CSV: с заголовком или без (тогда chat_id — первая колонка)
+def _read_csv(file) -> Iterator[dict]:
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    names = [name.strip().lower() for name in header]
+    chat_index = next((names.index(name) for name in CHAT_ID_FIELDS if name in names), None)
+    if chat_index is None:
+        names = ["telegram_chat_id"]
+        yield {"telegram_chat_id": header[0] if header else ""}
+    else:
+        names[chat_index] = "telegram_chat_id"
+    for row in reader:
+        if row:
+            yield dict(zip(names, row))
+
+
+def _read_jsonl(file) -> Iterator[dict]:
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            yield {}
+            continue
+        if not isinstance(record, dict):
+            yield {"telegram_chat_id": record}
+            continue
+        record["telegram_chat_id"] = next((record[name] for name in CHAT_ID_FIELDS if name in record), "")
+        yield record
+
+
+def _optional(value, limit: int) -> Optional[str]:
+    value = str(value or "").strip()
+    return value[:limit] if value else None
+
+
+# Пачка: строки одной транзакцией, затем теги — по одному INSERT ... SELECT на тег
+def _flush(db, user_id: int, batch: list[dict], tagged: dict[str, list[str]]) -> int:
+    inserted = db.insert_subscribers_batch(batch)
+    for tag, chat_ids in tagged.items():
+        db.tag_subscribers(user_id, tag, chat_ids)
+    batch.clear()
+    tagged.clear()
+    return inserted
+
+
+# Потоковый импорт: файл читается построчно, в память попадает не больше одной пачки.
+# Кроме chat_id и joined_at понимает language_code, source и tags ("vip;beta")
+def import_subscribers(db, user_id: int, path: str, fmt: Optional[str] = None, batch_size: int = BATCH_SIZE,
+                       on_progress: Optional[Callable[[int, int], None]] = None) -> TransferResult:
+    fmt = detect_format(path, fmt)
+    rows = inserted = invalid = 0
+    batch, tagged = [], {}
+    started = time.perf_counter()
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        for record in (_read_csv(file) if fmt == "csv" else _read_jsonl(file)):
+            rows += 1
+            chat_id = str(record.get("telegram_chat_id", "")).strip()
+            if not _CHAT_ID_RE.match(chat_id):
+                invalid += 1
+                continue
+            batch.append({"user_id": user_id, "telegram_chat_id": chat_id,
+                          "joined_at": _parse_joined_at(record.get("joined_at")) or datetime.utcnow(),
+                          "language_code": _optional(record.get("language_code"), 16),
+                          "source": _optional(record.get("source"), 64)})
+            for tag in parse_tags(record.get("tags")):
+                tagged.setdefault(tag, []).append(chat_id)
+            if len(batch) >= batch_size:
+                inserted += _flush(db, user_id, batch, tagged)
+                if on_progress:
+                    on_progress(rows, inserted)
+    inserted += _flush(db, user_id, batch, tagged)
+    elapsed = time.perf_counter() - started
+    result = TransferResult(rows, inserted, rows - invalid - inserted, invalid, elapsed)
+    logger.info(f"Импорт подписчиков user_id={user_id}: {rows} строк, новых {inserted}, "
+                f"дубликатов {result.skipped}, ошибочных {invalid}, {result.rows_per_sec:.0f} строк/с")
+    return result
+
+
+def _export_chunk(db, chunk: list, writer, file):
+    tags = db.get_subscriber_tags([sub.id for sub in chunk])
+    for sub in chunk:
+        record = {"telegram_chat_id": sub.telegram_chat_id,
+                  "joined_at": sub.joined_at.isoformat() if sub.joined_at else "",
+                  "language_code": sub.language_code or "", "source": sub.source or "",
+                  "tags": ";".join(tags.get(sub.id, []))}
+        if writer:
+            writer.writerow(record.values())
+        else:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def export_subscribers(db, user_id: int, path: str, fmt: Optional[str] = None) -> TransferResult:
+    fmt = detect_format(path, fmt)
+    rows = 0
+    chunk = []
+    started = time.perf_counter()
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file) if fmt == "csv" else None
+        if writer:
+            writer.writerow(EXPORT_FIELDS)
+        for sub in db.iter_subscribers(user_id, BATCH_SIZE):
+            chunk.append(sub)
+            if len(chunk) >= BATCH_SIZE:
+                _export_chunk(db, chunk, writer, file)
+                rows += len(chunk)
+                chunk.clear()
+        _export_chunk(db, chunk, writer, file)
+        rows += len(chunk)
+    elapsed = time.perf_counter() - started
+    result = TransferResult(rows, 0, 0, 0, elapsed)
+    logger.info(f"Экспорт подписчиков user_id={user_id}: {rows} строк, {result.rows_per_sec:.0f} строк/с")
+    return result
+
+
+# Запуск: python -m utils.subscribers_io import|export --user-id N file.csv|file.jsonl
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт и экспорт подписчиков бота (CSV/JSONL)")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from utils.database import Database
+    db = Database()
+    if args.action == "import":
+        result = import_subscribers(db, args.user_id, args.path, args.format, args.batch_size,
+                                    on_progress=lambda rows, new: print(f"... {rows} строк, новых {new}"))
+    else:
+        result = export_subscribers(db, args.user_id, args.path, args.format)
+    print(f"{args.action}: строк {result.rows}, новых {result.inserted}, дубликатов {result.skipped}, "
+          f"ошибочных {result.invalid}, {result.elapsed:.2f} с, {result.rows_per_sec:.0f} строк/с")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
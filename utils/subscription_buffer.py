@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Optional
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Сброс накопленных подписок/отписок в БД: раз в SUBSCRIPTION_FLUSH_MS или при SUBSCRIPTION_FLUSH_EVENTS событиях
+FLUSH_INTERVAL = int(os.getenv("SUBSCRIPTION_FLUSH_MS", "500")) / 1000
+FLUSH_EVENTS = int(os.getenv("SUBSCRIPTION_FLUSH_EVENTS", "1000"))
+JOURNAL_DIR = Path(os.getenv("SUBSCRIPTION_JOURNAL_DIR", "journal"))
+
+SUBSCRIBE, UNSUBSCRIBE = "sub", "unsub"
+
+
+# Отложенная запись подписок бота (write-behind).
+# Событие сначала дописывается в локальный журнал (flush + fsync), потом попадает в память, где
+# события одного чата схлопываются до последнего. Фоновый поток пачкой пишет их в БД: INSERT IGNORE
+# для подписок и один DELETE ... IN для отписок. Перед сбросом журнал переименовывается в *.flushing
+# и удаляется только после успешного commit, поэтому после падения процесса события из обоих файлов
+# проигрываются заново при следующем запуске (повтор безопасен — операции идемпотентны)
+class SubscriptionBuffer:
+    def __init__(self, db, user_id: int, journal_dir: Path = JOURNAL_DIR,
+                 flush_interval: float = FLUSH_INTERVAL, flush_events: int = FLUSH_EVENTS, fsync: bool = True):
+        self.db = db
+        self.user_id = user_id
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.fsync = fsync
+        self.journal_path = Path(journal_dir) / f"subscriptions_{user_id}.log"
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self._flushing_path = self.journal_path.with_suffix(".flushing")
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        # chat_id -> (действие, время события, язык, источник deep-link)
+        self._pending: dict[str, tuple] = {}
+        self._events = 0
+        self._journal = None
+
+        self._recover()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"subscriptions-{user_id}")
+        self._thread.start()
+
+    # Проигрывание журналов, оставшихся от прошлого запуска
+    def _recover(self):
+        recovered = 0
+        for path in (self._flushing_path, self.journal_path):
+            if not path.exists():
+                continue
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                        self._pending[str(record["c"])] = (record["a"], datetime.fromisoformat(record["t"]),
+                                                           record.get("l"), record.get("s"))
+                        recovered += 1
+                    except (ValueError, KeyError):
+                        # Недописанная последняя строка при падении
+                        continue
+        if not recovered:
+            return
+        logger.info(f"Восстановлено событий подписки из журнала: {recovered}")
+        # Всё восстановленное собираем в один файл *.flushing до успешной записи в БД
+        self._write_journal(self._flushing_path.with_suffix(".recovered"), self._pending)
+        os.replace(self._flushing_path.with_suffix(".recovered"), self._flushing_path)
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+        self._events = len(self._pending)
+
+    def _write_journal(self, path: Path, pending: dict):
+        with open(path, "w", encoding="utf-8") as file:
+            for chat_id, event in pending.items():
+                file.write(self._journal_line(chat_id, *event))
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def _journal_line(chat_id: str, action: str, at: datetime, language_code=None, source=None) -> str:
+        record = {"a": action, "c": chat_id, "t": at.isoformat()}
+        if language_code:
+            record["l"] = language_code
+        if source:
+            record["s"] = source
+        return json.dumps(record) + "\n"
+
+    def subscribe(self, chat_id: str, language_code: Optional[str] = None, source: Optional[str] = None):
+        self._add(SUBSCRIBE, str(chat_id), language_code, source)
+
+    def unsubscribe(self, chat_id: str):
+        self._add(UNSUBSCRIBE, str(chat_id))
+
+    def _add(self, action: str, chat_id: str, language_code: Optional[str] = None, source: Optional[str] = None):
+        event = (action, datetime.utcnow(), language_code, source)
+        line = self._journal_line(chat_id, *event)
+        with self._lock:
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._pending[chat_id] = event
+            self._events += 1
+            full = self._events >= self.flush_events
+        if full:
+            self._wakeup.set()
+
+    # Состояние подписки с учётом ещё не записанных событий: True/False или None — смотреть в БД
+    def pending_state(self, chat_id: str) -> Optional[bool]:
+        with self._lock:
+            event = self._pending.get(str(chat_id))
+        return None if event is None else event[0] == SUBSCRIBE
+
+    def is_subscribed(self, chat_id: str) -> bool:
+        state = self.pending_state(chat_id)
+        return self.db.is_subscriber(self.user_id, str(chat_id)) if state is None else state
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    # Запись накопленного в БД. Новые события во время записи идут в свежий журнал
+    def flush(self) -> bool:
+        with self._flush_lock:
+            if not self._flushing_path.exists():
+                with self._lock:
+                    if not self._pending:
+                        return True
+                    self._journal.close()
+                    os.replace(self.journal_path, self._flushing_path)
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+            with self._lock:
+                batch, self._pending, self._events = self._pending, {}, 0
+            subscribed = [{"user_id": self.user_id, "telegram_chat_id": chat_id, "joined_at": at,
+                           "language_code": language_code, "source": source}
+                          for chat_id, (action, at, language_code, source) in batch.items() if action == SUBSCRIBE]
+            unsubscribed = [chat_id for chat_id, event in batch.items() if event[0] == UNSUBSCRIBE]
+            try:
+                started = time.perf_counter()
+                self.db.apply_subscription_changes(self.user_id, subscribed, unsubscribed)
+            except Exception as e:
+                logger.error(f"Не удалось записать подписки ({len(batch)}), повтор при следующем сбросе: {e}")
+                with self._lock:
+                    # Более новые события за время записи важнее
+                    for chat_id, event in batch.items():
+                        self._pending.setdefault(chat_id, event)
+                    self._events = len(self._pending)
+                return False
+            self._flushing_path.unlink(missing_ok=True)
+            logger.debug(f"Подписки записаны: +{len(subscribed)} / -{len(unsubscribed)} "
+                         f"за {(time.perf_counter() - started) * 1000:.0f} мс")
+            return True
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        with self._lock:
+            self._journal.close()
@@ -2,14 +2,25 @@ import subprocess
 import os
 import sys
 import threading
+from utils.metrics import BOT_PROCESSES
 
 _active_bots = {}
+# Ботов запускает и перезапускает супервизор в python -m worker (utils/scheduler.py, HEADLESS_WORKER)
+HEADLESS_WORKER = os.getenv("HEADLESS_WORKER", "").lower() in ("1", "true", "yes")
+BOT_PROCESSES.set_function(lambda: sum(1 for proc in list(_active_bots.values()) if proc.poll() is None))
 
 def is_bot_running(token: str) -> bool:
     return token in _active_bots
 
 
 def start_bot_for_user(token: str, user_id: int) -> bool:
+    if HEADLESS_WORKER:
+        print(f"[TG Bot] Бот user_id={user_id} запустит worker.")
+        return False
+    return _start_bot(token, user_id)
+
+
+def _start_bot(token: str, user_id: int) -> bool:
     if not token or is_bot_running(token):
         print(f"[TG Bot] Бот уже запущен или токен пуст.")
         return False
@@ -20,7 +31,8 @@ def start_bot_for_user(token: str, user_id: int) -> bool:
         proc = subprocess.Popen(
             [sys.executable, bot_runner_path, token, str(user_id)],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            # Один поток вывода: иначе непрочитанный stderr заполняет буфер канала и бот зависает
+            stderr=subprocess.STDOUT,
             text=True
         )
 
@@ -32,8 +44,6 @@ def start_bot_for_user(token: str, user_id: int) -> bool:
             try:
                 for line in proc.stdout:
                     print(f"[STDOUT]: {line.strip()}")
-                for line in proc.stderr:
-                    print(f"[STDERR]: {line.strip()}")
             except Exception as e:
                 print(f"[TG Bot] Ошибка чтения вывода: {e}")
 
@@ -71,4 +81,18 @@ def stop_all_bots():
     tokens = list(_active_bots.keys())
     for token in tokens:
         stop_bot_by_token(token)
-    print("[TG Bot] Все боты остановлены.")
\ No newline at end of file
+    print("[TG Bot] Все боты остановлены.")
+
+
+# Сверка запущенных ботов с БД: запуск новых, перезапуск упавших, остановка ботов со снятым токеном
+def supervise_bots(users) -> None:
+    wanted = {token: user_id for user_id, token in users}
+    for token in list(_active_bots.keys()):
+        if token not in wanted:
+            stop_bot_by_token(token)
+        elif _active_bots[token].poll() is not None:
+            print(f"[TG Bot] Бот user_id={wanted[token]} завершился с кодом {_active_bots[token].returncode}, перезапуск")
+            _active_bots.pop(token, None)
+    for token, user_id in wanted.items():
+        if not is_bot_running(token):
+            _start_bot(token, user_id)
@@ -0,0 +1,49 @@
+import os
+from functools import lru_cache
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Время в БД хранится в UTC (naive datetime, как dt.utcnow()); в часовой пояс пользователя
+# переводится только на границе — при вводе в форме и при показе в интерфейсе.
+# Пояс пользователей, у которых он не выбран (и прежний пояс планировщика)
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+
+
+@lru_cache(maxsize=256)
+def get_zone(name: str | None) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+# Короткий список для выбора в профиле; любой другой пояс IANA вводится вручную
+COMMON_TIMEZONES = (
+    "Europe/Kaliningrad", "Europe/Moscow", "Europe/Samara", "Asia/Yekaterinburg", "Asia/Omsk",
+    "Asia/Novosibirsk", "Asia/Krasnoyarsk", "Asia/Irkutsk", "Asia/Yakutsk", "Asia/Vladivostok",
+    "Asia/Magadan", "Asia/Kamchatka", "Europe/Minsk", "Europe/Kyiv", "Asia/Almaty", "Asia/Tashkent",
+    "Asia/Tbilisi", "Asia/Yerevan", "Europe/Istanbul", "Europe/Berlin", "Europe/London",
+    "America/New_York", "UTC",
+)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Местное время пользователя -> UTC (fold=0): неоднозначное время при переводе часов назад
+# берётся первым, несуществующее при переводе вперёд (02:30 в ночь перевода) сдвигается вперёд на час
+def to_utc(local: datetime, tz_name: str | None) -> datetime:
+    return local.replace(tzinfo=get_zone(tz_name), fold=0).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def from_utc(utc: datetime, tz_name: str | None) -> datetime:
+    return utc.replace(tzinfo=timezone.utc).astimezone(get_zone(tz_name)).replace(tzinfo=None)
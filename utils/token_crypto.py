@@ -0,0 +1,83 @@
+import os
+import hashlib
+import logging
+from dotenv import load_dotenv
+from sqlalchemy.types import TypeDecorator, String
+
+try:
+    from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+except ImportError:
+    Fernet = MultiFernet = None
+    InvalidToken = ValueError
+
+load_dotenv()
+
+# Логирование
+logger = logging.getLogger(__name__)
+
+# Ключи Fernet через запятую: первым шифруются новые значения, остальные только расшифровывают
+# (смена ключа без простоя). Сгенерировать: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+# Без ключа токены хранятся как раньше, открытым текстом
+TOKEN_ENCRYPTION_KEYS = [key.strip() for key in os.getenv("TOKEN_ENCRYPTION_KEY", "").split(",") if key.strip()]
+# Все шифротексты Fernet начинаются с версии 0x80 — в base64 это "gAAAAA"
+FERNET_PREFIX = "gAAAAA"
+
+_cipher = None
+
+
+def _get_cipher():
+    global _cipher
+    if _cipher is None and TOKEN_ENCRYPTION_KEYS:
+        if MultiFernet is None:
+            raise RuntimeError("TOKEN_ENCRYPTION_KEY задан, но пакет cryptography не установлен")
+        _cipher = MultiFernet([Fernet(key.encode()) for key in TOKEN_ENCRYPTION_KEYS])
+    return _cipher
+
+
+def encryption_enabled() -> bool:
+    return bool(TOKEN_ENCRYPTION_KEYS)
+
+
+def is_encrypted(value: str | None) -> bool:
+    return bool(value) and value.startswith(FERNET_PREFIX)
+
+
+# Отпечаток токена для поиска владельца по индексу: шифротекст Fernet каждый раз разный,
+# по нему WHERE не построить. Токен бота — длинный случайный секрет, соль ему не нужна
+def token_fingerprint(token: str | None) -> str | None:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest() if token else None
+
+
+def encrypt_token(token: str | None) -> str | None:
+    cipher = _get_cipher()
+    if not token or cipher is None or is_encrypted(token):
+        return token
+    return cipher.encrypt(token.encode("utf-8")).decode("ascii")
+
+
+# Значения, записанные до включения шифрования, возвращаются как есть
+def decrypt_token(value: str | None) -> str | None:
+    if not is_encrypted(value):
+        return value
+    cipher = _get_cipher()
+    if cipher is None:
+        logger.error("Токен в БД зашифрован, но TOKEN_ENCRYPTION_KEY не задан")
+        return None
+    try:
+        return cipher.decrypt(value.encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        logger.error("Не удалось расшифровать токен: ключ TOKEN_ENCRYPTION_KEY не подходит")
+        return None
+
+
+# Колонка с токеном: в БД шифротекст, в коде — исходный токен. Пустая строка не шифруется,
+# чтобы работали условия вида token != ''
+class EncryptedToken(TypeDecorator):
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encrypt_token(value)
+
+    def process_result_value(self, value, dialect):
+        return decrypt_token(value)
@@ -0,0 +1,69 @@
+import threading
+from utils.database import Database
+
+SESSION_KEY = "user_cache"
+
+
+# Кэш профилей пользователей и их дополнительных каналов в рамках сессии Flet.
+# Сбрасывается Database при любой записи в admin_users (_update_user / _update_user_by_email)
+# и в channels (add_channel / delete_channel).
+class UserCache:
+    def __init__(self, db: Database):
+        self.db = db
+        self.hits = 0
+        self.misses = 0
+        self._users: dict[int, dict] = {}
+        self._channels: dict[int, list] = {}
+        self._lock = threading.Lock()
+        Database.register_user_cache(self)
+
+    def get(self, user_id: int, force: bool = False) -> dict:
+        with self._lock:
+            if not force and user_id in self._users:
+                self.hits += 1
+                return dict(self._users[user_id])
+            self.misses += 1
+        row = self.db.get_user_by_id(user_id)
+        user = dict(row._mapping) if row else {}
+        if user:
+            self.put(user)
+        return dict(user)
+
+    def put(self, user):
+        user = dict(getattr(user, "_mapping", user))
+        with self._lock:
+            self._users[user["id"]] = user
+
+    def invalidate(self, user_id: int | None = None, email: str | None = None):
+        with self._lock:
+            if user_id is None and email is None:
+                self._users.clear()
+                return
+            for uid, user in list(self._users.items()):
+                if uid == user_id or (email is not None and user.get("email") == email):
+                    del self._users[uid]
+
+    def get_channels(self, user_id: int) -> list:
+        with self._lock:
+            channels = self._channels.get(user_id)
+        if channels is None:
+            channels = list(self.db.get_channels(user_id))
+            with self._lock:
+                self._channels[user_id] = channels
+        return list(channels)
+
+    def invalidate_channels(self, user_id: int):
+        with self._lock:
+            self._channels.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._users)}
+
+
+def get_user_cache(page, db: Database) -> UserCache:
+    cache = page.session.get(SESSION_KEY)
+    if cache is None:
+        cache = UserCache(db)
+        page.session.set(SESSION_KEY, cache)
+    return cache
@@ -0,0 +1,63 @@
+# Фоновый процесс без окна Flet: планировщик постов, рассылки и супервизор ботов.
+# Запуск: python -m worker. Окно приложения с HEADLESS_WORKER=1 только ставит задачи в БД
+import os
+import signal
+import logging
+import threading
+from utils.database import Database
+from utils.metrics import start_metrics_server
+from utils.leases import WORKER_ID, LEASE_SECONDS
+from utils.token_crypto import token_fingerprint
+from utils.scheduler import get_scheduler, start_background_jobs, drain
+from utils.telegram_bot_manager import supervise_bots, stop_all_bots
+
+# Как часто сверять запущенных ботов с БД (сек) и сколько ждать завершения задач при остановке
+BOT_SUPERVISE_SECONDS = int(os.getenv("BOT_SUPERVISE_SECONDS", "30"))
+WORKER_DRAIN_SECONDS = int(os.getenv("WORKER_DRAIN_SECONDS", "30"))
+# Аренда бота переживает несколько пропущенных сверок, прежде чем бота заберёт другой экземпляр
+BOT_LEASE_SECONDS = max(LEASE_SECONDS, 3 * BOT_SUPERVISE_SECONDS)
+
+logger = logging.getLogger("worker")
+
+
+# Боты, аренду которых держит этот экземпляр: остальные опрашивает другой worker
+def _leased_bots(db: Database) -> list:
+    users = db.get_users_with_bot_token()
+    held = db.acquire_bot_leases(list({token_fingerprint(token) for _, token in users}), WORKER_ID, BOT_LEASE_SECONDS)
+    if held is None:
+        raise RuntimeError("аренда ботов недоступна")
+    return [(user_id, token) for user_id, token in users if token_fingerprint(token) in held]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stopping = threading.Event()
+
+    def on_signal(signum, frame):
+        logger.info(f"Получен сигнал {signal.Signals(signum).name}, остановка")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    db = Database()
+    start_metrics_server()
+    start_background_jobs(get_scheduler())
+    logger.info(f"Worker {WORKER_ID} запущен")
+
+    while not stopping.is_set():
+        try:
+            supervise_bots(_leased_bots(db))
+        except Exception as e:
+            logger.error(f"Ошибка супервизора ботов: {e}")
+        stopping.wait(BOT_SUPERVISE_SECONDS)
+
+    if not drain(WORKER_DRAIN_SECONDS):
+        logger.warning(f"Задачи не завершились за {WORKER_DRAIN_SECONDS} с, аренды истекут сами")
+    stop_all_bots()
+    db.release_bot_leases(WORKER_ID)
+    logger.info("Worker остановлен")
+
+
+if __name__ == "__main__":
+    main()